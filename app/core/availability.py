@@ -0,0 +1,181 @@
+"""
+Индекс свободных мест
+Комнаты со свободными местами разложены в памяти по корзинам
+(пол проживающих, число свободных мест) -> (корпус, этаж) -> позиции комнат
+в естественном порядке. Подбор комнат для студента - слияние нескольких
+отсортированных списков без запросов к БД. Заселение и выселение
+перекладывают одну комнату. Индекс помечен счетчиками изменений таблиц в БД:
+любая другая запись (в том числе другого рабочего места) перестраивает его
+при следующем обращении
+"""
+import bisect
+import heapq
+import itertools
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from app.core import query_cache
+
+# Таблицы, по счетчикам которых проверяется индекс; свои заселения и выселения
+# учитываются по одной комнате (room_changed)
+AVAILABILITY_TABLES = ('rooms', 'buildings', 'students', 'checkins', 'checkouts')
+
+ROOM_SQL = '''
+    SELECT r.id, r.building_id, r.floor, r.room_number, r.capacity,
+           b.building_number, b.address,
+           COALESCE(o.occupancy, 0) AS occupancy,
+           COALESCE(o.male, 0) AS male, COALESCE(o.female, 0) AS female
+    FROM rooms r
+    JOIN buildings b ON r.building_id = b.id
+    LEFT JOIN room_occupancy o ON o.room_id = r.id
+'''
+ROOM_ORDER = 'ORDER BY b.number_key, b.id, r.floor, r.number_key, r.id'
+
+Slot = Tuple[Optional[str], int]
+Place = Tuple[int, int]
+
+
+def slot_of(room) -> Optional[Slot]:
+    """Корзина комнаты: (пол проживающих или None - пустая, свободные места); None - мест нет"""
+    free = room.capacity - room.occupancy
+    if free <= 0 or (room.male and room.female):
+        return None
+    if room.male:
+        return 'М', free
+    if room.female:
+        return 'Ж', free
+    return None, free
+
+
+class AvailabilityIndex:
+    """Комнаты со свободными местами по полу, числу мест, корпусу и этажу"""
+    
+    def __init__(self, rooms: List[Any], stamp: Tuple[int, ...]):
+        self.stamp = stamp
+        # Позиция в естественном порядке -> запись комнаты
+        self._rooms = list(rooms)
+        self._ranks = {room.id: rank for rank, room in enumerate(self._rooms)}
+        self._slots: Dict[Slot, Dict[Place, List[int]]] = {}
+        self._lock = threading.Lock()
+        for rank, room in enumerate(self._rooms):
+            self._insert(rank, room)
+    
+    def __len__(self) -> int:
+        """Число комнат со свободными местами"""
+        with self._lock:
+            return sum(len(ranks) for places in self._slots.values() for ranks in places.values())
+    
+    def _insert(self, rank: int, room):
+        slot = slot_of(room)
+        if slot is not None:
+            ranks = self._slots.setdefault(slot, {}).setdefault((room.building_id, room.floor), [])
+            bisect.insort(ranks, rank)
+    
+    def _remove(self, rank: int, room):
+        slot = slot_of(room)
+        if slot is None:
+            return
+        places = self._slots[slot]
+        place = (room.building_id, room.floor)
+        ranks = places[place]
+        del ranks[bisect.bisect_left(ranks, rank)]
+        if not ranks:
+            del places[place]
+            if not places:
+                del self._slots[slot]
+    
+    def update(self, room) -> bool:
+        """Переложить комнату по новым счетчикам; False - комнаты нет в индексе"""
+        with self._lock:
+            rank = self._ranks.get(room.id)
+            if rank is None:
+                return False
+            self._remove(rank, self._rooms[rank])
+            self._rooms[rank] = room
+            self._insert(rank, room)
+            return True
+    
+    def suggest(self, gender: str, building_id: Optional[int] = None, floor: Optional[int] = None,
+                limit: Optional[int] = None) -> List[Any]:
+        """Комнаты, куда можно заселить студента пола gender, лучшие первыми
+        
+        Сначала комнаты, где уже живут студенты того же пола, по возрастанию свободных мест
+        (комнаты дозаполняются), затем пустые комнаты от меньших к большим; внутри корзины -
+        естественный порядок корпусов, этажей и номеров
+        """
+        if floor is not None and building_id is None:
+            raise ValueError("Этаж задается вместе с корпусом")
+        with self._lock:
+            order = sorted(
+                (slot for slot in self._slots if slot[0] in (gender, None)),
+                key=lambda slot: (slot[0] is None, slot[1])
+            )
+            ranks = itertools.chain.from_iterable(
+                self._ranks_in(slot, building_id, floor) for slot in order
+            )
+            return [self._rooms[rank] for rank in itertools.islice(ranks, limit)]
+    
+    def _ranks_in(self, slot: Slot, building_id: Optional[int], floor: Optional[int]) -> Iterator[int]:
+        places = self._slots.get(slot, {})
+        if floor is not None:
+            return iter(places.get((building_id, floor), ()))
+        lists = [ranks for (building, _), ranks in places.items()
+                 if building_id is None or building == building_id]
+        return heapq.merge(*lists)
+
+
+_indexes: Dict[str, AvailabilityIndex] = {}
+_build_lock = threading.Lock()
+
+
+def _stamp(db) -> Tuple[int, ...]:
+    return query_cache.db_versions(db, AVAILABILITY_TABLES)
+
+
+def build(db) -> AvailabilityIndex:
+    """Построить индекс одним запросом"""
+    stamp = _stamp(db)
+    conn = db.get_connection()
+    try:
+        rooms = conn.execute(f'{ROOM_SQL} {ROOM_ORDER}').fetchall()
+    finally:
+        conn.close()
+    return AvailabilityIndex(rooms, stamp)
+
+
+def get(db) -> AvailabilityIndex:
+    """Актуальный индекс файла БД (строится при первом обращении и после чужих записей)"""
+    index = _indexes.get(db.db_name)
+    if index is not None and index.stamp == _stamp(db):
+        return index
+    with _build_lock:
+        index = _indexes.get(db.db_name)
+        if index is None or index.stamp != _stamp(db):
+            index = _indexes[db.db_name] = build(db)
+    return index
+
+
+def room_changed(db, room_id: int, change: query_cache.Change):
+    """Перечитать счетчики комнаты после своего заселения или выселения
+
+    change - счетчики изменений до и после записи (Database.write_counted); если до записи
+    индекс уже устарел, он отбрасывается и строится заново при следующем обращении
+    """
+    # Под блокировкой построения: индекс, строящийся сейчас, не пропустит изменение,
+    # а более раннее чтение счетчиков не перезапишет более позднее
+    with _build_lock:
+        index = _indexes.get(db.db_name)
+        if index is None:
+            return
+        stamp = query_cache.advance(db, index.stamp, AVAILABILITY_TABLES, change)
+        if stamp is None:
+            _indexes.pop(db.db_name, None)
+            return
+        conn = db.get_connection()
+        try:
+            room = conn.execute(f'{ROOM_SQL} WHERE r.id = ?', (room_id,)).fetchone()
+        finally:
+            conn.close()
+        if room is None or not index.update(room):
+            _indexes.pop(db.db_name, None)
+            return
+        index.stamp = stamp
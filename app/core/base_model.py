@@ -2,14 +2,24 @@
 Базовый класс для всех моделей
 Реализует общую логику CRUD операций
 """
-from typing import Optional, List, Tuple, Any
+from typing import Optional, List, Tuple, Any, Iterator, Iterable, Dict, Union
 from contextlib import contextmanager
 from app.database import Database
 from app.utils.logger import setup_logger
 from app.utils.exceptions import DatabaseException
+from app.core.pagination import Ordering, Page, PAGE_SIZE, fetch_page
+from app.core.streaming import BATCH_SIZE, iter_query
+from app.core import identity_map
+from app.core.query_builder import OrderBy, QueryBuilder, builder_for
 
 logger = setup_logger('base_model')
 
+# Форма условия WHERE id = ?
+_BY_ID = (('id', False),)
+
+# Условие count()/exists(): {колонка: значение} или текст WHERE (прежняя форма)
+Condition = Union[Dict[str, Any], str, None]
+
 
 @contextmanager
 def db_connection(db: Database):
@@ -32,8 +42,11 @@ def db_connection(db: Database):
 class BaseModel:
     """Базовый класс для всех моделей"""
     
-    def __init__(self, table_name: str):
-        self.db = Database()
+    # Порядки постраничной выборки; наследники добавляют свои
+    PAGE_ORDERS = {'id': Ordering(('id',))}
+    
+    def __init__(self, table_name: str, db: Optional[Database] = None):
+        self.db = db or Database()
         self.table_name = table_name
         self.logger = setup_logger(f'model_{table_name}')
     
@@ -70,36 +83,80 @@ class BaseModel:
             else:
                 return cursor.lastrowid
     
+    @property
+    def query(self) -> QueryBuilder:
+        """Построитель запросов таблицы (колонки проверяются по схеме)"""
+        return builder_for(self.db, self.table_name)
+    
     def get_by_id(self, record_id: int) -> Optional[Tuple]:
         """Получить запись по ID"""
-        query = f'SELECT * FROM {self.table_name} WHERE id = ?'
-        return self.execute_query(query, (record_id,), fetch_one=True, fetch_all=False)
+        query = self.query.select(where=_BY_ID)
+        return identity_map.get_one(
+            self.table_name, record_id,
+            lambda key: self.execute_query(query, (key,), fetch_one=True, fetch_all=False)
+        )
     
-    def get_all(self, order_by: Optional[str] = None) -> List[Tuple]:
-        """Получить все записи"""
-        query = f'SELECT * FROM {self.table_name}'
-        if order_by:
-            query += f' ORDER BY {order_by}'
-        return self.execute_query(query)
+    def get_many(self, ids: Iterable[int]) -> Dict[int, Tuple]:
+        """Получить записи по списку ID: {id: запись}"""
+        query = f'SELECT * FROM {self.table_name} WHERE id IN ({{ids}})'
+        return identity_map.get_many(
+            self.table_name, ids, lambda missing: identity_map.fetch_many(self.db, query, missing)
+        )
     
-    def count(self, where_clause: Optional[str] = None, params: Optional[Tuple] = None) -> int:
-        """Подсчитать количество записей"""
-        query = f'SELECT COUNT(*) FROM {self.table_name}'
-        if where_clause:
-            query += f' WHERE {where_clause}'
-        
+    def get_all(self, order_by: OrderBy = None, filters: Optional[Dict[str, Any]] = None) -> List[Tuple]:
+        """Получить все записи (order_by: 'surname, -name'; filters: {колонка: значение})"""
+        where, params = self.query.where_shape(filters)
+        query = self.query.select(where, self.query.order_terms(order_by))
+        return self.execute_query(query, params)
+    
+    def iter_all(self, order_by: OrderBy = None, batch_size: int = BATCH_SIZE) -> Iterator[Tuple]:
+        """Все записи пачками из открытого курсора"""
+        query = self.query.select(order=self.query.order_terms(order_by))
+        return iter_query(self.db, query, batch_size=batch_size)
+    
+    def page(self, after_key: Optional[str] = None, limit: int = PAGE_SIZE, order: str = 'id') -> Page:
+        """Страница записей после токена after_key"""
+        conn = self.db.get_connection()
+        try:
+            return fetch_page(conn, '*', self.table_name, self.PAGE_ORDERS, order, after_key, limit)
+        finally:
+            conn.close()
+    
+    def count(self, filters: Condition = None, params: Optional[Tuple] = None) -> int:
+        """Подсчитать количество записей, где колонки равны значениям filters
+
+        Как и раньше, можно передать текст условия WHERE и его параметры: count('floor > ?', (2,))
+        """
+        query, params = self._condition_query(self.query.count, 'SELECT COUNT(*) FROM {table}{where}',
+                                              filters, params)
         result = self.execute_query(query, params, fetch_one=True, fetch_all=False)
         return result[0] if result else 0
     
-    def exists(self, where_clause: str, params: Tuple) -> bool:
-        """Проверить существование записи"""
-        return self.count(where_clause, params) > 0
+    def exists(self, filters: Condition, params: Optional[Tuple] = None) -> bool:
+        """Проверить существование записи (filters - как в count())"""
+        query, params = self._condition_query(self.query.exists,
+                                              'SELECT EXISTS (SELECT 1 FROM {table}{where})',
+                                              filters, params)
+        result = self.execute_query(query, params, fetch_one=True, fetch_all=False)
+        return bool(result and result[0])
+    
+    def _condition_query(self, build, template: str, filters: Condition,
+                         params: Optional[Tuple]) -> Tuple[str, Tuple]:
+        """Запрос и параметры для условия {колонка: значение} или текста WHERE с params"""
+        if isinstance(filters, str):
+            # Прежняя форма (where_clause, params): текст условия задает вызывающий код
+            where = f' WHERE {filters}' if filters.strip() else ''
+            return template.format(table=self.table_name, where=where), tuple(params or ())
+        if params is not None:
+            raise ValueError("Параметры передаются только вместе с текстом условия WHERE")
+        shape, values = self.query.where_shape(filters)
+        return build(shape), values
     
     def delete_by_id(self, record_id: int) -> bool:
         """Удалить запись по ID"""
-        query = f'DELETE FROM {self.table_name} WHERE id = ?'
+        query = self.query.delete(_BY_ID)
         try:
-            self.execute_query(query, (record_id,), fetch_one=False, fetch_all=False)
+            self.db.execute_write(query, (record_id,))
             self.logger.info(f"Удалена запись ID: {record_id} из {self.table_name}")
             return True
         except Exception as e:
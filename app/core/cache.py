@@ -1,77 +1,241 @@
 """
-Простой кэш для часто используемых данных
+Кэш часто используемых данных
+Ограничен числом записей и оценкой занимаемой памяти, вытесняет давно не читанные
+записи (LRU), у каждой записи свое время жизни. Потокобезопасен: одновременные промахи
+по одному ключу вычисляют значение один раз (get_or_load), остальные потоки ждут его
 """
-from typing import Any, Optional, Dict
-from datetime import datetime, timedelta
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
 from app.utils.logger import setup_logger
 
 logger = setup_logger('cache')
 
+MAX_ENTRIES = 1024
+MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_TTL = 300
+
+# Глубина обхода вложенных списков, кортежей и словарей при оценке размера
+_SIZE_DEPTH = 4
+# Элементов большой коллекции, по которым оценивается ее размер (строки списка однотипны)
+_SIZE_SAMPLE = 32
+_MISSING = object()
+
+
+def _sample_size(items, count: int, measure: Callable[[Any], int]) -> int:
+    """Размер count элементов по первым _SIZE_SAMPLE из них"""
+    total = seen = 0
+    for item in items:
+        total += measure(item)
+        seen += 1
+        if seen == _SIZE_SAMPLE:
+            break
+    return total * count // seen if seen else 0
+
+
+def estimate_size(value: Any, depth: int = _SIZE_DEPTH) -> int:
+    """Примерный размер значения в байтах (с вложенными коллекциями)
+
+    Размер большой коллекции оценивается по первым _SIZE_SAMPLE элементам и их числу,
+    поэтому оценка списка записей не обходит каждое поле каждой строки
+    """
+    size = sys.getsizeof(value)
+    if depth <= 0 or isinstance(value, (str, bytes)):
+        return size
+    if isinstance(value, dict):
+        size += _sample_size(value.items(), len(value),
+                             lambda kv: estimate_size(kv[0], depth - 1) + estimate_size(kv[1], depth - 1))
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += _sample_size(value, len(value), lambda item: estimate_size(item, depth - 1))
+    return size
+
 
 class CacheItem:
-    """Элемент кэша с временем жизни"""
+    """Запись кэша: значение, момент истечения (None - бессрочно) и оценка размера"""
     
-    def __init__(self, value: Any, ttl: int = 300):
+    __slots__ = ('value', 'expires_at', 'size')
+    
+    def __init__(self, value: Any, expires_at: Optional[float], size: int):
         self.value = value
-        self.created_at = datetime.now()
-        self.ttl = timedelta(seconds=ttl)
+        self.expires_at = expires_at
+        self.size = size
     
-    def is_expired(self) -> bool:
-        """Проверить, истек ли срок действия"""
-        return datetime.now() - self.created_at > self.ttl
+    def is_expired(self, now: float) -> bool:
+        """Истек ли срок действия"""
+        return self.expires_at is not None and now >= self.expires_at
 
 
-class SimpleCache:
-    """Простой in-memory кэш"""
+class _Flight:
+    """Вычисление значения, которого ждут остальные потоки с тем же ключом"""
     
     def __init__(self):
-        self._cache: Dict[str, CacheItem] = {}
-        self.logger = setup_logger('cache')
-    
-    def get(self, key: str) -> Optional[Any]:
-        """Получить значение из кэша"""
-        if key in self._cache:
-            item = self._cache[key]
-            if not item.is_expired():
-                self.logger.debug(f"Cache hit: {key}")
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        # Ключ удален или кэш очищен во время вычисления - значение не сохраняется
+        self.stale = False
+    
+    def wait(self) -> Any:
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class LRUCache:
+    """Ограниченный потокобезопасный кэш с вытеснением LRU и временем жизни записей"""
+    
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES,
+                 default_ttl: Optional[float] = DEFAULT_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._clock = clock
+        self._items: 'OrderedDict[Hashable, CacheItem]' = OrderedDict()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.loads = 0
+        self.coalesced = 0
+    
+    def __len__(self) -> int:
+        return len(self._items)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            item = self._items.get(key)
+            return item is not None and not item.is_expired(self._clock())
+    
+    def _lookup(self, key: Hashable) -> Any:
+        """Значение или _MISSING; считает попадания и промахи (вызывается под блокировкой)"""
+        item = self._items.get(key)
+        if item is not None:
+            if not item.is_expired(self._clock()):
+                self._items.move_to_end(key)
+                self.hits += 1
                 return item.value
+            self._remove(key)
+            self.expirations += 1
+        self.misses += 1
+        return _MISSING
+    
+    def _remove(self, key: Hashable):
+        item = self._items.pop(key)
+        self.bytes -= item.size
+    
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float], size: int):
+        """Сохранить значение и вытеснить лишнее (вызывается под блокировкой)
+
+        Размер оценивается до блокировки: обход значения не задерживает остальных читателей
+        """
+        if key in self._items:
+            self._remove(key)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = self._clock() + ttl if ttl is not None else None
+        self._items[key] = CacheItem(value, expires_at, size)
+        self.bytes += size
+        while len(self._items) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self._items))
+            self._remove(oldest)
+            self.evictions += 1
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Значение из кэша или default"""
+        with self._lock:
+            value = self._lookup(key)
+        return default if value is _MISSING else value
+    
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, size: Optional[int] = None):
+        """Сохранить значение; ttl в секундах (None - время жизни кэша по умолчанию)"""
+        if size is None:
+            size = estimate_size(value)
+        with self._lock:
+            self._store(key, value, ttl, size)
+    
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Значение из кэша, при промахе - loader(); одновременные промахи по ключу ждут один вызов
+        
+        Ошибка loader передается всем ожидающим и не кэшируется
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not _MISSING:
+                return value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.loads += 1
             else:
-                # Удалить истекший элемент
-                del self._cache[key]
-                self.logger.debug(f"Cache expired: {key}")
+                self.coalesced += 1
+        if not leader:
+            return flight.wait()
         
-        self.logger.debug(f"Cache miss: {key}")
-        return None
-    
-    def set(self, key: str, value: Any, ttl: int = 300):
-        """Установить значение в кэш"""
-        self._cache[key] = CacheItem(value, ttl)
-        self.logger.debug(f"Cache set: {key}")
+        size = 0
+        try:
+            flight.value = loader()
+            size = estimate_size(flight.value)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if flight.error is None and not flight.stale:
+                    self._store(key, flight.value, ttl, size)
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.value
     
-    def delete(self, key: str):
-        """Удалить значение из кэша"""
-        if key in self._cache:
-            del self._cache[key]
-            self.logger.debug(f"Cache deleted: {key}")
+    def delete(self, key: Hashable):
+        """Удалить значение (вычисляемое сейчас значение не будет сохранено)"""
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+            if key in self._flights:
+                self._flights[key].stale = True
     
     def clear(self):
         """Очистить весь кэш"""
-        self._cache.clear()
-        self.logger.info("Cache cleared")
-    
-    def cleanup_expired(self):
-        """Очистить истекшие элементы"""
-        expired_keys = [
-            key for key, item in self._cache.items()
-            if item.is_expired()
-        ]
-        for key in expired_keys:
-            del self._cache[key]
-        
-        if expired_keys:
-            self.logger.debug(f"Cleaned up {len(expired_keys)} expired cache items")
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+            for flight in self._flights.values():
+                flight.stale = True
+        logger.info("Кэш очищен")
+    
+    def cleanup_expired(self) -> int:
+        """Удалить истекшие записи, вернуть их число"""
+        with self._lock:
+            now = self._clock()
+            expired = [key for key, item in self._items.items() if item.is_expired(now)]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+        return len(expired)
+    
+    def stats(self) -> Dict[str, int]:
+        """Счетчики кэша"""
+        with self._lock:
+            return {
+                'entries': len(self._items),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'loads': self.loads,
+                'coalesced': self.coalesced,
+            }
 
 
 # Глобальный экземпляр кэша
-cache = SimpleCache()
-
+cache = LRUCache()
@@ -0,0 +1,75 @@
+"""
+Даты как номера дней
+Даты хранятся в TEXT (ГГГГ-ММ-ДД) для отображения; рядом с ними вычисляемые колонки
+*_day - номер дня от 1970-01-01. По ним построены индексы, поэтому выборки за период -
+поиск по диапазону индекса, а продолжительность - разность целых чисел
+"""
+from datetime import date, datetime, timedelta
+from typing import List, Union
+
+DateLike = Union[date, datetime, str, int]
+
+EPOCH = date(1970, 1, 1)
+
+# julianday() полночи 1970-01-01; для некорректной строки выражение дает NULL
+_DAY_SQL = 'CAST(julianday({column}) - 2440587.5 AS INTEGER)'
+
+# Номер дня в ключах порядка для строк с некорректной датой (*_day IS NULL): раньше любой даты,
+# которую понимает julianday(), поэтому такие строки идут последними в порядке «новые первыми»
+NO_DAY = -10000000
+
+
+def day_sql(column: str) -> str:
+    """SQL-выражение номера дня для текстовой колонки даты"""
+    return _DAY_SQL.format(column=column)
+
+
+def day_key(day: str) -> str:
+    """Выражение ключа порядка для колонки номера дня: NULL заменяется на NO_DAY
+
+    Сравнение row value с NULL не истинно, поэтому строки без номера дня выпадали бы
+    из следующих страниц постраничной выборки
+    """
+    return f'COALESCE({day}, {NO_DAY})'
+
+
+def day_column(table: str, column: str, day: str) -> str:
+    """Добавить к таблице вычисляемую колонку номера дня"""
+    return f'ALTER TABLE {table} ADD COLUMN {day} INTEGER GENERATED ALWAYS AS ({day_sql(column)}) VIRTUAL'
+
+
+def to_day(value: DateLike) -> int:
+    """Номер дня для даты, datetime, строки ГГГГ-ММ-ДД или уже номера дня"""
+    return (parse_date(value) - EPOCH).days
+
+
+def from_day(day: int) -> date:
+    """Дата по номеру дня"""
+    return EPOCH + timedelta(days=day)
+
+
+def parse_date(value: DateLike) -> date:
+    """Дата из date, datetime, номера дня или строки ГГГГ-ММ-ДД (ValueError для остального)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, int) and not isinstance(value, bool):
+        return from_day(value)
+    try:
+        return date.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f"Некорректная дата: {value}")
+
+
+def to_text(value: DateLike) -> str:
+    """Дата в формате хранения ГГГГ-ММ-ДД"""
+    return parse_date(value).isoformat()
+
+
+def day_range(start: DateLike, end: DateLike) -> List[int]:
+    """Границы периода [start, end] как номера дней"""
+    first, last = to_day(start), to_day(end)
+    if first > last:
+        raise ValueError("Начало периода позже его конца")
+    return [first, last]
@@ -0,0 +1,113 @@
+"""
+Профили производительности SQLite
+Профиль выбирается переменной окружения или файлом конфигурации
+"""
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Optional
+from app.utils.logger import setup_logger
+
+logger = setup_logger('db_config')
+
+PROFILE_ENV = 'DORMITORY_DB_PROFILE'
+CONFIG_ENV = 'DORMITORY_CONFIG'
+CONFIG_FILE = Path(__file__).parent.parent.parent / 'dormitory.json'
+
+DEFAULT_PROFILE = 'desktop-safe'
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    # Одно рабочее место: журнал отката и полная синхронизация
+    'desktop-safe': {
+        'busy_timeout': 5000,
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -8000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+    },
+    # Несколько постов с общим файлом БД: читатели не блокируют писателя
+    'multi-desk-wal': {
+        'busy_timeout': 10000,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -32000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    },
+    # Массовая загрузка данных: без ожидания fsync, большой кэш
+    'bulk-import': {
+        'busy_timeout': 30000,
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -131072,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    },
+}
+
+_ALLOWED_VALUES = {
+    'journal_mode': {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'},
+    'synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA'},
+    'temp_store': {'DEFAULT', 'FILE', 'MEMORY'},
+}
+_INT_PRAGMAS = ('busy_timeout', 'cache_size', 'mmap_size')
+# Порядок важен: busy_timeout до смены журнала, чтобы дождаться чужих блокировок
+PRAGMA_ORDER = ('busy_timeout', 'journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store')
+
+
+def _normalize(pragmas: Dict[str, Any]) -> Dict[str, Any]:
+    """Проверить значения PRAGMA (они подставляются в SQL без параметров)"""
+    result = {}
+    for name, value in pragmas.items():
+        if name in _INT_PRAGMAS:
+            result[name] = int(value)
+        elif name in _ALLOWED_VALUES:
+            value = str(value).upper()
+            if value not in _ALLOWED_VALUES[name]:
+                raise ValueError(f"Недопустимое значение {name}: {value}")
+            result[name] = value
+        else:
+            raise ValueError(f"Неизвестный параметр профиля: {name}")
+    return result
+
+
+def load_config(path: Optional[Path] = None) -> Dict[str, Any]:
+    """Прочитать раздел database из файла конфигурации (если он есть)"""
+    path = Path(path or os.environ.get(CONFIG_ENV) or CONFIG_FILE)
+    if not path.exists():
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f).get('database', {})
+    except (OSError, ValueError) as e:
+        logger.error(f"Ошибка чтения конфигурации {path}: {e}")
+        return {}
+
+
+def resolve_profile(config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Итоговые настройки: профиль из окружения или конфигурации плюс переопределения"""
+    config = load_config() if config is None else config
+    name = os.environ.get(PROFILE_ENV) or config.get('profile') or DEFAULT_PROFILE
+    if name not in PROFILES:
+        logger.warning(f"Неизвестный профиль БД '{name}', используется '{DEFAULT_PROFILE}'")
+        name = DEFAULT_PROFILE
+    pragmas = dict(PROFILES[name])
+    try:
+        pragmas.update(_normalize(config.get('pragmas', {})))
+    except ValueError as e:
+        logger.error(f"Ошибка в настройках PRAGMA: {e}")
+    pragmas['name'] = name
+    return pragmas
+
+
+def apply_profile(conn: sqlite3.Connection, profile: Dict[str, Any]):
+    """Применить настройки профиля к новому соединению"""
+    for name in PRAGMA_ORDER:
+        if name not in profile:
+            continue
+        value = profile[name]
+        row = conn.execute(f'PRAGMA {name} = {value}').fetchone()
+        if name == 'journal_mode' and row and str(row[0]).upper() != value:
+            logger.warning(f"Не удалось включить journal_mode={value}, текущий режим: {row[0]}")
@@ -1,27 +1,333 @@
 """
 Менеджер для работы с базой данных
-Обеспечивает connection pooling и оптимизацию запросов
+Обеспечивает пул соединений и оптимизацию запросов
 """
+import atexit
+import os
+import re
 import sqlite3
+import threading
+import time
+import weakref
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from contextlib import contextmanager
-from typing import Optional
+from typing import Optional, Dict, Iterator, List, Tuple, Any
 from pathlib import Path
+from app.core import identity_map, query_cache
+from app.core.db_config import load_config, resolve_profile, apply_profile
+from app.core.query_log import QueryLog, log_path
+from app.core.records import record_factory
+from app.core.sql_functions import register_functions
+from app.core.streaming import BATCH_SIZE, iter_cursor
+from app.core.writer import WRITE_TIMEOUT, DatabaseWriter
 from app.utils.logger import setup_logger
 from app.utils.exceptions import DatabaseException
 
 logger = setup_logger('db_manager')
 
+# Запросов в кэше выражений соединения (у sqlite3 по умолчанию 128)
+STATEMENT_CACHE_SIZE = 256
+
+
+_DML = re.compile(r'\b(?:INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+
+def is_read_only(query: str) -> bool:
+    """Команда только читает БД (SELECT, EXPLAIN, чтение PRAGMA, WITH без изменения данных)"""
+    words = query.split(None, 1)
+    head = words[0].upper() if words else ''
+    if head in ('SELECT', 'EXPLAIN', 'VALUES'):
+        return True
+    if head == 'PRAGMA':
+        return '=' not in query
+    if head == 'WITH':
+        return _DML.search(query) is None
+    return False
+
+
+def _file_identity(db_name: str) -> Optional[Tuple[int, int]]:
+    """Идентификатор файла БД (устройство, inode) или None, если файла нет"""
+    try:
+        st = os.stat(db_name)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
+class PooledConnection(sqlite3.Connection):
+    """Соединение SQLite, которое при close() возвращается в пул"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool: Optional['ConnectionPool'] = None
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._in_use = False
+        self._checked_out_at = 0.0
+        self._released_at = 0.0
+    
+    def close(self):
+        """Вернуть соединение в пул (или закрыть, если пула нет)"""
+        pool = self._pool
+        if pool is not None:
+            pool.release(self)
+        else:
+            super().close()
+    
+    def discard(self):
+        """Физически закрыть соединение"""
+        self._pool = None
+        try:
+            sqlite3.Connection.close(self)
+        except sqlite3.Error:
+            pass
+
+
+class ConnectionPool:
+    """Пул соединений SQLite с повторным использованием в пределах потока"""
+    
+    def __init__(self, db_name: str, max_size: int = 8, timeout: float = 5.0,
+                 health_check_interval: float = 30.0, profile: Optional[Dict[str, Any]] = None,
+                 statement_cache_size: int = STATEMENT_CACHE_SIZE, query_log: Optional[QueryLog] = None):
+        self.db_name = db_name
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        # Размер кэша подготовленных выражений sqlite3 на соединение
+        self.statement_cache_size = statement_cache_size
+        self.query_log = query_log
+        self.profile = profile if profile is not None else resolve_profile({})
+        # Строки - записи с доступом по имени колонки (app.core.records)
+        self.row_factory = record_factory
+        self._cond = threading.Condition(threading.RLock())
+        self._idle: Dict[int, List[PooledConnection]] = {}  # поток -> свободные соединения
+        self._in_use: Dict[int, weakref.ref] = {}
+        self._size = 0
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,
+            'thread_hits': 0,
+            'steals': 0,
+            'created': 0,
+            'discarded': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'hold_time_total': 0.0,
+            'hold_time_max': 0.0,
+        }
+    
+    def _connect(self) -> PooledConnection:
+        """Открыть новое соединение"""
+        busy_timeout = self.profile.get('busy_timeout', self.timeout * 1000) / 1000
+        conn = sqlite3.connect(
+            self.db_name, timeout=busy_timeout,
+            check_same_thread=False, factory=PooledConnection,
+            cached_statements=self.statement_cache_size
+        )
+        try:
+            # ufold(), normalize_phone() и natural_key() нужны индексам и триггерам при любой записи
+            register_functions(conn)
+            apply_profile(conn, self.profile)
+            # Ограничения внешних ключей схемы (ON DELETE RESTRICT) проверяет сама SQLite
+            conn.execute('PRAGMA foreign_keys = ON')
+        except sqlite3.Error:
+            sqlite3.Connection.close(conn)
+            raise
+        conn.row_factory = self.row_factory
+        if self.query_log is not None:
+            conn.set_trace_callback(self.query_log.record)
+        conn._file_id = _file_identity(self.db_name)
+        return conn
+    
+    def _take_idle(self, thread_id: int) -> Tuple[Optional[PooledConnection], bool]:
+        """Взять свободное соединение: сначала своего потока, затем любого"""
+        own = self._idle.get(thread_id)
+        if own:
+            return own.pop(), True
+        for ident, conns in self._idle.items():
+            if conns:
+                return conns.pop(), False
+        return None, False
+    
+    def _drop_idle(self) -> List[PooledConnection]:
+        """Убрать все свободные соединения (под блокировкой)"""
+        dropped = [conn for conns in self._idle.values() for conn in conns]
+        self._idle.clear()
+        self._size -= len(dropped)
+        self._stats['discarded'] += len(dropped)
+        return dropped
+    
+    def _is_healthy(self, conn: PooledConnection) -> bool:
+        """Проверка соединения, которое долго простаивало"""
+        if time.monotonic() - conn._released_at < self.health_check_interval:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"Соединение не прошло проверку и будет закрыто: {e}")
+            return False
+    
+    def _forget(self, key: int):
+        """Соединение было удалено сборщиком мусора, не вернувшись в пул"""
+        with self._cond:
+            if self._in_use.pop(key, None) is not None:
+                self._size -= 1
+                self._stats['discarded'] += 1
+                self._cond.notify()
+    
+    def acquire(self) -> PooledConnection:
+        """Получить соединение из пула"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        thread_id = threading.get_ident()
+        file_id = _file_identity(self.db_name)
+        waited = False
+        
+        while True:
+            conn = None
+            reused = False
+            create = False
+            stale: List[PooledConnection] = []
+            with self._cond:
+                if self._closed:
+                    raise DatabaseException("Пул соединений закрыт")
+                # Файл БД был заменен или удален - старые соединения непригодны
+                if file_id != self._file_id:
+                    stale = self._drop_idle()
+                    self._file_id = file_id
+                while conn is None and not create:
+                    conn, own = self._take_idle(thread_id)
+                    if conn is not None:
+                        reused = True
+                        self._stats['thread_hits' if own else 'steals'] += 1
+                    elif self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise DatabaseException(
+                                f"Превышено время ожидания соединения из пула ({self.timeout} с)"
+                            )
+                        waited = True
+                        self._cond.wait(remaining)
+            
+            for old in stale:
+                old.discard()
+            
+            if reused and not self._is_healthy(conn):
+                with self._cond:
+                    self._size -= 1
+                    self._stats['discarded'] += 1
+                conn.discard()
+                continue
+            
+            if create:
+                try:
+                    conn = self._connect()
+                except sqlite3.Error as e:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    logger.error(f"Ошибка открытия соединения: {e}")
+                    raise DatabaseException(f"Ошибка подключения к БД: {str(e)}")
+                with self._cond:
+                    self._stats['created'] += 1
+                    if self._file_id is None:
+                        self._file_id = conn._file_id
+            break
+        
+        now = time.monotonic()
+        wait_time = now - started
+        conn._pool = self
+        conn._in_use = True
+        conn._checked_out_at = now
+        key = id(conn)
+        with self._cond:
+            self._in_use[key] = weakref.ref(conn, lambda ref, k=key: self._forget(k))
+            self._stats['checkouts'] += 1
+            if waited:
+                self._stats['waits'] += 1
+            self._stats['wait_time_total'] += wait_time
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+        return conn
+    
+    def release(self, conn: PooledConnection):
+        """Вернуть соединение в пул"""
+        if not conn._in_use:
+            return
+        conn._in_use = False
+        now = time.monotonic()
+        hold_time = now - conn._checked_out_at
+        healthy = True
+        try:
+            # Незавершенная транзакция не должна попасть к следующему владельцу
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = self.row_factory
+        except sqlite3.Error:
+            healthy = False
+        conn._released_at = now
+        
+        with self._cond:
+            self._in_use.pop(id(conn), None)
+            self._stats['hold_time_total'] += hold_time
+            self._stats['hold_time_max'] = max(self._stats['hold_time_max'], hold_time)
+            keep = healthy and not self._closed and conn._file_id == self._file_id
+            if keep:
+                self._idle.setdefault(threading.get_ident(), []).append(conn)
+            else:
+                self._size -= 1
+                self._stats['discarded'] += 1
+            self._cond.notify()
+        if not keep:
+            conn.discard()
+    
+    @contextmanager
+    def connection(self):
+        """Получить соединение на время блока with"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Статистика пула: выдачи, повторные использования, время ожидания и удержания"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = sum(len(conns) for conns in self._idle.values())
+            stats['in_use'] = len(self._in_use)
+        checkouts = stats['checkouts'] or 1
+        stats['wait_time_avg'] = stats['wait_time_total'] / checkouts
+        stats['hold_time_avg'] = stats['hold_time_total'] / checkouts
+        return stats
+    
+    def close_all(self):
+        """Закрыть все свободные соединения и запретить выдачу новых"""
+        with self._cond:
+            self._closed = True
+            dropped = self._drop_idle()
+            self._cond.notify_all()
+        for conn in dropped:
+            conn.discard()
+
 
 class DatabaseManager:
     """Менеджер для управления соединениями с БД"""
     
     _instance: Optional['DatabaseManager'] = None
-    _connection: Optional[sqlite3.Connection] = None
+    _lock = threading.Lock()
     
     def __new__(cls, db_name: str = 'dormitory.db'):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._initialize(db_name)
+        with cls._lock:
+            if cls._instance is None:
+                instance = super().__new__(cls)
+                instance._initialize(db_name)
+                cls._instance = instance
         return cls._instance
     
     def _initialize(self, db_name: str):
@@ -29,17 +335,67 @@ class DatabaseManager:
         project_root = Path(__file__).parent.parent.parent
         self.db_path = project_root / db_name
         self.db_name = str(self.db_path)
-        logger.info(f"Инициализирован DatabaseManager для {self.db_name}")
+        self._pools: Dict[str, ConnectionPool] = {}
+        self._writers: Dict[str, DatabaseWriter] = {}
+        self._pools_lock = threading.Lock()
+        self.config = load_config()
+        self.profile = resolve_profile(self.config)
+        # Журнал запросов для советника по индексам (app/core/index_advisor.py)
+        self.query_log: Optional[QueryLog] = None
+        path = log_path(self.config)
+        if path:
+            self.query_log = QueryLog()
+            atexit.register(self.query_log.save, path)
+            logger.info(f"Журнал запросов включен: {path}")
+        logger.info(f"Инициализирован DatabaseManager для {self.db_name}, профиль '{self.profile['name']}'")
+    
+    def get_pool(self, db_name: Optional[str] = None) -> ConnectionPool:
+        """Получить пул соединений для файла БД"""
+        key = str(db_name or self.db_name)
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._pools_lock:
+                pool = self._pools.get(key)
+                if pool is None:
+                    pool = ConnectionPool(
+                        key, max_size=int(self.config.get('pool_size', 8)), profile=self.profile,
+                        statement_cache_size=int(
+                            self.config.get('statement_cache_size', STATEMENT_CACHE_SIZE)
+                        ),
+                        query_log=self.query_log
+                    )
+                    self._pools[key] = pool
+        return pool
+    
+    def get_writer(self, db_name: Optional[str] = None) -> DatabaseWriter:
+        """Получить поток записи для файла БД"""
+        key = str(db_name or self.db_name)
+        writer = self._writers.get(key)
+        if writer is None:
+            pool = self.get_pool(key)
+            with self._pools_lock:
+                writer = self._writers.get(key)
+                if writer is None:
+                    writer = DatabaseWriter(pool)
+                    self._writers[key] = writer
+        return writer
+    
+    def pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Статистика всех пулов"""
+        return {name: pool.stats() for name, pool in list(self._pools.items())}
     
     @contextmanager
     def get_connection(self):
         """Получить соединение с БД (контекстный менеджер)"""
         conn = None
         try:
-            conn = sqlite3.connect(self.db_name)
-            conn.row_factory = sqlite3.Row  # Возвращать результаты как Row объекты
+            conn = self.get_pool().acquire()
             yield conn
             conn.commit()
+        except DatabaseException:
+            if conn:
+                conn.rollback()
+            raise
         except sqlite3.Error as e:
             if conn:
                 conn.rollback()
@@ -54,8 +410,48 @@ class DatabaseManager:
             if conn:
                 conn.close()
     
+    def submit_write(self, operation, tables=None, db_name: Optional[str] = None,
+                     writer: Optional[DatabaseWriter] = None) -> Future:
+        """Поставить операцию записи operation(conn) в очередь потока записи; результат - Future
+
+        tables - таблицы, которые меняет операция (None - неизвестно, устаревает весь кэш запросов);
+        writer - поток записи (по умолчанию общий поток файла db_name)
+        """
+        key = str(db_name or self.db_name)
+        # Записи, прочитанные текущей операцией до изменения, больше не используются
+        identity_map.invalidate()
+        future = (writer or self.get_writer(key)).submit(operation)
+        future.add_done_callback(lambda _: query_cache.invalidate(key, tables))
+        return future
+    
+    def write(self, operation, tables=None, db_name: Optional[str] = None,
+              timeout: Optional[float] = WRITE_TIMEOUT, writer: Optional[DatabaseWriter] = None):
+        """Выполнить операцию записи в потоке записи и дождаться результата не дольше timeout секунд"""
+        key = str(db_name or self.db_name)
+        future = self.submit_write(operation, tables, key, writer)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            # Еще не начатая операция отменяется; начатая может завершиться позже
+            future.cancel()
+            logger.error(f"Поток записи {key} не ответил за {timeout} с")
+            raise DatabaseException(f"База данных не ответила за {timeout:g} с, запись не подтверждена")
+        finally:
+            identity_map.invalidate()
+            # Обратный вызов Future мог еще не выполниться к возврату result()
+            query_cache.invalidate(key, tables)
+    
     def execute(self, query: str, params: Optional[tuple] = None, fetch_one: bool = False, fetch_all: bool = False):
-        """Выполнить запрос"""
+        """Выполнить запрос; команды записи выполняются потоком записи"""
+        if not is_read_only(query):
+            def operation(conn):
+                cursor = conn.execute(query, params or ())
+                if fetch_one:
+                    return cursor.fetchone()
+                if fetch_all:
+                    return cursor.fetchall()
+                return cursor.lastrowid
+            return self._write_statement(query, operation)
         with self.get_connection() as conn:
             cursor = conn.cursor()
             if params:
@@ -63,20 +459,35 @@ class DatabaseManager:
             else:
                 cursor.execute(query)
             
+            # Строки - записи пула (доступ по имени колонки, _asdict() для словаря)
             if fetch_one:
-                row = cursor.fetchone()
-                return dict(row) if row else None
+                return cursor.fetchone()
             elif fetch_all:
-                rows = cursor.fetchall()
-                return [dict(row) for row in rows]
+                return cursor.fetchall()
             else:
                 return cursor.lastrowid
     
+    def iter_query(self, query: str, params: Optional[tuple] = None,
+                   batch_size: int = BATCH_SIZE) -> Iterator[tuple]:
+        """Строки запроса (записи) по мере чтения, пачками по batch_size"""
+        conn = self.get_pool().acquire()
+        try:
+            cursor = conn.execute(query, params or ())
+            yield from iter_cursor(cursor, batch_size)
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка SQLite: {e}")
+            raise DatabaseException(f"Ошибка работы с БД: {str(e)}")
+        finally:
+            conn.close()
+    
     def execute_many(self, query: str, params_list: list):
-        """Выполнить запрос для множества параметров"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.executemany(query, params_list)
-            conn.commit()
-            return cursor.rowcount
-
+        """Выполнить команду записи для множества параметров (потоком записи, одной транзакцией)"""
+        return self._write_statement(query, lambda conn: conn.executemany(query, params_list).rowcount)
+    
+    def _write_statement(self, query: str, operation):
+        target = query_cache.write_target(query)
+        try:
+            return self.write(operation, None if target is None else (target,))
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка SQLite: {e}")
+            raise DatabaseException(f"Ошибка работы с БД: {str(e)}")
@@ -0,0 +1,343 @@
+"""
+Фасетный индекс
+Для каждого значения признака (пол, группа, корпус, этаж, проживание, email) хранится
+битовое множество позиций записей - целое число Python. Сочетание условий - побитовые
+И/ИЛИ/НЕ над целыми, число записей и счетчики значений - подсчет единичных битов.
+Редкие значения (группы) хранятся отсортированным массивом позиций и превращаются
+в битовое множество при обращении. Индексы помечены счетчиками изменений таблиц в БД:
+свои записи студентов, заселения и выселения обновляют одну запись индекса студентов,
+любые другие записи (в том числе других рабочих мест) перестраивают индекс при следующем
+обращении; индекс комнат невелик и перестраивается после любого изменения
+"""
+import bisect
+import sys
+import threading
+from array import array
+from collections import Counter
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple, Union
+from app.core import query_cache
+
+STUDENT_FACETS = ('gender', 'group', 'building', 'floor', 'resident', 'has_email')
+ROOM_FACETS = ('building', 'floor', 'gender', 'has_free', 'capacity')
+
+# Таблицы, по счетчикам которых проверяются индексы (свои записи студентов, заселения
+# и выселения учитываются по одной записи - student_changed)
+STUDENT_FACET_TABLES = ('rooms', 'buildings', 'students', 'checkins', 'checkouts')
+ROOM_FACET_TABLES = ('rooms', 'buildings', 'students', 'checkins', 'checkouts')
+
+# Значение, которое есть меньше чем у 1/SPARSE_RATIO записей, хранится массивом позиций
+SPARSE_RATIO = 32
+
+# Корпус и этаж - по последнему активному проживанию студента
+STUDENT_SQL = '''
+    SELECT s.id, s.gender, s.group_number AS "group",
+           r.building_id AS building, r.floor,
+           res.checkin_id IS NOT NULL AS resident,
+           COALESCE(s.email, '') <> '' AS has_email
+    FROM students s
+    LEFT JOIN residencies res ON res.checkin_id = (
+        SELECT MAX(checkin_id) FROM residencies
+        WHERE student_id = s.id AND checkout_date IS NULL
+    )
+    LEFT JOIN rooms r ON r.id = res.room_id
+'''
+ROOM_SQL = '''
+    SELECT r.id, r.building_id AS building, r.floor,
+           CASE
+               WHEN o.male > 0 AND o.female > 0 THEN 'MIXED'
+               WHEN o.male > 0 THEN 'М'
+               WHEN o.female > 0 THEN 'Ж'
+           END AS gender,
+           r.capacity > COALESCE(o.occupancy, 0) AS has_free,
+           r.capacity
+    FROM rooms r
+    LEFT JOIN room_occupancy o ON o.room_id = r.id
+'''
+
+# Условие: (признак, значение), ('and', ...), ('or', ...), ('not', условие)
+# или словарь {признак: значения} (ИЛИ внутри признака, И между признаками)
+Expression = Union[Tuple, Dict[str, Iterable[Hashable]]]
+Selection = Dict[str, Iterable[Hashable]]
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(bits: int) -> int:
+        return bin(bits).count('1')
+
+
+def to_bits(positions: Sequence[int]) -> int:
+    """Битовое множество по отсортированным позициям"""
+    if not positions:
+        return 0
+    buffer = bytearray((positions[-1] >> 3) + 1)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def positions_of(bits: int) -> List[int]:
+    """Позиции единичных битов по возрастанию (перебор 64-битных слов)"""
+    size = (bits.bit_length() + 63) // 64
+    words = array('Q', bits.to_bytes(size * 8, 'little'))
+    if sys.byteorder == 'big':
+        words.byteswap()
+    positions = []
+    for i, word in enumerate(words):
+        base = i << 6
+        while word:
+            low = word & -word
+            positions.append(base + low.bit_length() - 1)
+            word ^= low
+    return positions
+
+
+class FacetIndex:
+    """Битовые множества записей по значениям признаков"""
+    
+    def __init__(self, facets: Sequence[str], stamp: Tuple[int, ...] = ()):
+        self.facets = tuple(facets)
+        self.stamp = stamp
+        # Ключ записи -> позиция; позиции удаленных записей не переиспользуются
+        self._positions: Dict[Hashable, int] = {}
+        self._keys: List[Optional[Hashable]] = []
+        self._rows: List[Optional[Tuple]] = []
+        # Признак -> значение -> битовое множество (int) или массив позиций (редкое значение)
+        self._sets: Dict[str, Dict[Hashable, Union[int, array]]] = {facet: {} for facet in self.facets}
+        self.universe = 0
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def build(cls, facets: Sequence[str], rows: Iterable[Any], stamp: Tuple[int, ...] = ()) -> 'FacetIndex':
+        """Индекс по записям с полем id и полями признаков"""
+        index = cls(facets, stamp)
+        grouped: Dict[str, Dict[Hashable, List[int]]] = {facet: {} for facet in index.facets}
+        for position, row in enumerate(rows):
+            values = tuple(getattr(row, facet) for facet in index.facets)
+            index._positions[row.id] = position
+            index._keys.append(row.id)
+            index._rows.append(values)
+            for facet, value in zip(index.facets, values):
+                grouped[facet].setdefault(value, []).append(position)
+        size = len(index._keys)
+        for facet, values in grouped.items():
+            index._sets[facet] = {
+                value: array('l', positions) if len(positions) * SPARSE_RATIO < size else to_bits(positions)
+                for value, positions in values.items()
+            }
+        index.universe = (1 << size) - 1
+        return index
+    
+    def __len__(self) -> int:
+        return len(self._positions)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._positions
+    
+    def _add(self, facet: str, value: Hashable, position: int):
+        values = self._sets[facet]
+        stored = values.get(value)
+        if stored is None:
+            values[value] = array('l', (position,))
+        elif isinstance(stored, int):
+            values[value] = stored | (1 << position)
+        else:
+            stored.insert(bisect.bisect_left(stored, position), position)
+            if len(stored) * SPARSE_RATIO >= len(self._keys):
+                values[value] = to_bits(stored)
+    
+    def _discard(self, facet: str, value: Hashable, position: int):
+        values = self._sets[facet]
+        stored = values[value]
+        if isinstance(stored, int):
+            stored &= ~(1 << position)
+            if stored:
+                values[value] = stored
+            else:
+                del values[value]
+        else:
+            del stored[bisect.bisect_left(stored, position)]
+            if not stored:
+                del values[value]
+    
+    def set(self, key: Hashable, row: Any):
+        """Добавить запись или обновить ее признаки"""
+        values = tuple(getattr(row, facet) for facet in self.facets)
+        with self._lock:
+            position = self._positions.get(key)
+            if position is None:
+                position = self._positions[key] = len(self._keys)
+                self._keys.append(key)
+                self._rows.append(None)
+                self.universe |= 1 << position
+            old = self._rows[position]
+            for i, facet in enumerate(self.facets):
+                if old is not None and old[i] == values[i]:
+                    continue
+                if old is not None:
+                    self._discard(facet, old[i], position)
+                self._add(facet, values[i], position)
+            self._rows[position] = values
+    
+    def remove(self, key: Hashable):
+        """Убрать запись из индекса"""
+        with self._lock:
+            position = self._positions.pop(key, None)
+            if position is None:
+                return
+            for facet, value in zip(self.facets, self._rows[position]):
+                self._discard(facet, value, position)
+            self._keys[position] = None
+            self._rows[position] = None
+            self.universe &= ~(1 << position)
+    
+    def _bits(self, facet: str, value: Hashable) -> int:
+        if facet not in self._sets:
+            raise ValueError(f"Неизвестный признак: {facet}")
+        stored = self._sets[facet].get(value, 0)
+        return stored if isinstance(stored, int) else to_bits(stored)
+    
+    def _select(self, selection: Selection, skip: Optional[str] = None) -> int:
+        bits = self.universe
+        for facet, values in selection.items():
+            if facet == skip or values is None:
+                continue
+            any_of = 0
+            for value in values:
+                any_of |= self._bits(facet, value)
+            bits &= any_of
+        return bits
+    
+    def _evaluate(self, expression: Expression) -> int:
+        if isinstance(expression, dict):
+            return self._select(expression)
+        head = expression[0]
+        if head == 'and':
+            bits = self.universe
+            for operand in expression[1:]:
+                bits &= self._evaluate(operand)
+            return bits
+        if head == 'or':
+            bits = 0
+            for operand in expression[1:]:
+                bits |= self._evaluate(operand)
+            return bits
+        if head == 'not':
+            return self.universe & ~self._evaluate(expression[1])
+        facet, value = expression
+        return self._bits(facet, value)
+    
+    def select(self, selection: Selection) -> int:
+        """Записи, подходящие по каждому признаку selection хотя бы одним значением"""
+        with self._lock:
+            return self._select(selection)
+    
+    def evaluate(self, expression: Expression) -> int:
+        """Записи, подходящие под условие из И/ИЛИ/НЕ над значениями признаков"""
+        with self._lock:
+            return self._evaluate(expression)
+    
+    def values(self, facet: str) -> List[Hashable]:
+        """Значения признака, которые есть у записей"""
+        with self._lock:
+            return list(self._sets[facet])
+    
+    def counts(self, selection: Optional[Selection] = None) -> Dict[str, Dict[Hashable, int]]:
+        """Число записей по значениям каждого признака
+        
+        Для признака учитываются условия остальных признаков selection, поэтому
+        выбор значения не обнуляет счетчики других значений того же признака
+        """
+        selection = selection or {}
+        result: Dict[str, Dict[Hashable, int]] = {}
+        with self._lock:
+            for facet in self.facets:
+                mask = self._select(selection, skip=facet)
+                full = mask == self.universe
+                counts = result[facet] = {}
+                sparse = []
+                for value, stored in self._sets[facet].items():
+                    if isinstance(stored, int):
+                        counts[value] = _popcount(stored if full else stored & mask)
+                    elif full:
+                        counts[value] = len(stored)
+                    else:
+                        sparse.append(value)
+                if sparse:
+                    # Редкие значения считаются одним проходом по записям маски
+                    column = self.facets.index(facet)
+                    found = Counter(self._rows[position][column] for position in positions_of(mask))
+                    for value in sparse:
+                        counts[value] = found.get(value, 0)
+        return result
+    
+    def count(self, bits: int) -> int:
+        """Число записей в битовом множестве"""
+        return _popcount(bits)
+    
+    def keys(self, bits: int) -> List[Hashable]:
+        """Ключи записей битового множества в порядке позиций"""
+        with self._lock:
+            return [self._keys[position] for position in positions_of(bits & self.universe)]
+
+
+_indexes: Dict[Tuple[str, str], FacetIndex] = {}
+_build_lock = threading.Lock()
+
+
+def _index(db, name: str, facets: Sequence[str], sql: str, order: str, tables: Sequence[str]) -> FacetIndex:
+    """Актуальный индекс name файла БД (строится заново, если изменились таблицы tables)"""
+    key = (db.db_name, name)
+    index = _indexes.get(key)
+    if index is not None and index.stamp == query_cache.db_versions(db, tables):
+        return index
+    with _build_lock:
+        stamp = query_cache.db_versions(db, tables)
+        index = _indexes.get(key)
+        if index is None or index.stamp != stamp:
+            conn = db.get_connection()
+            try:
+                rows = conn.execute(f'{sql} ORDER BY {order}').fetchall()
+            finally:
+                conn.close()
+            index = _indexes[key] = FacetIndex.build(facets, rows, stamp)
+    return index
+
+
+def students(db) -> FacetIndex:
+    """Индекс студентов: пол, группа, корпус и этаж проживания, проживает ли, есть ли email"""
+    return _index(db, 'students', STUDENT_FACETS, STUDENT_SQL, 's.id', STUDENT_FACET_TABLES)
+
+
+def rooms(db) -> FacetIndex:
+    """Индекс комнат: корпус, этаж, пол проживающих, есть ли свободные места, вместимость"""
+    return _index(db, 'rooms', ROOM_FACETS, ROOM_SQL, 'r.id', ROOM_FACET_TABLES)
+
+
+def student_changed(db, student_id: int, change: query_cache.Change):
+    """Перечитать признаки студента после своего изменения, удаления, заселения или выселения
+
+    change - счетчики изменений до и после записи (Database.write_counted); если до записи
+    индекс уже устарел, он отбрасывается и строится заново при следующем обращении
+    """
+    # Под блокировкой построения: строящийся индекс не пропустит изменение,
+    # а более раннее чтение не перезапишет более позднее
+    with _build_lock:
+        key = (db.db_name, 'students')
+        index = _indexes.get(key)
+        if index is None:
+            return
+        stamp = query_cache.advance(db, index.stamp, STUDENT_FACET_TABLES, change)
+        if stamp is None:
+            _indexes.pop(key, None)
+            return
+        conn = db.get_connection()
+        try:
+            row = conn.execute(f'{STUDENT_SQL} WHERE s.id = ?', (student_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            index.remove(student_id)
+        else:
+            index.set(student_id, row)
+        index.stamp = stamp
@@ -0,0 +1,123 @@
+"""
+Карта идентичности (identity map)
+В пределах одной операции (запрос, действие в окне) запись по id читается из БД один раз,
+повторные get_by_id и get_many берут ее из памяти
+"""
+import contextvars
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Предел числа параметров SQLite до 3.32 - 999; пачка id берется с запасом
+CHUNK_SIZE = 500
+
+_current: contextvars.ContextVar = contextvars.ContextVar('identity_map', default=None)
+_MISSING = object()
+
+
+class IdentityMap:
+    """Записи, прочитанные в рамках операции: таблица -> {id: запись или None}"""
+    
+    def __init__(self):
+        self._records: Dict[str, Dict[int, Any]] = {}
+        self._tokens: List[contextvars.Token] = []
+        self.hits = 0
+        self.misses = 0
+    
+    def __enter__(self) -> 'IdentityMap':
+        self._tokens.append(_current.set(self))
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._tokens.pop())
+    
+    def lookup(self, table: str, ids: Sequence[int]) -> Tuple[Dict[int, Any], List[int]]:
+        """Найденные записи и id, которых нет в карте"""
+        records = self._records.get(table, {})
+        found: Dict[int, Any] = {}
+        missing: List[int] = []
+        for record_id in ids:
+            record = records.get(record_id, _MISSING)
+            if record is _MISSING:
+                missing.append(record_id)
+            else:
+                found[record_id] = record
+        self.hits += len(found)
+        self.misses += len(missing)
+        return found, missing
+    
+    def store(self, table: str, ids: Iterable[int], records: Dict[int, Any]):
+        """Запомнить прочитанные записи; отсутствующие в БД id запоминаются как None"""
+        table_records = self._records.setdefault(table, {})
+        for record_id in ids:
+            table_records[record_id] = records.get(record_id)
+    
+    def forget(self, table: str, record_id: Optional[int] = None):
+        """Забыть запись (или все записи таблицы) после изменения"""
+        if record_id is None:
+            self._records.pop(table, None)
+        else:
+            self._records.get(table, {}).pop(record_id, None)
+    
+    def clear(self):
+        """Забыть все записи"""
+        self._records.clear()
+
+
+def current_map() -> Optional[IdentityMap]:
+    """Карта идентичности текущей операции (None вне операции)"""
+    return _current.get()
+
+
+def unit_of_work() -> IdentityMap:
+    """Область операции: with unit_of_work(): ... (вложенная область использует внешнюю карту)"""
+    return current_map() or IdentityMap()
+
+
+def invalidate():
+    """Сбросить карту текущей операции после записи в БД"""
+    identity_map = current_map()
+    if identity_map is not None:
+        identity_map.clear()
+
+
+def fetch_many(db, query: str, ids: Sequence[int], chunk_size: int = CHUNK_SIZE) -> Dict[int, Any]:
+    """Прочитать записи по id пачками; в query место списка параметров обозначено {ids}"""
+    records: Dict[int, Any] = {}
+    conn = db.get_connection()
+    try:
+        for start in range(0, len(ids), chunk_size):
+            chunk = list(ids[start:start + chunk_size])
+            placeholders = ', '.join('?' for _ in chunk)
+            for row in conn.execute(query.format(ids=placeholders), chunk):
+                records[row[0]] = row
+    finally:
+        conn.close()
+    return records
+
+
+def get_many(table: str, ids: Iterable[int], load: Callable[[List[int]], Dict[int, Any]]) -> Dict[int, Any]:
+    """Записи по id: из карты текущей операции, недостающие - одной загрузкой load(ids)"""
+    ids = list(dict.fromkeys(ids))
+    identity_map = current_map()
+    if identity_map is None:
+        found, missing = {}, ids
+    else:
+        found, missing = identity_map.lookup(table, ids)
+    if missing:
+        loaded = load(missing)
+        if identity_map is not None:
+            identity_map.store(table, missing, loaded)
+        found.update(loaded)
+    return {record_id: found[record_id] for record_id in ids if found.get(record_id) is not None}
+
+
+def get_one(table: str, record_id: int, load: Callable[[int], Any]) -> Any:
+    """Запись по id: из карты текущей операции или загрузкой load(id)"""
+    identity_map = current_map()
+    if identity_map is None:
+        return load(record_id)
+    found, missing = identity_map.lookup(table, [record_id])
+    if not missing:
+        return found[record_id]
+    record = load(record_id)
+    identity_map.store(table, [record_id], {record_id: record})
+    return record
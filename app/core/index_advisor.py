@@ -0,0 +1,245 @@
+"""
+Советник по индексам
+Повторяет запросы из журнала (app/core/query_log.py) через EXPLAIN QUERY PLAN на копии
+схемы в памяти и сообщает о полных просмотрах таблиц и сортировках во временном B-дереве.
+Для каждой проблемы подбирается индекс по условиям и ORDER BY запроса; индекс
+предлагается, только если с ним план действительно меняется.
+
+    python -m app.core.index_advisor dormitory.db queries.jsonl
+"""
+import re
+import sqlite3
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple
+from app.core.query_log import load
+from app.core.sql_functions import register_functions
+
+_SCAN = re.compile(r'^SCAN (\w+)$')
+_SORT = re.compile(r'^USE TEMP B-TREE FOR (?:(?:RIGHT PART|LAST TERM) OF )?(ORDER BY|GROUP BY)')
+_KEYWORDS = r'(?:WHERE|ON|JOIN|LEFT|INNER|CROSS|ORDER|GROUP|LIMIT|USING)\b'
+_SOURCE = re.compile(rf'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!{_KEYWORDS})(\w+))?', re.IGNORECASE)
+_PREDICATE = re.compile(
+    r'(?:\b(\w+)\.)?\b(\w+)\s*(==|=|\bIS\b|\bIN\b|<=|>=|<|>|\bBETWEEN\b)', re.IGNORECASE
+)
+_CLAUSE_END = r'(?=\bLIMIT\b|\bHAVING\b|\bORDER BY\b|\)|$)'
+_EQUALITY = {'=', '==', 'IS', 'IN'}
+
+
+class Finding:
+    """Проблема плана запроса и индекс, который ее устраняет (None - не найден)"""
+    
+    def __init__(self, statement: str, count: int, problem: str, table: str, detail: str,
+                 index: Optional[str] = None):
+        self.statement = statement
+        self.count = count
+        self.problem = problem  # 'scan' или 'sort'
+        self.table = table
+        self.detail = detail
+        self.index = index
+    
+    def __repr__(self):
+        return f'Finding({self.problem}, {self.table}, {self.index!r})'
+
+
+def copy_schema(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """Пустая копия схемы БД в памяти (с функциями приложения)"""
+    copy = sqlite3.connect(':memory:')
+    register_functions(copy)
+    rows = conn.execute('''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+        ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END, rowid
+    ''').fetchall()
+    # Служебные таблицы FTS5 создает сама виртуальная таблица
+    virtual = [name for kind, name, sql in rows if sql.upper().startswith('CREATE VIRTUAL TABLE')]
+    for kind, name, sql in rows:
+        if kind == 'table' and any(name.startswith(f'{table}_') for table in virtual):
+            continue
+        copy.execute(sql)
+    return copy
+
+
+def explain(conn: sqlite3.Connection, statement: str) -> List[str]:
+    """Строки плана запроса (параметры связываются со значением NULL)"""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(f'EXPLAIN QUERY PLAN {statement}', [None] * statement.count('?')).fetchall()
+    return [row[3] for row in rows]
+
+
+def problems(plan: Sequence[str]) -> List[Tuple[str, str]]:
+    """Проблемы плана: ('scan', псевдоним таблицы) и ('sort', 'ORDER BY'/'GROUP BY')"""
+    found = []
+    for detail in plan:
+        scan = _SCAN.match(detail)
+        if scan:
+            found.append(('scan', scan.group(1)))
+        sort = _SORT.match(detail)
+        if sort:
+            found.append(('sort', sort.group(1)))
+    return found
+
+
+def _sources(statement: str) -> Dict[str, str]:
+    """Псевдонимы таблиц запроса: псевдоним -> таблица"""
+    sources = {}
+    for table, alias in _SOURCE.findall(statement):
+        sources[alias or table] = table
+        sources.setdefault(table, table)
+    return sources
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return [row[1] for row in cursor.execute('SELECT * FROM pragma_table_xinfo(?)', (table,))]
+
+
+def _owner(term: str, sources: Dict[str, str], columns: Dict[str, List[str]]) -> Optional[str]:
+    """Псевдоним таблицы, к которой относится выражение (None - несколько или неизвестно)"""
+    qualified = set(re.findall(r'\b(\w+)\.\w+', term)) & set(sources)
+    if len(qualified) == 1:
+        return qualified.pop()
+    if qualified:
+        return None
+    names = set(re.findall(r'\b\w+\b', term))
+    owners = {alias for alias, table in sources.items() if names & set(columns[table])}
+    owners = {alias for alias in owners if sources[alias] == alias} or owners
+    return owners.pop() if len(owners) == 1 else None
+
+
+def _split_terms(clause: str) -> List[str]:
+    """Выражения списка через запятую (запятые внутри скобок не разделяют)"""
+    terms, depth, current = [], 0, ''
+    for char in clause:
+        if char == ',' and depth == 0:
+            terms.append(current.strip())
+            current = ''
+            continue
+        depth += (char == '(') - (char == ')')
+        current += char
+    if current.strip():
+        terms.append(current.strip())
+    return terms
+
+
+def _unqualify(term: str, alias: str) -> str:
+    return re.sub(rf'\b{re.escape(alias)}\.', '', term)
+
+
+def candidate(statement: str, problem: str, target: str, sources: Dict[str, str],
+              columns: Dict[str, List[str]]) -> Optional[Tuple[str, List[str]]]:
+    """Таблица и колонки индекса: условия равенства, затем диапазон или порядок"""
+    where = re.split(r'\bFROM\b', statement, maxsplit=1, flags=re.IGNORECASE)[-1]
+    equality: Dict[str, List[str]] = {}
+    ranges: Dict[str, List[str]] = {}
+    for alias, column, operator in _PREDICATE.findall(where):
+        owner = alias if alias in sources else _owner(column, sources, columns)
+        if owner is None or column not in columns[sources[owner]]:
+            continue
+        bucket = equality if operator.upper() in _EQUALITY else ranges
+        if column not in bucket.setdefault(owner, []):
+            bucket[owner].append(column)
+
+    if problem == 'scan':
+        alias = target
+        if alias not in sources:
+            return None
+        keys = list(equality.get(alias, []))
+        keys += [column for column in ranges.get(alias, [])[:1] if column not in keys]
+        return (sources[alias], keys) if keys else None
+
+    match = re.search(rf'\b{target}\s+(.*?){_CLAUSE_END}', statement, re.IGNORECASE)
+    if not match:
+        return None
+    terms = _split_terms(match.group(1))
+    owners = {_owner(term, sources, columns) for term in terms}
+    if len(owners) != 1 or None in owners:
+        return None
+    alias = owners.pop()
+    keys = list(equality.get(alias, []))
+    for term in terms:
+        term = re.sub(r'\s+ASC$', '', _unqualify(term, alias), flags=re.IGNORECASE)
+        if term not in keys:
+            keys.append(term)
+    return sources[alias], keys
+
+
+def index_sql(table: str, keys: Sequence[str]) -> str:
+    """CREATE INDEX для таблицы и выражений ключа"""
+    name = '_'.join(re.sub(r'\W+', '_', key.lower()).strip('_') for key in keys)
+    return f'CREATE INDEX idx_{table}_{name} ON {table}({", ".join(keys)})'
+
+
+def _fixes(copy: sqlite3.Connection, statement: str, index: str, problem: Tuple[str, str]) -> bool:
+    """Устраняет ли индекс проблему (индекс создается в копии схемы и откатывается)"""
+    copy.execute('SAVEPOINT advisor')
+    try:
+        copy.execute(index)
+        return problem not in problems(explain(copy, statement))
+    except sqlite3.Error:
+        return False
+    finally:
+        copy.execute('ROLLBACK TO advisor')
+        copy.execute('RELEASE advisor')
+
+
+def analyze(conn: sqlite3.Connection, statements: Sequence[Tuple[str, int]]) -> List[Finding]:
+    """Проблемы планов запросов журнала, частые запросы первыми"""
+    copy = copy_schema(conn)
+    findings = []
+    try:
+        columns: Dict[str, List[str]] = {}
+        for statement, count in sorted(statements, key=lambda item: -item[1]):
+            try:
+                plan = explain(copy, statement)
+            except sqlite3.Error:
+                continue
+            sources = _sources(statement)
+            for table in set(sources.values()):
+                if table not in columns:
+                    columns[table] = _columns(copy, table)
+            for problem in problems(plan):
+                kind, target = problem
+                table = sources.get(target, target) if kind == 'scan' else ''
+                finding = Finding(statement, count, kind, table, ' | '.join(plan))
+                found = candidate(statement, kind, target, sources, columns)
+                if found:
+                    finding.table = found[0]
+                    index = index_sql(*found)
+                    if _fixes(copy, statement, index, problem):
+                        finding.index = index
+                findings.append(finding)
+    finally:
+        copy.close()
+    return findings
+
+
+def report(findings: Sequence[Finding]) -> str:
+    """Текстовый отчет"""
+    if not findings:
+        return 'Полных просмотров и сортировок во временном B-дереве не найдено'
+    lines = []
+    titles = {'scan': 'Полный просмотр', 'sort': 'Сортировка во временном B-дереве'}
+    for finding in findings:
+        lines.append(' '.join(filter(None, [titles[finding.problem], finding.table, f'({finding.count} раз)'])))
+        lines.append(f'  запрос: {finding.statement}')
+        lines.append(f'  план:   {finding.detail}')
+        lines.append(f"  индекс: {finding.index or 'не найден'}")
+    return '\n'.join(lines)
+
+
+def main(argv: Sequence[str]) -> int:
+    if len(argv) != 2:
+        print('Использование: python -m app.core.index_advisor <файл БД> <журнал запросов>')
+        return 2
+    conn = sqlite3.connect(argv[0])
+    try:
+        print(report(analyze(conn, load(argv[1]))))
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
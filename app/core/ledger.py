@@ -0,0 +1,223 @@
+"""
+Счетчики заселенности комнат, этажей и корпусов
+Таблицы поддерживаются триггерами на rooms, checkins, checkouts и students,
+поэтому любой вопрос о заселенности - чтение одной строки по ключу
+"""
+import sqlite3
+from typing import List
+
+LEDGER_TABLES = ('room_occupancy', 'floor_occupancy', 'building_occupancy')
+
+# Пол студента активного заселения как 0/1 для счетчиков male/female
+_MALE = "COALESCE((SELECT gender = 'М' FROM students WHERE id = {student}), 0)"
+_FEMALE = "COALESCE((SELECT gender = 'Ж' FROM students WHERE id = {student}), 0)"
+
+
+def _occupancy_delta(room: str, student: str, sign: str) -> str:
+    """Изменить заселенность комнаты, ее этажа и корпуса на одно место"""
+    male = _MALE.format(student=student)
+    female = _FEMALE.format(student=student)
+    return f'''
+        UPDATE room_occupancy
+        SET occupancy = occupancy {sign} 1,
+            male = male {sign} {male},
+            female = female {sign} {female}
+        WHERE room_id = {room};
+        UPDATE floor_occupancy SET occupied = occupied {sign} 1
+        WHERE (building_id, floor) = (SELECT building_id, floor FROM rooms WHERE id = {room});
+        UPDATE building_occupancy SET occupied = occupied {sign} 1
+        WHERE building_id = (SELECT building_id FROM rooms WHERE id = {room});
+    '''
+
+
+def _capacity_delta(room: str, building: str, floor: str, capacity: str, sign: str) -> str:
+    """Добавить (+) или убрать (-) комнату из итогов этажа и корпуса"""
+    occupied = f'COALESCE((SELECT occupancy FROM room_occupancy WHERE room_id = {room}), 0)'
+    statements = ''
+    if sign == '+':
+        statements += f'''
+        INSERT OR IGNORE INTO floor_occupancy (building_id, floor) VALUES ({building}, {floor});
+        INSERT OR IGNORE INTO building_occupancy (building_id) VALUES ({building});
+        '''
+    statements += f'''
+        UPDATE floor_occupancy
+        SET capacity = capacity {sign} {capacity}, occupied = occupied {sign} {occupied}
+        WHERE building_id = {building} AND floor = {floor};
+        UPDATE building_occupancy
+        SET capacity = capacity {sign} {capacity}, occupied = occupied {sign} {occupied}
+        WHERE building_id = {building};
+    '''
+    if sign == '-':
+        # Этаж без комнат из итогов убирается
+        statements += f'''
+        DELETE FROM floor_occupancy
+        WHERE building_id = {building} AND floor = {floor} AND capacity = 0;
+        '''
+    return statements
+
+
+def _active(checkin: str) -> str:
+    """Условие: заселение не выселено"""
+    return f'NOT EXISTS (SELECT 1 FROM checkouts WHERE checkin_id = {checkin})'
+
+
+def _checkout_delta(checkout: str, sign: str) -> str:
+    """Изменить заселенность по строке выселения"""
+    return _occupancy_delta(
+        f'(SELECT room_id FROM checkins WHERE id = {checkout}.checkin_id)',
+        f'(SELECT student_id FROM checkins WHERE id = {checkout}.checkin_id)',
+        sign
+    )
+
+
+LEDGER_SCHEMA: List[str] = [
+    '''
+    CREATE TABLE IF NOT EXISTS room_occupancy (
+        room_id INTEGER PRIMARY KEY,
+        occupancy INTEGER NOT NULL DEFAULT 0,
+        male INTEGER NOT NULL DEFAULT 0,
+        female INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS floor_occupancy (
+        building_id INTEGER NOT NULL,
+        floor INTEGER NOT NULL,
+        capacity INTEGER NOT NULL DEFAULT 0,
+        occupied INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (building_id, floor)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS building_occupancy (
+        building_id INTEGER PRIMARY KEY,
+        capacity INTEGER NOT NULL DEFAULT 0,
+        occupied INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    # Корпуса
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_buildings_ledger_insert AFTER INSERT ON buildings
+    BEGIN
+        INSERT OR IGNORE INTO building_occupancy (building_id) VALUES (NEW.id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_buildings_ledger_delete AFTER DELETE ON buildings
+    BEGIN
+        DELETE FROM building_occupancy WHERE building_id = OLD.id;
+    END
+    ''',
+    # Комнаты
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_rooms_ledger_insert AFTER INSERT ON rooms
+    BEGIN
+        INSERT OR IGNORE INTO room_occupancy (room_id) VALUES (NEW.id);
+        {_capacity_delta('NEW.id', 'NEW.building_id', 'NEW.floor', 'NEW.capacity', '+')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_rooms_ledger_update
+    AFTER UPDATE OF building_id, floor, capacity ON rooms
+    BEGIN
+        {_capacity_delta('OLD.id', 'OLD.building_id', 'OLD.floor', 'OLD.capacity', '-')}
+        {_capacity_delta('NEW.id', 'NEW.building_id', 'NEW.floor', 'NEW.capacity', '+')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_rooms_ledger_delete AFTER DELETE ON rooms
+    BEGIN
+        {_capacity_delta('OLD.id', 'OLD.building_id', 'OLD.floor', 'OLD.capacity', '-')}
+        DELETE FROM room_occupancy WHERE room_id = OLD.id;
+    END
+    ''',
+    # Заселения (новое заселение всегда активно)
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_checkins_ledger_insert AFTER INSERT ON checkins
+    BEGIN
+        {_occupancy_delta('NEW.room_id', 'NEW.student_id', '+')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_checkins_ledger_update
+    AFTER UPDATE OF student_id, room_id ON checkins
+    WHEN {_active('NEW.id')}
+    BEGIN
+        {_occupancy_delta('OLD.room_id', 'OLD.student_id', '-')}
+        {_occupancy_delta('NEW.room_id', 'NEW.student_id', '+')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_checkins_ledger_delete AFTER DELETE ON checkins
+    WHEN {_active('OLD.id')}
+    BEGIN
+        {_occupancy_delta('OLD.room_id', 'OLD.student_id', '-')}
+    END
+    ''',
+    # Выселения
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_checkouts_ledger_insert AFTER INSERT ON checkouts
+    BEGIN
+        {_checkout_delta('NEW', '-')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_checkouts_ledger_delete AFTER DELETE ON checkouts
+    BEGIN
+        {_checkout_delta('OLD', '+')}
+    END
+    ''',
+    # Смена пола студента: счетчики пола его текущих комнат пересчитываются
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_students_ledger_gender
+    AFTER UPDATE OF gender ON students
+    WHEN OLD.gender <> NEW.gender
+    BEGIN
+        UPDATE room_occupancy
+        SET male = male + (
+                SELECT COUNT(*) FROM checkins c
+                WHERE c.student_id = NEW.id AND c.room_id = room_occupancy.room_id
+                  AND NOT EXISTS (SELECT 1 FROM checkouts WHERE checkin_id = c.id)
+            ) * (CASE NEW.gender WHEN 'М' THEN 1 ELSE -1 END),
+            female = female + (
+                SELECT COUNT(*) FROM checkins c
+                WHERE c.student_id = NEW.id AND c.room_id = room_occupancy.room_id
+                  AND NOT EXISTS (SELECT 1 FROM checkouts WHERE checkin_id = c.id)
+            ) * (CASE NEW.gender WHEN 'Ж' THEN 1 ELSE -1 END)
+        WHERE room_id IN (SELECT room_id FROM checkins WHERE student_id = NEW.id);
+    END
+    ''',
+]
+
+
+def rebuild_ledger(conn: sqlite3.Connection):
+    """Пересчитать счетчики заселенности по заселениям и выселениям"""
+    for table in LEDGER_TABLES:
+        conn.execute(f'DELETE FROM {table}')
+    conn.execute('''
+        INSERT INTO room_occupancy (room_id, occupancy, male, female)
+        SELECT r.id,
+               COUNT(c.id),
+               COALESCE(SUM(s.gender = 'М'), 0),
+               COALESCE(SUM(s.gender = 'Ж'), 0)
+        FROM rooms r
+        LEFT JOIN checkins c ON c.room_id = r.id
+             AND NOT EXISTS (SELECT 1 FROM checkouts co WHERE co.checkin_id = c.id)
+        LEFT JOIN students s ON s.id = c.student_id
+        GROUP BY r.id
+    ''')
+    conn.execute('''
+        INSERT INTO floor_occupancy (building_id, floor, capacity, occupied)
+        SELECT r.building_id, r.floor, SUM(r.capacity), SUM(o.occupancy)
+        FROM rooms r
+        JOIN room_occupancy o ON o.room_id = r.id
+        GROUP BY r.building_id, r.floor
+    ''')
+    conn.execute('''
+        INSERT INTO building_occupancy (building_id, capacity, occupied)
+        SELECT b.id, COALESCE(SUM(r.capacity), 0), COALESCE(SUM(o.occupancy), 0)
+        FROM buildings b
+        LEFT JOIN rooms r ON r.building_id = b.id
+        LEFT JOIN room_occupancy o ON o.room_id = r.id
+        GROUP BY b.id
+    ''')
@@ -0,0 +1,276 @@
+"""
+Версионные миграции схемы БД
+Номер версии схемы хранится в PRAGMA user_version
+"""
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+from app.core.db_manager import _file_identity
+from app.core.ledger import LEDGER_SCHEMA, rebuild_ledger
+from app.core.residencies import INTERVAL_SCHEMA, RESIDENCY_SCHEMA, rebuild_intervals, rebuild_residencies
+from app.core.search import SEARCH_SCHEMA, rebuild_search
+from app.core.dates import day_column, day_key
+from app.core.sql_functions import natural_key_schema
+from app.core import query_cache
+from app.core.snapshot import CHANGE_COUNTER_SCHEMA
+from app.utils.logger import setup_logger
+from app.utils.exceptions import DatabaseException
+
+logger = setup_logger('migrations')
+
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+
+
+class Migration:
+    """Миграция схемы: номер версии и набор SQL-команд или функций"""
+    
+    def __init__(self, version: int, description: str, steps: Sequence[Step]):
+        self.version = version
+        self.description = description
+        self.steps = list(steps)
+    
+    def apply(self, conn: sqlite3.Connection):
+        """Выполнить шаги миграции в текущей транзакции"""
+        for step in self.steps:
+            if callable(step):
+                step(conn)
+            else:
+                conn.execute(step)
+
+
+def unique_building_numbers(conn: sqlite3.Connection):
+    """Номер корпуса уникален без учета регистра ('1А' и '1а' - один корпус)"""
+    duplicates = conn.execute('''
+        SELECT ufold(building_number) FROM buildings
+        GROUP BY ufold(building_number) HAVING COUNT(*) > 1
+    ''').fetchall()
+    if duplicates:
+        # Существующие данные не меняем: индекс строится без уникальности
+        logger.warning(f"Номера корпусов совпадают без учета регистра: {[row[0] for row in duplicates]}")
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_buildings_number_fold ON buildings(ufold(building_number))')
+    else:
+        conn.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_buildings_number_fold ON buildings(ufold(building_number))'
+        )
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'Базовая схема', [
+        # Таблица студентов
+        '''
+        CREATE TABLE IF NOT EXISTS students (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            surname TEXT NOT NULL,
+            name TEXT NOT NULL,
+            patronymic TEXT,
+            gender TEXT NOT NULL CHECK(gender IN ('М', 'Ж')),
+            phone TEXT NOT NULL,
+            email TEXT,
+            group_number TEXT NOT NULL
+        )
+        ''',
+        # Таблица комендантов
+        '''
+        CREATE TABLE IF NOT EXISTS commandants (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            surname TEXT NOT NULL,
+            name TEXT NOT NULL,
+            patronymic TEXT,
+            phone TEXT NOT NULL
+        )
+        ''',
+        # Таблица корпусов
+        '''
+        CREATE TABLE IF NOT EXISTS buildings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            building_number TEXT NOT NULL UNIQUE,
+            address TEXT NOT NULL,
+            floors_count INTEGER NOT NULL CHECK(floors_count > 0)
+        )
+        ''',
+        # Таблица комнат
+        '''
+        CREATE TABLE IF NOT EXISTS rooms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            building_id INTEGER NOT NULL,
+            floor INTEGER NOT NULL CHECK(floor > 0),
+            room_number TEXT NOT NULL,
+            capacity INTEGER NOT NULL CHECK(capacity > 0),
+            area REAL CHECK(area >= 0),
+            FOREIGN KEY (building_id) REFERENCES buildings(id) ON DELETE RESTRICT,
+            UNIQUE(building_id, floor, room_number)
+        )
+        ''',
+        # Таблица заселений
+        '''
+        CREATE TABLE IF NOT EXISTS checkins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id INTEGER NOT NULL,
+            commandant_id INTEGER NOT NULL,
+            room_id INTEGER NOT NULL,
+            checkin_date TEXT NOT NULL,
+            FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE RESTRICT,
+            FOREIGN KEY (commandant_id) REFERENCES commandants(id) ON DELETE RESTRICT,
+            FOREIGN KEY (room_id) REFERENCES rooms(id) ON DELETE RESTRICT
+        )
+        ''',
+        # Таблица выселений
+        '''
+        CREATE TABLE IF NOT EXISTS checkouts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            checkin_id INTEGER NOT NULL UNIQUE,
+            commandant_id INTEGER NOT NULL,
+            checkout_date TEXT NOT NULL,
+            FOREIGN KEY (checkin_id) REFERENCES checkins(id) ON DELETE RESTRICT,
+            FOREIGN KEY (commandant_id) REFERENCES commandants(id) ON DELETE RESTRICT
+        )
+        ''',
+        # Индексы
+        'CREATE INDEX IF NOT EXISTS idx_students_surname ON students(surname)',
+        'CREATE INDEX IF NOT EXISTS idx_students_group ON students(group_number)',
+        'CREATE INDEX IF NOT EXISTS idx_checkins_student ON checkins(student_id)',
+        'CREATE INDEX IF NOT EXISTS idx_checkins_room ON checkins(room_id)',
+        'CREATE INDEX IF NOT EXISTS idx_checkins_date ON checkins(checkin_date)',
+        'CREATE INDEX IF NOT EXISTS idx_checkouts_checkin ON checkouts(checkin_id)',
+        'CREATE INDEX IF NOT EXISTS idx_rooms_building ON rooms(building_id)',
+    ]),
+    Migration(2, 'Индексы дочерних ключей для проверки внешних ключей', [
+        'CREATE INDEX IF NOT EXISTS idx_checkins_commandant ON checkins(commandant_id)',
+        'CREATE INDEX IF NOT EXISTS idx_checkouts_commandant ON checkouts(commandant_id)',
+    ]),
+    Migration(3, 'Счетчики заселенности комнат, этажей и корпусов', LEDGER_SCHEMA + [rebuild_ledger]),
+    Migration(4, 'Таблица проживаний с частичными индексами активных проживаний',
+              RESIDENCY_SCHEMA + [rebuild_residencies]),
+    Migration(5, 'Индексы порядков постраничной выборки', [
+        # (surname, name) заменяет индекс только по фамилии
+        'DROP INDEX IF EXISTS idx_students_surname',
+        'CREATE INDEX IF NOT EXISTS idx_students_name ON students(surname, name)',
+        'CREATE INDEX IF NOT EXISTS idx_commandants_name ON commandants(surname, name)',
+        'CREATE INDEX IF NOT EXISTS idx_checkouts_date ON checkouts(checkout_date)',
+    ]),
+    Migration(6, 'Полнотекстовые индексы студентов, комендантов и адресов корпусов',
+              SEARCH_SCHEMA + [rebuild_search]),
+    Migration(7, 'Индексы по ufold() и normalize_phone() для поиска без учета регистра', [
+        # Порядок ФИО без учета регистра (get_all и постраничная выборка 'name')
+        'CREATE INDEX IF NOT EXISTS idx_students_name_fold ON students(ufold(surname), ufold(name))',
+        'CREATE INDEX IF NOT EXISTS idx_commandants_name_fold ON commandants(ufold(surname), ufold(name))',
+        'DROP INDEX IF EXISTS idx_students_name',
+        'DROP INDEX IF EXISTS idx_commandants_name',
+        'CREATE INDEX IF NOT EXISTS idx_students_phone ON students(normalize_phone(phone))',
+        'CREATE INDEX IF NOT EXISTS idx_commandants_phone ON commandants(normalize_phone(phone))',
+        unique_building_numbers,
+    ]),
+    Migration(8, 'Номера дней заселения и выселения с индексами вместо текстовых дат', [
+        day_column('checkins', 'checkin_date', 'checkin_day'),
+        day_column('checkouts', 'checkout_date', 'checkout_day'),
+        day_column('residencies', 'checkin_date', 'checkin_day'),
+        day_column('residencies', 'checkout_date', 'checkout_day'),
+        'DROP INDEX IF EXISTS idx_checkins_date',
+        'DROP INDEX IF EXISTS idx_checkouts_date',
+        'CREATE INDEX IF NOT EXISTS idx_checkins_day ON checkins(checkin_day)',
+        'CREATE INDEX IF NOT EXISTS idx_checkouts_day ON checkouts(checkout_day)',
+        'DROP INDEX IF EXISTS idx_residencies_active',
+        'DROP INDEX IF EXISTS idx_residencies_active_room',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_residencies_active
+        ON residencies(checkin_day) WHERE checkout_date IS NULL
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_residencies_active_room
+        ON residencies(room_id, checkin_day) WHERE checkout_date IS NULL
+        ''',
+    ]),
+    Migration(9, 'Покрывающие и частичные индексы горячих запросов', [
+        # Дублируют индексы ограничений UNIQUE(checkin_id) и UNIQUE(building_id, floor, room_number)
+        'DROP INDEX IF EXISTS idx_checkouts_checkin',
+        'DROP INDEX IF EXISTS idx_rooms_building',
+        # Жильцы комнаты (get_active_by_room) читаются из индекса без обращения к таблице.
+        # Индекс с вычисляемой колонкой не бывает покрывающим, поэтому ключ - текстовая дата
+        # (ГГГГ-ММ-ДД, порядок тот же); checkout_date нужна для условия частичного индекса
+        'DROP INDEX IF EXISTS idx_residencies_active_room',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_residencies_active_room
+        ON residencies(room_id, checkin_date, student_id, checkout_date) WHERE checkout_date IS NULL
+        ''',
+        # Число занятых комнат - размер частичного индекса
+        'CREATE INDEX IF NOT EXISTS idx_room_occupancy_occupied ON room_occupancy(room_id) WHERE occupancy > 0',
+    ]),
+    Migration(10, 'Ключи естественного порядка номеров корпусов и комнат', [
+        *natural_key_schema('buildings', 'building_number'),
+        *natural_key_schema('rooms', 'room_number'),
+        'CREATE INDEX IF NOT EXISTS idx_buildings_number_key ON buildings(number_key, id)',
+        'CREATE INDEX IF NOT EXISTS idx_rooms_number_key ON rooms(building_id, floor, number_key)',
+    ]),
+    Migration(11, 'Индекс интервалов проживаний для выборки на дату',
+              INTERVAL_SCHEMA + [rebuild_intervals]),
+    Migration(12, 'Счетчики изменений таблиц для проверки снимка кэша', CHANGE_COUNTER_SCHEMA),
+    Migration(13, 'Индексы ключей порядка дат заселения и выселения без NULL', [
+        # Постраничная выборка 'date' идет по COALESCE(*_day, NO_DAY) (app/core/dates.py day_key)
+        f'CREATE INDEX IF NOT EXISTS idx_checkins_day_key ON checkins({day_key("checkin_day")})',
+        f'CREATE INDEX IF NOT EXISTS idx_checkouts_day_key ON checkouts({day_key("checkout_day")})',
+    ]),
+    Migration(14, 'Индекс интервалов без проживаний с непонятной датой заселения', [
+        'DROP TRIGGER IF EXISTS trg_residencies_interval_insert',
+        'DROP TRIGGER IF EXISTS trg_residencies_interval_update',
+        *INTERVAL_SCHEMA,
+        rebuild_intervals,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+# Файлы БД, схема которых уже проверена в этом процессе: путь -> (устройство, inode)
+_verified: Dict[str, Tuple[int, int]] = {}
+_verified_lock = threading.Lock()
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    """Текущая версия схемы"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, migrations: Optional[List[Migration]] = None) -> int:
+    """Применить недостающие миграции по порядку, вернуть итоговую версию"""
+    migrations = sorted(migrations or MIGRATIONS, key=lambda m: m.version)
+    version = get_version(conn)
+    for migration in migrations:
+        if migration.version <= version:
+            continue
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # Другой процесс мог успеть применить миграцию, пока мы ждали блокировку
+            version = get_version(conn)
+            if migration.version <= version:
+                conn.rollback()
+                continue
+            migration.apply(conn)
+            conn.execute(f'PRAGMA user_version = {int(migration.version)}')
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Ошибка миграции {migration.version} ({migration.description}): {e}")
+            raise DatabaseException(f"Ошибка миграции схемы БД: {str(e)}")
+        version = migration.version
+        logger.info(f"Применена миграция {version}: {migration.description}")
+    return version
+
+
+def ensure_schema(db) -> None:
+    """Проверить схему файла БД один раз за процесс (и повторно, если файл заменен)"""
+    identity = _file_identity(db.db_name)
+    if identity is not None and _verified.get(db.db_name) == identity:
+        return
+    with _verified_lock:
+        identity = _file_identity(db.db_name)
+        if identity is not None and _verified.get(db.db_name) == identity:
+            return
+        # Файл БД новый или заменен: закэшированные результаты запросов к нему не годятся
+        query_cache.invalidate(db.db_name)
+        conn = db.get_connection()
+        try:
+            migrate(conn)
+            identity = conn._file_id or _file_identity(db.db_name)
+        finally:
+            conn.close()
+        _verified[db.db_name] = identity
+        logger.info("База данных инициализирована")
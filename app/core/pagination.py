@@ -0,0 +1,117 @@
+"""
+Постраничная выборка по ключу (keyset pagination)
+Следующая страница начинается сразу после ключа последней строки предыдущей,
+поэтому время открытия страницы не зависит от размера таблицы и номера страницы
+"""
+import base64
+import binascii
+import json
+import sqlite3
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from app.core.records import record_class
+
+PAGE_SIZE = 100
+
+
+class Ordering:
+    """Порядок выборки: выражения ключа (последнее - уникальный id) и направление"""
+    
+    def __init__(self, columns: Sequence[str], descending: bool = False):
+        self.columns = tuple(columns)
+        self.descending = descending
+    
+    def order_by(self) -> str:
+        """Выражение ORDER BY"""
+        direction = 'DESC' if self.descending else 'ASC'
+        return ', '.join(f'{column} {direction}' for column in self.columns)
+    
+    def seek(self) -> str:
+        """Условие «строго после ключа» в виде сравнения row value"""
+        operator = '<' if self.descending else '>'
+        placeholders = ', '.join('?' for _ in self.columns)
+        condition = f"({', '.join(self.columns)}) {operator} ({placeholders})"
+        if len(self.columns) > 1:
+            # SQLite не ищет по индексу на выражениях через сравнение row value;
+            # граница первого выражения ключа сохраняет поиск по индексу
+            condition = f'{self.columns[0]} {operator}= ? AND {condition}'
+        return condition
+    
+    def seek_params(self, key: Sequence[Any]) -> List[Any]:
+        """Параметры условия seek() для ключа key"""
+        key = list(key)
+        return key[:1] + key if len(self.columns) > 1 else key
+
+
+class Page:
+    """Страница строк и токен продолжения (None - страниц больше нет)"""
+    
+    def __init__(self, rows: List[Tuple], next_token: Optional[str]):
+        self.rows = rows
+        self.next_token = next_token
+    
+    @property
+    def has_more(self) -> bool:
+        """Есть ли следующая страница"""
+        return self.next_token is not None
+    
+    def __iter__(self) -> Iterator[Tuple]:
+        return iter(self.rows)
+    
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+def encode_token(order: str, key: Sequence[Any]) -> str:
+    """Токен продолжения: имя порядка и ключ последней строки"""
+    data = json.dumps({'o': order, 'k': list(key)}, ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_token(token: str, order: str, size: int) -> List[Any]:
+    """Ключ из токена продолжения (ValueError, если токен поврежден или от другого порядка)"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        key = data['k']
+        valid = data['o'] == order and isinstance(key, list) and len(key) == size
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+        valid = False
+    if not valid:
+        raise ValueError("Недействительный токен страницы")
+    return key
+
+
+def fetch_page(conn: sqlite3.Connection, columns: str, source: str,
+               orderings: Dict[str, Ordering], order: str,
+               after_key: Optional[str] = None, limit: int = PAGE_SIZE,
+               where: Optional[str] = None, params: Sequence[Any] = ()) -> Page:
+    """Выбрать страницу из source в порядке orderings[order] после токена after_key"""
+    if order not in orderings:
+        raise ValueError(f"Неизвестный порядок сортировки: {order}")
+    if limit <= 0:
+        raise ValueError("Размер страницы должен быть положительным")
+    ordering = orderings[order]
+    size = len(ordering.columns)
+    
+    conditions = [where] if where else []
+    params = list(params)
+    if after_key is not None:
+        conditions.append(ordering.seek())
+        params.extend(ordering.seek_params(decode_token(after_key, order, size)))
+    
+    # Колонки ключа добавляются в конец выборки и отрезаются от строк результата
+    query = f"SELECT {columns}, {', '.join(ordering.columns)} FROM {source}"
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(f'({condition})' for condition in conditions)
+    query += f' ORDER BY {ordering.order_by()} LIMIT ?'
+    params.append(limit + 1)
+    
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(query, params).fetchall()
+    next_token = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_token = encode_token(order, rows[-1][-size:])
+    record = record_class([column[0] for column in cursor.description[:-size]])
+    cursor.close()
+    return Page([record._make(row[:-size]) for row in rows], next_token)
@@ -0,0 +1,129 @@
+"""
+Построитель запросов к одной таблице
+Имена колонок проверяются по схеме таблицы, SQL каждой формы запроса собирается один раз,
+поэтому одинаковый текст запроса повторно берется из кэша выражений sqlite3 (cached_statements)
+"""
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple, Union
+
+OrderBy = Union[str, Sequence[str], None]
+
+
+class QueryBuilder:
+    """SQL для таблицы с проверкой колонок по белому списку и кэшем собранных запросов"""
+    
+    def __init__(self, table: str, columns: Iterable[str]):
+        self.table = table
+        self.columns = frozenset(columns)
+        self._queries: Dict[Tuple, str] = {}
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def for_table(cls, conn: sqlite3.Connection, table: str) -> 'QueryBuilder':
+        """Построитель для существующей таблицы (колонки читаются из схемы)"""
+        columns = [row[0] for row in conn.execute('SELECT name FROM pragma_table_info(?)', (table,))]
+        if not columns:
+            raise ValueError(f"Неизвестная таблица: {table}")
+        return cls(table, columns)
+    
+    def _column(self, column: str) -> str:
+        """Проверить имя колонки"""
+        if column not in self.columns:
+            raise ValueError(f"Неизвестная колонка {self.table}.{column}")
+        return column
+    
+    def order_terms(self, order_by: OrderBy) -> Tuple[Tuple[str, bool], ...]:
+        """Порядок как кортеж (колонка, по убыванию): 'surname, -name' или ['surname', 'name DESC']"""
+        if not order_by:
+            return ()
+        if isinstance(order_by, str):
+            order_by = order_by.split(',')
+        terms = []
+        for term in order_by:
+            parts = term.split()
+            descending = False
+            if len(parts) == 2 and parts[1].upper() in ('ASC', 'DESC'):
+                descending = parts[1].upper() == 'DESC'
+            elif len(parts) != 1:
+                raise ValueError(f"Недопустимый порядок сортировки: {term.strip()}")
+            column = parts[0]
+            if column.startswith('-'):
+                column, descending = column[1:], True
+            terms.append((self._column(column), descending))
+        return tuple(terms)
+    
+    def where_shape(self, filters: Optional[Dict[str, Any]]) -> Tuple[Tuple[Tuple[str, bool], ...], Tuple]:
+        """Форма условия (колонка, значение NULL) и параметры для {колонка: значение}"""
+        if not filters:
+            return (), ()
+        shape = tuple((self._column(column), value is None) for column, value in filters.items())
+        params = tuple(value for value in filters.values() if value is not None)
+        return shape, params
+    
+    def _build(self, key: Tuple, build) -> str:
+        """Собрать SQL формы key один раз"""
+        query = self._queries.get(key)
+        if query is None:
+            with self._lock:
+                query = self._queries.setdefault(key, build())
+        return query
+    
+    def _where_sql(self, shape) -> str:
+        if not shape:
+            return ''
+        return ' WHERE ' + ' AND '.join(
+            f'{column} IS NULL' if is_null else f'{column} = ?' for column, is_null in shape
+        )
+    
+    def select(self, where: Tuple = (), order: Tuple = (), limit: bool = False) -> str:
+        """SELECT * с условием формы where, порядком order и (если limit) LIMIT ?"""
+        def build():
+            query = f'SELECT * FROM {self.table}' + self._where_sql(where)
+            if order:
+                query += ' ORDER BY ' + ', '.join(
+                    f"{column} {'DESC' if descending else 'ASC'}" for column, descending in order
+                )
+            if limit:
+                query += ' LIMIT ?'
+            return query
+        return self._build(('select', where, order, limit), build)
+    
+    def count(self, where: Tuple = ()) -> str:
+        """SELECT COUNT(*) с условием формы where"""
+        return self._build(('count', where), lambda: f'SELECT COUNT(*) FROM {self.table}' + self._where_sql(where))
+    
+    def exists(self, where: Tuple = ()) -> str:
+        """Есть ли строка с условием формы where (останавливается на первой)"""
+        return self._build(
+            ('exists', where),
+            lambda: f'SELECT EXISTS (SELECT 1 FROM {self.table}{self._where_sql(where)})'
+        )
+    
+    def delete(self, where: Tuple) -> str:
+        """DELETE с условием формы where"""
+        if not where:
+            raise ValueError("Удаление без условия запрещено")
+        return self._build(('delete', where), lambda: f'DELETE FROM {self.table}' + self._where_sql(where))
+    
+    def cached_queries(self) -> int:
+        """Сколько форм запросов собрано"""
+        return len(self._queries)
+
+
+_builders: Dict[str, QueryBuilder] = {}
+_builders_lock = threading.Lock()
+
+
+def builder_for(db, table: str) -> QueryBuilder:
+    """Общий построитель таблицы (схема одинакова для всех файлов БД после миграций)"""
+    builder = _builders.get(table)
+    if builder is None:
+        conn = db.get_connection()
+        try:
+            builder = QueryBuilder.for_table(conn, table)
+        finally:
+            conn.close()
+        with _builders_lock:
+            builder = _builders.setdefault(table, builder)
+    return builder
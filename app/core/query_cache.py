@@ -0,0 +1,146 @@
+"""
+Кэш результатов запросов моделей
+Результат хранится в общем кэше (app/core/cache.py) с пометкой таблиц, которые читает
+запрос. В ключ кэша входят версии таблиц процесса и счетчики изменений таблиц в самой
+БД (change_counters, увеличиваются триггерами): запись через Database.write увеличивает
+версии затронутых таблиц, запись другого процесса или рабочего места - счетчики, и
+старые результаты больше не находятся (их вытеснит LRU). Счетчики БД при попадании
+берутся из памяти процесса и перечитываются при промахе или раз в COUNTER_TTL секунд,
+поэтому чужая запись видна не позже чем через COUNTER_TTL, а попадание не читает БД. Пометки - исходные таблицы:
+производные таблицы (проживания, счетчики заселенности) меняются только вместе с ними.
+Результаты с persist=True при запуске берутся из снимка на диске
+"""
+import itertools
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+from app.core import snapshot
+from app.core.cache import cache
+from app.core.snapshot import MISSING, read_counters
+
+# Счетчики изменений до и после операции записи (Database.write_counted)
+Change = Tuple[Dict[str, int], Dict[str, int]]
+
+_WRITE_TARGET = re.compile(
+    r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+(\w+)',
+    re.IGNORECASE
+)
+
+# Номера версий общие для всех файлов БД процесса, поэтому никогда не повторяются
+_counter = itertools.count(1)
+_lock = threading.Lock()
+# Файл БД -> (эпоха файла, {таблица: версия})
+_versions: Dict[str, Tuple[int, Dict[str, int]]] = {}
+
+# Сколько секунд прочитанные счетчики изменений БД считаются актуальными
+COUNTER_TTL = 1.0
+_clock = time.monotonic
+# Файл БД -> (момент чтения, счетчики изменений таблиц в БД)
+_counters: Dict[str, Tuple[float, Dict[str, int]]] = {}
+
+
+def write_target(statement: str) -> Optional[str]:
+    """Таблица, в которую пишет команда INSERT/REPLACE/UPDATE/DELETE (None - не определена)"""
+    match = _WRITE_TARGET.match(statement)
+    return match.group(1).lower() if match else None
+
+
+def _state(db_name: str) -> Tuple[int, Dict[str, int]]:
+    state = _versions.get(db_name)
+    if state is None:
+        state = _versions[db_name] = (next(_counter), {})
+    return state
+
+
+def versions(db_name: str, tables: Iterable[str]) -> Tuple[int, ...]:
+    """Эпоха файла и версии таблиц - часть ключа кэша"""
+    with _lock:
+        epoch, table_versions = _state(db_name)
+        return (epoch,) + tuple(table_versions.get(table, 0) for table in tables)
+
+
+def invalidate(db_name: str, tables: Optional[Iterable[str]] = None):
+    """Устарели результаты, читающие таблицы tables (None - все результаты файла БД)"""
+    with _lock:
+        # Своя запись изменила счетчики БД - следующее обращение перечитает их
+        _counters.pop(db_name, None)
+        if tables is None:
+            _versions[db_name] = (next(_counter), {})
+            return
+        table_versions = _state(db_name)[1]
+        for table in tables:
+            table_versions[table] = next(_counter)
+
+
+def counters(db, fresh: bool = False) -> Dict[str, int]:
+    """Счетчики изменений таблиц в БД
+
+    Прочитанные меньше COUNTER_TTL секунд назад берутся из памяти; fresh - прочитать из БД
+    (одно чтение маленькой таблицы)
+    """
+    now = _clock()
+    known = _counters.get(db.db_name)
+    if not fresh and known is not None and now - known[0] < COUNTER_TTL:
+        return known[1]
+    conn = db.get_connection()
+    try:
+        current = read_counters(conn)
+    finally:
+        conn.close()
+    with _lock:
+        _counters[db.db_name] = (now, current)
+    return current
+
+
+def db_versions(db, tables: Iterable[str]) -> Tuple[int, ...]:
+    """Эпоха файла и счетчики изменений таблиц в БД - метка индексов в памяти"""
+    tables = tuple(tables)
+    current = counters(db, fresh=True)
+    return versions(db.db_name, ()) + tuple(current.get(table, 0) for table in tables)
+
+
+def advance(db, stamp: Tuple[int, ...], tables: Iterable[str], change: Change) -> Optional[Tuple[int, ...]]:
+    """Метка после своей записи change, если до нее метка была актуальной; None - нет
+
+    Счетчики до и после записи читаются в ее транзакции, поэтому совпадение с меткой
+    означает, что других записей между построением индекса и этой записью не было
+    """
+    tables = tuple(tables)
+    before, after = change
+    epoch = versions(db.db_name, ())
+    if stamp != epoch + tuple(before.get(table, 0) for table in tables):
+        return None
+    return epoch + tuple(after.get(table, 0) for table in tables)
+
+
+def _key(db, name: str, tables: Tuple[str, ...], args: Tuple, fresh: bool = False) -> Tuple:
+    current = counters(db, fresh)
+    return ('query', db.db_name, name, args,
+            versions(db.db_name, tables) + tuple(current.get(table, 0) for table in tables))
+
+
+def cached(db, name: str, tables: Tuple[str, ...], loader: Callable[[], Any], *args: Hashable,
+           persist: bool = False) -> Any:
+    """Результат запроса name(*args), читающего tables, из кэша или loader()
+
+    persist - результат сохраняется в снимок для быстрого запуска (app/core/snapshot.py)
+    """
+    key = _key(db, name, tables, args)
+    if key not in cache:
+        # Промах: счетчики в памяти могли отстать от БД - ключ по прочитанным заново
+        key = _key(db, name, tables, args, fresh=True)
+    warm = snapshot.get(db.db_name) if persist else None
+    result = MISSING
+    if warm is not None and key not in cache:
+        def refresh():
+            value = loader()
+            cache.set(_key(db, name, tables, args, fresh=True), value)
+            return value
+        result = warm.take(name, args, tables, lambda: cached(db, name, tables, loader, *args), refresh)
+        if result is not MISSING:
+            cache.set(key, result)
+    if result is MISSING:
+        result = cache.get_or_load(key, loader)
+    # Список отдается копией, чтобы вызывающий код не менял закэшированный
+    return list(result) if isinstance(result, list) else result
@@ -0,0 +1,87 @@
+"""
+Журнал запросов
+Включается переменной окружения DORMITORY_QUERY_LOG или ключом query_log конфигурации
+(путь к файлу). Соединения пула передают выполняемые команды в журнал через
+set_trace_callback; значения заменяются на ?, одинаковые по форме запросы считаются вместе.
+Журнал сохраняется в файл при завершении процесса и читается советником по индексам
+"""
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+QUERY_LOG_ENV = 'DORMITORY_QUERY_LOG'
+
+# Сколько разных форм запросов хранится (остальные только считаются в dropped)
+MAX_STATEMENTS = 2000
+
+_KINDS = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])\d+(?:\.\d+)?(?![\w.])')
+_IN_LIST = re.compile(r'\bIN \(\?(?:, \?)*\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def normalize(statement: str) -> str:
+    """Форма запроса: литералы заменены на ?, список IN (...) сжат до IN (?)"""
+    statement = _STRING.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    statement = _SPACE.sub(' ', statement).strip()
+    return _IN_LIST.sub('IN (?)', statement)
+
+
+class QueryLog:
+    """Счетчик форм выполненных запросов"""
+    
+    def __init__(self, max_statements: int = MAX_STATEMENTS):
+        self.max_statements = max_statements
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+    
+    def record(self, statement: str):
+        """Обработчик set_trace_callback"""
+        # Команды триггеров приходят как комментарии '-- TRIGGER ...', служебные - BEGIN, PRAGMA
+        if not statement.lstrip()[:7].upper().startswith(_KINDS):
+            return
+        shape = normalize(statement)
+        with self._lock:
+            if shape in self._counts:
+                self._counts[shape] += 1
+            elif len(self._counts) < self.max_statements:
+                self._counts[shape] = 1
+            else:
+                self.dropped += 1
+    
+    def statements(self) -> List[Tuple[str, int]]:
+        """Формы запросов и число выполнений, частые первыми"""
+        with self._lock:
+            return sorted(self._counts.items(), key=lambda item: -item[1])
+    
+    def save(self, path: Union[str, Path]):
+        """Записать журнал в файл (строка JSON на запрос), добавив к сохраненному ранее"""
+        path = Path(path)
+        counts = dict(load(path)) if path.exists() else {}
+        for statement, count in self.statements():
+            counts[statement] = counts.get(statement, 0) + count
+        with open(path, 'w', encoding='utf-8') as f:
+            for statement, count in sorted(counts.items(), key=lambda item: -item[1]):
+                f.write(json.dumps({'sql': statement, 'count': count}, ensure_ascii=False) + '\n')
+
+
+def load(path: Union[str, Path]) -> List[Tuple[str, int]]:
+    """Прочитать журнал из файла"""
+    statements = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                statements.append((entry['sql'], int(entry.get('count', 1))))
+    return statements
+
+
+def log_path(config: Dict) -> Optional[str]:
+    """Файл журнала из окружения или конфигурации (None - журнал выключен)"""
+    return os.environ.get(QUERY_LOG_ENV) or config.get('query_log') or None
@@ -0,0 +1,86 @@
+"""
+Записи строк БД
+Классы записей строятся по TypedDict из type_hints: доступ по имени колонки,
+размер в памяти как у кортежа, индексы и распаковка работают как раньше
+"""
+import sqlite3
+import threading
+from collections import namedtuple
+from typing import Dict, Sequence, Tuple, Type
+from app.core.type_hints import (
+    StudentDict, CommandantDict, BuildingDict, RoomDict, CheckinDict, CheckoutDict
+)
+
+# Колонки, добавляемые запросами списков к колонкам таблиц
+_LIST_COLUMNS = {
+    'room_list': ('building_number', 'address'),
+    'checkin_list': ('student_name', 'commandant_name', 'room_number', 'floor', 'building_number', 'address'),
+    'active_checkin_list': ('student_name', 'room_number', 'floor', 'building_number', 'address'),
+}
+
+_tuple_new = tuple.__new__
+
+_classes: Dict[Tuple[str, ...], Type[tuple]] = {}
+_classes_lock = threading.Lock()
+
+
+def _field_names(typed_dict) -> Tuple[str, ...]:
+    """Имена колонок в порядке объявления TypedDict (он совпадает с порядком колонок таблицы)"""
+    return tuple(typed_dict.__annotations__)
+
+
+def define_record(name: str, columns: Sequence[str]) -> Type[tuple]:
+    """Зарегистрировать класс записи для набора колонок"""
+    columns = tuple(columns)
+    with _classes_lock:
+        cls = _classes.get(columns)
+        if cls is None:
+            # Повторяющиеся и недопустимые имена колонок переименовываются в _N
+            cls = namedtuple(name, columns, rename=True)
+            _classes[columns] = cls
+        return cls
+
+
+def record_class(columns: Sequence[str]) -> Type[tuple]:
+    """Класс записи для набора колонок (создается при первом обращении)"""
+    columns = tuple(columns)
+    cls = _classes.get(columns)
+    if cls is None:
+        cls = define_record('Record', columns)
+    return cls
+
+
+StudentRecord = define_record('StudentRecord', _field_names(StudentDict))
+CommandantRecord = define_record('CommandantRecord', _field_names(CommandantDict))
+BuildingRecord = define_record('BuildingRecord', _field_names(BuildingDict))
+RoomRecord = define_record('RoomRecord', _field_names(RoomDict))
+CheckinRecord = define_record('CheckinRecord', _field_names(CheckinDict))
+CheckoutRecord = define_record('CheckoutRecord', _field_names(CheckoutDict))
+
+RoomListRecord = define_record('RoomListRecord', RoomRecord._fields + _LIST_COLUMNS['room_list'])
+CheckinListRecord = define_record('CheckinListRecord', CheckinRecord._fields + _LIST_COLUMNS['checkin_list'])
+ActiveCheckinRecord = define_record(
+    'ActiveCheckinRecord', CheckinRecord._fields + _LIST_COLUMNS['active_checkin_list']
+)
+CheckoutListRecord = define_record('CheckoutListRecord', CheckoutRecord._fields + _LIST_COLUMNS['checkin_list'])
+
+# Последнее описание курсора и его класс: строки одного запроса имеют один объект description
+_last: Tuple[object, Type[tuple]] = (None, tuple)
+
+
+def record_factory(cursor: sqlite3.Cursor, row: tuple) -> tuple:
+    """row_factory: строка как запись с доступом по имени колонки"""
+    global _last
+    description = cursor.description
+    last = _last
+    if last[0] is description:
+        cls = last[1]
+    else:
+        cls = record_class([column[0] for column in description])
+        _last = (description, cls)
+    return _tuple_new(cls, row)
+
+
+def make_record(description: Sequence[Sequence], row: Sequence) -> tuple:
+    """Запись из кортежа значений и описания колонок курсора"""
+    return _tuple_new(record_class([column[0] for column in description]), row)
@@ -0,0 +1,157 @@
+"""
+Таблица проживаний
+Одна строка на заселение вместе с выселением; поддерживается триггерами на
+checkins и checkouts. Частичные индексы по checkout_date IS NULL содержат только
+текущих жильцов, поэтому запросы по активным проживаниям не зависят от объема истории.
+Индекс интервалов (R-дерево) находит проживания на заданную дату
+"""
+import sqlite3
+from typing import List
+
+RESIDENCY_SCHEMA: List[str] = [
+    '''
+    CREATE TABLE IF NOT EXISTS residencies (
+        checkin_id INTEGER PRIMARY KEY,
+        student_id INTEGER NOT NULL,
+        room_id INTEGER NOT NULL,
+        checkin_commandant_id INTEGER NOT NULL,
+        checkin_date TEXT NOT NULL,
+        checkout_id INTEGER,
+        checkout_commandant_id INTEGER,
+        checkout_date TEXT
+    )
+    ''',
+    # Частичные индексы: только активные проживания
+    '''
+    CREATE INDEX IF NOT EXISTS idx_residencies_active
+    ON residencies(checkin_date) WHERE checkout_date IS NULL
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_residencies_active_room
+    ON residencies(room_id, checkin_date) WHERE checkout_date IS NULL
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_residencies_active_student
+    ON residencies(student_id) WHERE checkout_date IS NULL
+    ''',
+    # Заселения
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_checkins_residency_insert AFTER INSERT ON checkins
+    BEGIN
+        INSERT INTO residencies (checkin_id, student_id, room_id, checkin_commandant_id, checkin_date)
+        VALUES (NEW.id, NEW.student_id, NEW.room_id, NEW.commandant_id, NEW.checkin_date);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_checkins_residency_update AFTER UPDATE ON checkins
+    BEGIN
+        UPDATE residencies
+        SET checkin_id = NEW.id, student_id = NEW.student_id, room_id = NEW.room_id,
+            checkin_commandant_id = NEW.commandant_id, checkin_date = NEW.checkin_date
+        WHERE checkin_id = OLD.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_checkins_residency_delete AFTER DELETE ON checkins
+    BEGIN
+        DELETE FROM residencies WHERE checkin_id = OLD.id;
+    END
+    ''',
+    # Выселения
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_checkouts_residency_insert AFTER INSERT ON checkouts
+    BEGIN
+        UPDATE residencies
+        SET checkout_id = NEW.id, checkout_commandant_id = NEW.commandant_id,
+            checkout_date = NEW.checkout_date
+        WHERE checkin_id = NEW.checkin_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_checkouts_residency_update AFTER UPDATE ON checkouts
+    BEGIN
+        UPDATE residencies
+        SET checkout_id = NULL, checkout_commandant_id = NULL, checkout_date = NULL
+        WHERE checkin_id = OLD.checkin_id;
+        UPDATE residencies
+        SET checkout_id = NEW.id, checkout_commandant_id = NEW.commandant_id,
+            checkout_date = NEW.checkout_date
+        WHERE checkin_id = NEW.checkin_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_checkouts_residency_delete AFTER DELETE ON checkouts
+    BEGIN
+        UPDATE residencies
+        SET checkout_id = NULL, checkout_commandant_id = NULL, checkout_date = NULL
+        WHERE checkin_id = OLD.checkin_id;
+    END
+    ''',
+]
+
+
+def rebuild_residencies(conn: sqlite3.Connection):
+    """Заполнить таблицу проживаний по заселениям и выселениям"""
+    conn.execute('DELETE FROM residencies')
+    conn.execute('''
+        INSERT INTO residencies (
+            checkin_id, student_id, room_id, checkin_commandant_id, checkin_date,
+            checkout_id, checkout_commandant_id, checkout_date
+        )
+        SELECT c.id, c.student_id, c.room_id, c.commandant_id, c.checkin_date,
+               co.id, co.commandant_id, co.checkout_date
+        FROM checkins c
+        LEFT JOIN checkouts co ON co.checkin_id = c.id
+    ''')
+
+
+# Последний день открытого (без выселения) проживания в индексе интервалов
+OPEN_DAY = 2 ** 31 - 1
+
+# Интервал проживания [день заселения, день выселения] (оба дня включительно);
+# дата выселения раньше даты заселения сводится к одному дню. Проживание с непонятной
+# датой заселения (checkin_day IS NULL) в индекс не входит: его нельзя отнести ни к одной дате
+_INTERVAL = '''
+    INSERT INTO residency_intervals (checkin_id, first_day, last_day)
+    SELECT NEW.checkin_id, NEW.checkin_day, COALESCE(MAX(NEW.checkin_day, NEW.checkout_day), {open_day})
+    WHERE NEW.checkin_day IS NOT NULL;
+'''.format(open_day=OPEN_DAY)
+
+# Индекс интервалов проживаний (R-дерево): поиск проживаний, пересекающих дату,
+# читает только их, а не всю историю до или после этой даты
+INTERVAL_SCHEMA: List[str] = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS residency_intervals USING rtree_i32(checkin_id, first_day, last_day)',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_residencies_interval_insert AFTER INSERT ON residencies
+    BEGIN
+        {_INTERVAL}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_residencies_interval_update
+    AFTER UPDATE OF checkin_id, checkin_date, checkout_date ON residencies
+    BEGIN
+        DELETE FROM residency_intervals WHERE checkin_id = OLD.checkin_id;
+        {_INTERVAL}
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_residencies_interval_delete AFTER DELETE ON residencies
+    BEGIN
+        DELETE FROM residency_intervals WHERE checkin_id = OLD.checkin_id;
+    END
+    ''',
+    # История проживаний комнаты
+    'CREATE INDEX IF NOT EXISTS idx_residencies_room ON residencies(room_id, checkin_day)',
+]
+
+
+def rebuild_intervals(conn: sqlite3.Connection):
+    """Заполнить индекс интервалов по таблице проживаний"""
+    conn.execute('DELETE FROM residency_intervals')
+    conn.execute(f'''
+        INSERT INTO residency_intervals (checkin_id, first_day, last_day)
+        SELECT checkin_id, checkin_day, COALESCE(MAX(checkin_day, checkout_day), {OPEN_DAY})
+        FROM residencies
+        WHERE checkin_day IS NOT NULL
+    ''')
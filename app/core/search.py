@@ -0,0 +1,112 @@
+"""
+Полнотекстовый поиск (FTS5)
+Индексы FTS5 по ФИО студентов и комендантов и адресам корпусов хранят только термы
+(content= ссылается на исходную таблицу) и поддерживаются триггерами. Поиск по префиксу
+идет по индексу, а не перебором строк
+"""
+import re
+import sqlite3
+from typing import Any, Dict, List, Optional, Sequence
+
+SEARCH_LIMIT = 200
+# Больше совпадений не ранжируется по bm25 (оценка считается для каждого совпадения)
+RANK_LIMIT = 500
+
+# Таблица -> индексируемые колонки
+SEARCH_COLUMNS: Dict[str, Sequence[str]] = {
+    'students': ('surname', 'name', 'patronymic', 'group_number'),
+    'commandants': ('surname', 'name', 'patronymic'),
+    'buildings': ('address',),
+}
+
+_TOKEN = re.compile(r'\w+')
+
+
+def _index_schema(table: str, columns: Sequence[str]) -> List[str]:
+    """Индекс FTS5 таблицы и триггеры синхронизации"""
+    fts = f'{table}_fts'
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'NEW.{column}' for column in columns)
+    old_values = ', '.join(f'OLD.{column}' for column in columns)
+    # Удаление из индекса с внешним содержимым - служебная команда 'delete' со старыми значениями
+    delete_old = (
+        f"INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', OLD.id, {old_values});"
+    )
+    insert_new = f'INSERT INTO {fts} (rowid, {column_list}) VALUES (NEW.id, {new_values});'
+    return [
+        f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {column_list}, content='{table}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+        )
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_insert AFTER INSERT ON {table}
+        BEGIN
+            {insert_new}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_update
+        AFTER UPDATE OF {column_list} ON {table}
+        BEGIN
+            {delete_old}
+            {insert_new}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_delete AFTER DELETE ON {table}
+        BEGIN
+            {delete_old}
+        END
+        ''',
+    ]
+
+
+SEARCH_SCHEMA: List[str] = [
+    statement for table, columns in SEARCH_COLUMNS.items() for statement in _index_schema(table, columns)
+]
+
+
+def rebuild_search(conn: sqlite3.Connection):
+    """Перестроить индексы по содержимому таблиц"""
+    for table in SEARCH_COLUMNS:
+        conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+
+def match_query(text: Optional[str]) -> Optional[str]:
+    """Запрос MATCH: каждое слово текста - префикс (None, если слов нет)
+
+    Слова берутся в кавычки, поэтому операторы FTS5 во вводе пользователя
+    не интерпретируются
+    """
+    terms = _TOKEN.findall(text or '')
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_ids(table: str) -> str:
+    """Подзапрос id строк таблицы, подходящих под MATCH ?"""
+    return f'SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ?'
+
+
+def search_rows(conn: sqlite3.Connection, table: str, text: Optional[str],
+                limit: Optional[int] = SEARCH_LIMIT) -> List[Any]:
+    """Строки table, слова которых начинаются со слов text, по релевантности (bm25)
+
+    Оценка bm25 считается для каждой подходящей строки, поэтому слишком общий запрос
+    (больше RANK_LIMIT совпадений, например одна буква) не ранжируется: возвращаются
+    первые limit совпадений в порядке id (так их отдает индекс, без сортировки).
+    limit=None - все совпадения
+    """
+    query = match_query(text)
+    if query is None:
+        return []
+    matches = conn.execute(f'{search_ids(table)} LIMIT ?', (query, RANK_LIMIT + 1)).fetchall()
+    order = 'f.rank, f.rowid' if len(matches) <= RANK_LIMIT else 'f.rowid'
+    return conn.execute(
+        f'SELECT t.* FROM {table}_fts f JOIN {table} t ON t.id = f.rowid '
+        f'WHERE {table}_fts MATCH ? ORDER BY {order} LIMIT ?',
+        (query, -1 if limit is None else limit)
+    ).fetchall()
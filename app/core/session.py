@@ -0,0 +1,53 @@
+"""
+Сессия приложения
+Владеет слоем данных (БД, пул соединений, кэш, модели) и передает его окнам и диалогам
+"""
+import threading
+from typing import Optional
+from app.database import Database
+from app.core.db_manager import DatabaseManager
+from app.core.cache import cache
+from app.models import (
+    StudentModel, CommandantModel, BuildingModel, RoomModel, CheckinModel, CheckoutModel
+)
+from app.utils.statistics import Statistics
+
+
+class AppSession:
+    """Общий слой данных для всех окон и диалогов"""
+    
+    _current: Optional['AppSession'] = None
+    _lock = threading.Lock()
+    
+    def __init__(self, db: Optional[Database] = None):
+        self.db = db or Database()
+        self.db_manager = DatabaseManager()
+        self.cache = cache
+        
+        self.students = StudentModel(self.db)
+        self.commandants = CommandantModel(self.db)
+        self.buildings = BuildingModel(self.db)
+        self.rooms = RoomModel(self.db)
+        self.checkins = CheckinModel(self.db)
+        self.checkouts = CheckoutModel(self.db)
+        self.statistics = Statistics(self)
+    
+    @property
+    def pool(self):
+        """Пул соединений БД сессии"""
+        return self.db.pool
+    
+    @classmethod
+    def current(cls) -> 'AppSession':
+        """Текущая сессия (создается при первом обращении)"""
+        if cls._current is None:
+            with cls._lock:
+                if cls._current is None:
+                    cls._current = cls()
+        return cls._current
+    
+    @classmethod
+    def set_current(cls, session: Optional['AppSession']):
+        """Установить текущую сессию (None - сбросить)"""
+        with cls._lock:
+            cls._current = session
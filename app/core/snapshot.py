@@ -0,0 +1,245 @@
+"""
+Снимок кэша для быстрого запуска
+Справочные данные и статистика панели управления (запросы моделей с persist=True)
+сохраняются в файл рядом с БД: заголовок и сжатый zlib marshal строк. Для каждой
+записи снимка хранятся счетчики изменений ее таблиц (таблица change_counters,
+увеличивается триггерами). При запуске окна сразу получают данные снимка; записи,
+таблицы которых изменились, перечитываются в фоне (reconcile)
+"""
+import atexit
+import marshal
+import os
+import struct
+import threading
+import zlib
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+from app.core.records import record_class
+from app.utils.logger import setup_logger
+
+logger = setup_logger('snapshot')
+
+SNAPSHOT_SUFFIX = '.snapshot'
+# Переменная окружения со значением 0 выключает снимок
+SNAPSHOT_ENV = 'DORMITORY_SNAPSHOT'
+
+# Исходные таблицы со счетчиками изменений
+COUNTED_TABLES = ('students', 'commandants', 'buildings', 'rooms', 'checkins', 'checkouts')
+
+_MAGIC = b'DSNP'
+_FORMAT_VERSION = 1
+# Сигнатура, версия формата, версия marshal, версия схемы БД
+_HEADER = struct.Struct('<4sBHI')
+
+MISSING = object()
+
+Key = Tuple[str, Tuple[Hashable, ...]]
+
+
+def _counter_triggers(table: str) -> List[str]:
+    bump = f"UPDATE change_counters SET counter = counter + 1 WHERE name = '{table}';"
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_count_{event.lower()} AFTER {event} ON {table}
+        BEGIN
+            {bump}
+        END
+        '''
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ]
+
+
+CHANGE_COUNTER_SCHEMA: List[str] = [
+    '''
+    CREATE TABLE IF NOT EXISTS change_counters (
+        name TEXT PRIMARY KEY,
+        counter INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''',
+    'INSERT OR IGNORE INTO change_counters (name) VALUES ' + ', '.join(f"('{t}')" for t in COUNTED_TABLES),
+] + [statement for table in COUNTED_TABLES for statement in _counter_triggers(table)]
+
+
+def snapshot_path(db_name: str) -> str:
+    return db_name + SNAPSHOT_SUFFIX
+
+
+def read_counters(conn) -> Dict[str, int]:
+    """Счетчики изменений таблиц (видны записи всех процессов, работающих с файлом БД)"""
+    return dict(tuple(row) for row in conn.execute('SELECT name, counter FROM change_counters'))
+
+
+def read_state(conn) -> Tuple[int, Dict[str, int]]:
+    """Версия схемы и счетчики изменений таблиц"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    return version, read_counters(conn)
+
+
+def encode(value: Any) -> Tuple[str, Any, Any]:
+    """Значение для marshal: список записей хранится как колонки и кортежи"""
+    if isinstance(value, list) and value and hasattr(value[0], '_fields'):
+        return 'records', tuple(value[0]._fields), [tuple(row) for row in value]
+    if isinstance(value, tuple) and hasattr(value, '_fields'):
+        return 'record', tuple(value._fields), tuple(value)
+    return 'value', None, value
+
+
+def decode(kind: str, columns: Optional[Sequence[str]], data: Any) -> Any:
+    if kind == 'records':
+        cls = record_class(columns)
+        return [cls._make(row) for row in data]
+    if kind == 'record':
+        return record_class(columns)._make(data)
+    return data
+
+
+def write_file(path: str, version: int, entries: Dict[Key, Tuple]):
+    """Записать снимок атомарно (через временный файл)"""
+    payload = [
+        (name, args, tables, counters, *encode(value))
+        for (name, args), (tables, counters, value) in entries.items()
+    ]
+    body = zlib.compress(marshal.dumps(payload))
+    temp = f'{path}.tmp'
+    with open(temp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, marshal.version, version))
+        f.write(body)
+    os.replace(temp, path)
+
+
+def read_file(path: str, version: int) -> Dict[Key, Tuple]:
+    """Записи снимка: (имя, аргументы) -> (таблицы, их счетчики, значение); {} - снимка нет или он не подходит"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, format_version, marshal_version, schema = _HEADER.unpack_from(data)
+        if (magic, format_version, marshal_version, schema) != (_MAGIC, _FORMAT_VERSION, marshal.version, version):
+            return {}
+        payload = marshal.loads(zlib.decompress(data[_HEADER.size:]))
+        return {
+            (name, tuple(args)): (tuple(tables), tuple(counters), decode(kind, columns, value))
+            for name, args, tables, counters, kind, columns, value in payload
+        }
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"Снимок {path} не прочитан: {e}")
+        return {}
+
+
+class Snapshot:
+    """Снимок файла БД: записи с диска и запросы, которые сохраняются при следующей записи"""
+    
+    def __init__(self, db, version: int, counters: Dict[str, int], entries: Dict[Key, Tuple]):
+        self.db = db
+        self.path = snapshot_path(db.db_name)
+        self.version = version
+        self.counters = counters
+        self._entries = entries
+        # Сохраняемые запросы: ключ -> (таблицы, текущее значение, свежее значение)
+        self._queries: Dict[Key, Tuple[Tuple[str, ...], Callable[[], Any], Callable[[], Any]]] = {}
+        # Выданные устаревшие записи: ключ -> выданное значение
+        self._stale: Dict[Key, Any] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+    
+    def _current(self, tables: Sequence[str]) -> Tuple[int, ...]:
+        return tuple(self.counters.get(table, 0) for table in tables)
+    
+    def take(self, name: str, args: Tuple, tables: Tuple[str, ...],
+             current: Callable[[], Any], refresh: Callable[[], Any]) -> Any:
+        """Значение запроса из снимка (MISSING - нет) и регистрация запроса для сохранения
+        
+        current() - значение из кэша или БД, refresh() - перечитать из БД и обновить кэш
+        """
+        key = (name, args)
+        with self._lock:
+            self._queries[key] = (tables, current, refresh)
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return MISSING
+            _, counters, value = entry
+            self.hits += 1
+            if counters != self._current(tables):
+                self._stale[key] = value
+        return value
+    
+    def reconcile(self) -> bool:
+        """Перечитать выданные устаревшие записи и сохранить снимок; True - данные изменились"""
+        with self._lock:
+            stale, self._stale = self._stale, {}
+            queries = dict(self._queries)
+        changed = False
+        for key, served in stale.items():
+            if queries[key][2]() != served:
+                changed = True
+        self.save()
+        return changed
+    
+    def save(self):
+        """Записать снимок: текущие значения сохраняемых запросов со счетчиками их таблиц"""
+        with self._lock:
+            queries = dict(self._queries)
+        if not queries:
+            return
+        entries: Dict[Key, Tuple] = {}
+        conn = self.db.get_connection()
+        try:
+            version, before = read_state(conn)
+            values = {key: current() for key, (tables, current, refresh) in queries.items()}
+            after = read_state(conn)[1]
+        finally:
+            conn.close()
+        with self._lock:
+            # Записи снимка, которые в этом запуске не запрашивались, но еще действительны
+            for key, (tables, counters, value) in self._entries.items():
+                if counters == tuple(before.get(table, 0) for table in tables):
+                    entries[key] = (tables, counters, value)
+        for key, value in values.items():
+            tables = queries[key][0]
+            counters = tuple(before.get(table, 0) for table in tables)
+            # Таблица изменилась во время чтения - запись не сохраняется
+            if counters == tuple(after.get(table, 0) for table in tables):
+                entries[key] = (tables, counters, value)
+        try:
+            write_file(self.path, version, entries)
+        except OSError as e:
+            logger.warning(f"Снимок {self.path} не сохранен: {e}")
+
+
+_snapshots: Dict[str, Snapshot] = {}
+_snapshots_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return os.environ.get(SNAPSHOT_ENV, '1') != '0'
+
+
+def warm_start(db) -> Optional[Snapshot]:
+    """Прочитать снимок файла БД; он сохраняется снова при завершении процесса"""
+    if not enabled():
+        return None
+    with _snapshots_lock:
+        snapshot = _snapshots.get(db.db_name)
+        if snapshot is not None:
+            return snapshot
+        conn = db.get_connection()
+        try:
+            version, counters = read_state(conn)
+        finally:
+            conn.close()
+        snapshot = Snapshot(db, version, counters, read_file(snapshot_path(db.db_name), version))
+        _snapshots[db.db_name] = snapshot
+    atexit.register(_save_at_exit, snapshot)
+    return snapshot
+
+
+def _save_at_exit(snapshot: Snapshot):
+    try:
+        snapshot.save()
+    except Exception as e:
+        logger.warning(f"Снимок {snapshot.path} не сохранен: {e}")
+
+
+def get(db_name: str) -> Optional[Snapshot]:
+    """Снимок, прочитанный для файла БД при запуске (None - не читался)"""
+    return _snapshots.get(db_name)
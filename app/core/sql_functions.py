@@ -0,0 +1,81 @@
+"""
+Функции SQL, регистрируемые на каждом соединении
+Встроенные LOWER, LIKE и NOCASE SQLite работают только с ASCII; ufold() дает ключ
+сравнения без учета регистра для любых букв, включая кириллицу;
+natural_key() дает ключ естественного порядка номеров комнат и корпусов.
+Функции детерминированы, поэтому по ним строятся индексы на выражениях
+"""
+import re
+import sqlite3
+import unicodedata
+from typing import List, Optional
+
+_NON_DIGITS = re.compile(r'\D')
+_NUMBER_PARTS = re.compile(r'(\d+)')
+
+
+def ufold(value: Optional[str]) -> Optional[str]:
+    """Ключ сравнения без учета регистра: NFKC, casefold, ё = е"""
+    if value is None:
+        return None
+    return unicodedata.normalize('NFKC', str(value)).casefold().replace('ё', 'е')
+
+
+def normalize_phone(value: Optional[str]) -> Optional[str]:
+    """Только цифры телефона; российский номер с 8 в начале приводится к 7"""
+    if value is None:
+        return None
+    digits = _NON_DIGITS.sub('', str(value))
+    if len(digits) == 11 and digits[0] == '8':
+        digits = '7' + digits[1:]
+    return digits
+
+
+def natural_key(value: Optional[str]) -> Optional[str]:
+    """Ключ естественного порядка номеров: '9' < '10', '2' < '2а' < '2б' < '10'
+
+    Каждое число записывается с двузначной длиной впереди ('9' -> '019', '10' -> '0210'),
+    поэтому обычное сравнение ключей сравнивает числа по значению; текст - как в ufold()
+    """
+    if value is None:
+        return None
+    parts = _NUMBER_PARTS.split(ufold(value).strip())
+    key = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            digits = part.lstrip('0') or '0'
+            key.append(f'{len(digits):02d}{digits}')
+        else:
+            key.append(part)
+    return ''.join(key)
+
+
+def natural_key_schema(table: str, column: str, key: str = 'number_key') -> List[str]:
+    """Колонка ключа естественного порядка, ее заполнение и триггеры записи
+
+    Ключ хранится, а не вычисляется: индекс по вычисляемой колонке не бывает покрывающим
+    """
+    update = f'UPDATE {table} SET {key} = natural_key(NEW.{column}) WHERE id = NEW.id;'
+    return [
+        f'ALTER TABLE {table} ADD COLUMN {key} TEXT',
+        f'UPDATE {table} SET {key} = natural_key({column})',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_{key}_insert AFTER INSERT ON {table}
+        BEGIN
+            {update}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_{key}_update AFTER UPDATE OF {column} ON {table}
+        BEGIN
+            {update}
+        END
+        ''',
+    ]
+
+
+def register_functions(conn: sqlite3.Connection):
+    """Зарегистрировать функции на соединении"""
+    conn.create_function('ufold', 1, ufold, deterministic=True)
+    conn.create_function('normalize_phone', 1, normalize_phone, deterministic=True)
+    conn.create_function('natural_key', 1, natural_key, deterministic=True)
@@ -0,0 +1,42 @@
+"""
+Потоковое чтение строк
+Строки читаются из открытого курсора пачками fetchmany, поэтому экспорт и отчеты
+по всей истории заселений работают с постоянным объемом памяти
+"""
+import sqlite3
+from typing import Any, Iterator, Optional, Sequence
+
+BATCH_SIZE = 500
+
+
+def iter_cursor(cursor: sqlite3.Cursor, batch_size: int = BATCH_SIZE) -> Iterator[Any]:
+    """Строки курсора пачками по batch_size; курсор закрывается и при досрочной остановке"""
+    if batch_size <= 0:
+        raise ValueError("Размер пачки должен быть положительным")
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def iter_query(db, query: str, params: Sequence[Any] = (), batch_size: int = BATCH_SIZE,
+               row_factory: Optional[Any] = None) -> Iterator[Any]:
+    """Выполнить запрос и отдавать строки по мере чтения
+    
+    Соединение пула занято, пока итерация не завершена или генератор не закрыт.
+    В режиме журнала отката (профиль desktop-safe) запись ждет окончания чтения,
+    поэтому генератор стоит дочитывать или закрывать сразу (close() или contextlib.closing)
+    """
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        if row_factory is not None:
+            cursor.row_factory = row_factory
+        cursor.execute(query, params)
+        yield from iter_cursor(cursor, batch_size)
+    finally:
+        conn.close()
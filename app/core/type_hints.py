@@ -32,6 +32,7 @@ class BuildingDict(TypedDict, total=False):
     building_number: str
     address: str
     floors_count: int
+    number_key: str
 
 
 class RoomDict(TypedDict, total=False):
@@ -42,6 +43,7 @@ class RoomDict(TypedDict, total=False):
     room_number: str
     capacity: int
     area: Optional[float]
+    number_key: str
 
 
 class CheckinDict(TypedDict, total=False):
@@ -51,6 +53,7 @@ class CheckinDict(TypedDict, total=False):
     commandant_id: int
     room_id: int
     checkin_date: str
+    checkin_day: Optional[int]
 
 
 class CheckoutDict(TypedDict, total=False):
@@ -59,4 +62,5 @@ class CheckoutDict(TypedDict, total=False):
     checkin_id: int
     commandant_id: int
     checkout_date: str
+    checkout_day: Optional[int]
 
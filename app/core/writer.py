@@ -0,0 +1,200 @@
+"""
+Поток записи в БД
+Все операции записи выполняются одним потоком; операции, пришедшие почти
+одновременно, объединяются в одну транзакцию (group commit)
+"""
+import atexit
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.utils.logger import setup_logger
+
+logger = setup_logger('writer')
+
+WriteOperation = Callable[[sqlite3.Connection], Any]
+
+_STOP = object()
+
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+
+# Наибольшее ожидание результата записи, с (повторы при блокировке укладываются в несколько секунд)
+WRITE_TIMEOUT = 30.0
+
+
+def is_busy_error(error: BaseException) -> bool:
+    """Ошибка означает, что БД занята другим соединением"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xFF in (SQLITE_BUSY, SQLITE_LOCKED)
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+class DatabaseWriter:
+    """Единственный поток записи в файл БД с групповой фиксацией и повтором при SQLITE_BUSY"""
+    
+    def __init__(self, pool, group_window: float = 0.002, max_batch: int = 64,
+                 max_retries: int = 8, retry_delay: float = 0.01, max_retry_delay: float = 0.5):
+        self.pool = pool
+        self.group_window = group_window
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._queue: 'queue.Queue' = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_ident: Optional[int] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+        self._stats = {
+            'operations': 0,
+            'batches': 0,
+            'max_batch': 0,
+            'retries': 0,
+            'failed_batches': 0,
+        }
+    
+    def _ensure_started(self):
+        """Запустить поток записи при первой операции"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+    
+    def submit(self, operation: WriteOperation) -> Future:
+        """Поставить операцию записи в очередь; результат - Future"""
+        if threading.get_ident() == self._thread_ident and self._conn is not None:
+            # Вложенная запись из потока записи выполняется в текущей транзакции
+            future: Future = Future()
+            try:
+                future.set_result(operation(self._conn))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        future = Future()
+        self._ensure_started()
+        self._queue.put((operation, future))
+        return future
+    
+    def execute(self, query: str, params: Tuple = ()) -> Future:
+        """Поставить в очередь одну SQL-команду; результат - lastrowid"""
+        return self.submit(lambda conn: conn.execute(query, params).lastrowid)
+    
+    def stop(self, timeout: Optional[float] = 5.0):
+        """Дождаться выполнения очереди и остановить поток"""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Статистика: операции, транзакции, размер группы, повторы"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['avg_batch'] = stats['operations'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+    
+    def _run(self):
+        """Основной цикл потока записи"""
+        self._thread_ident = threading.get_ident()
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.group_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._process(batch)
+    
+    def _process(self, batch: List[Tuple[WriteOperation, Future]]):
+        """Выполнить группу операций в одной транзакции с повтором при блокировке"""
+        batch = [(op, future) for op, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        attempt = 0
+        while True:
+            try:
+                results = self._run_batch(batch)
+                break
+            except Exception as e:
+                if is_busy_error(e) and attempt < self.max_retries:
+                    attempt += 1
+                    delay = min(self.retry_delay * (2 ** (attempt - 1)), self.max_retry_delay)
+                    with self._lock:
+                        self._stats['retries'] += 1
+                    logger.warning(f"БД занята, повтор {attempt}/{self.max_retries} через {delay:.3f} с")
+                    time.sleep(delay * (0.5 + random.random() / 2))
+                    continue
+                logger.error(f"Ошибка транзакции записи: {e}")
+                with self._lock:
+                    self._stats['failed_batches'] += 1
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+        
+        with self._lock:
+            self._stats['operations'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['max_batch'] = max(self._stats['max_batch'], len(batch))
+        for (_, future), (ok, value) in zip(batch, results):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+    
+    def _run_batch(self, batch: List[Tuple[WriteOperation, Future]]) -> List[Tuple[bool, Any]]:
+        """Одна транзакция BEGIN IMMEDIATE; каждая операция - в своей точке сохранения"""
+        conn = self.pool.acquire()
+        self._conn = conn
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            results: List[Tuple[bool, Any]] = []
+            try:
+                for operation, _ in batch:
+                    conn.execute('SAVEPOINT write_op')
+                    try:
+                        value = operation(conn)
+                    except Exception as e:
+                        if is_busy_error(e):
+                            raise
+                        # Ошибка одной операции не отменяет остальные операции группы
+                        conn.execute('ROLLBACK TO write_op')
+                        conn.execute('RELEASE write_op')
+                        results.append((False, e))
+                    else:
+                        conn.execute('RELEASE write_op')
+                        results.append((True, value))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            return results
+        finally:
+            self._conn = None
+            conn.close()
@@ -7,13 +7,57 @@ from app.utils.validators import (
     validate_area, ValidationError
 )
 from app.utils.logger import setup_logger
+from app.utils.exceptions import BusinessRuleException
+from app.core.pagination import Ordering, PAGE_SIZE, fetch_page
+from app.core.streaming import BATCH_SIZE, iter_query
+from app.core import availability, facets, identity_map
+from app.core.dates import day_key, day_range, to_day, to_text
+from app.core.search import SEARCH_LIMIT, match_query, search_ids, search_rows
+from app.core.query_cache import cached
 
 logger = setup_logger('models')
 
+# Порядок ФИО без учета регистра (индексы idx_*_name_fold)
+NAME_ORDER = ('ufold(surname)', 'ufold(name)', 'id')
+NAME_SQL = ', '.join(NAME_ORDER)
+
+# Исходные таблицы, которые читают запросы (пометки кэша запросов)
+ROOM_TABLES = ('rooms', 'buildings')
+OCCUPANCY_TABLES = ('rooms', 'checkins', 'checkouts')
+CHECKIN_TABLES = ('checkins', 'students', 'commandants', 'rooms', 'buildings')
+CHECKOUT_TABLES = ('checkouts',) + CHECKIN_TABLES
+ACTIVE_TABLES = ('checkins', 'checkouts', 'students', 'rooms', 'buildings')
+
+
+def is_foreign_key_error(error):
+    """Нарушено ограничение внешнего ключа (PRAGMA foreign_keys = ON)"""
+    return isinstance(error, sqlite3.IntegrityError) and 'FOREIGN KEY' in str(error).upper()
+
+
+def is_unique_error(error):
+    """Нарушено ограничение уникальности"""
+    return isinstance(error, sqlite3.IntegrityError) and 'UNIQUE' in str(error).upper()
+
+
+def room_gender(male, female):
+    """Пол проживающих по счетчикам комнаты: 'М', 'Ж', None (пусто) или 'MIXED'"""
+    if male and female:
+        return 'MIXED'  # Разные полы (не должно быть, но на всякий случай)
+    if male:
+        return 'М'
+    if female:
+        return 'Ж'
+    return None
+
 
 class StudentModel:
-    def __init__(self):
-        self.db = Database()
+    PAGE_ORDERS = {
+        'name': Ordering(NAME_ORDER),
+        'id': Ordering(('id',)),
+    }
+    
+    def __init__(self, db=None):
+        self.db = db or Database()
     
     def create(self, surname, name, patronymic, gender, phone, email, group_number):
         # Валидация
@@ -27,34 +71,65 @@ class StudentModel:
             validate_email(email)
         validate_group_number(group_number)
         
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute('''
+            student_id, change = self.db.write_counted(lambda conn: conn.execute('''
                 INSERT INTO students (surname, name, patronymic, gender, phone, email, group_number)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
             ''', (surname.strip(), name.strip(), patronymic.strip() if patronymic else None, 
-                  gender, phone.strip(), email.strip() if email else None, group_number.strip()))
-            conn.commit()
-            student_id = cursor.lastrowid
+                  gender, phone.strip(), email.strip() if email else None, group_number.strip())
+            ).lastrowid, ('students',))
             logger.info(f"Создан студент ID: {student_id}")
+            facets.student_changed(self.db, student_id, change)
             return student_id
         except Exception as e:
-            conn.rollback()
             logger.error(f"Ошибка создания студента: {e}")
             raise
-        finally:
-            conn.close()
     
     def get_all(self):
+        return cached(self.db, 'students.get_all', ('students',), self._load_all)
+    
+    def _load_all(self):
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM students ORDER BY surname, name')
+        cursor.execute(f'SELECT * FROM students ORDER BY {NAME_SQL}')
         students = cursor.fetchall()
         conn.close()
         return students
     
+    def iter_all(self, batch_size=BATCH_SIZE):
+        """Все студенты в порядке get_all, пачками из открытого курсора"""
+        return iter_query(self.db, f'SELECT * FROM students ORDER BY {NAME_SQL}', batch_size=batch_size)
+    
+    def page(self, after_key=None, limit=PAGE_SIZE, order='name'):
+        """Страница студентов после токена after_key"""
+        conn = self.db.get_connection()
+        try:
+            return fetch_page(conn, '*', 'students', self.PAGE_ORDERS, order, after_key, limit)
+        finally:
+            conn.close()
+    
+    def search(self, text, limit=SEARCH_LIMIT):
+        """Поиск студентов по началу слов ФИО и группы, по релевантности (limit=None - все совпадения)"""
+        conn = self.db.get_connection()
+        try:
+            return search_rows(conn, 'students', text, limit)
+        finally:
+            conn.close()
+    
+    def find_by_phone(self, phone):
+        """Студенты с этим номером телефона в любой записи (+7 (900) 123-45-67, 89001234567)"""
+        conn = self.db.get_connection()
+        try:
+            return conn.execute(
+                'SELECT * FROM students WHERE normalize_phone(phone) = normalize_phone(?) ORDER BY id', (phone,)
+            ).fetchall()
+        finally:
+            conn.close()
+    
     def get_by_id(self, student_id):
+        return identity_map.get_one('students', student_id, self._load_by_id)
+    
+    def _load_by_id(self, student_id):
         conn = self.db.get_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM students WHERE id = ?', (student_id,))
@@ -62,6 +137,12 @@ class StudentModel:
         conn.close()
         return student
     
+    def get_many(self, ids):
+        """Записи по списку id: {id: запись} (один запрос на пачку id)"""
+        return identity_map.get_many('students', ids, lambda missing: identity_map.fetch_many(
+            self.db, 'SELECT * FROM students WHERE id IN ({ids})', missing
+        ))
+    
     def update(self, student_id, surname, name, patronymic, gender, phone, email, group_number):
         # Валидация
         validate_name(surname, "Фамилия")
@@ -74,43 +155,32 @@ class StudentModel:
             validate_email(email)
         validate_group_number(group_number)
         
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('''
-                UPDATE students 
-                SET surname=?, name=?, patronymic=?, gender=?, phone=?, email=?, group_number=?
-                WHERE id=?
-            ''', (surname.strip(), name.strip(), patronymic.strip() if patronymic else None,
-                  gender, phone.strip(), email.strip() if email else None, group_number.strip(), student_id))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise
-        finally:
-            conn.close()
+        _, change = self.db.write_counted(lambda conn: conn.execute('''
+            UPDATE students 
+            SET surname=?, name=?, patronymic=?, gender=?, phone=?, email=?, group_number=?
+            WHERE id=?
+        ''', (surname.strip(), name.strip(), patronymic.strip() if patronymic else None,
+              gender, phone.strip(), email.strip() if email else None, group_number.strip(), student_id)
+        ), ('students',))
+        facets.student_changed(self.db, student_id, change)
     
     def delete(self, student_id):
-        # Проверка, проживал ли студент в общежитии
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM checkins WHERE student_id = ?', (student_id,))
-        count = cursor.fetchone()[0]
-        conn.close()
-        
-        if count > 0:
-            raise ValueError("Нельзя удалить студента, который проживал в общежитии")
-        
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        # Заселения ссылаются на студента (ON DELETE RESTRICT) - удаление отклонит сама БД
         try:
-            cursor.execute('DELETE FROM students WHERE id = ?', (student_id,))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
+            _, change = self.db.write_counted(
+                lambda conn: conn.execute('DELETE FROM students WHERE id = ?', (student_id,)), ('students',)
+            )
+        except sqlite3.IntegrityError as e:
+            if is_foreign_key_error(e):
+                raise BusinessRuleException(
+                    "Нельзя удалить студента, который проживал в общежитии", 'student_has_checkins'
+                )
             raise
-        finally:
-            conn.close()
+        facets.student_changed(self.db, student_id, change)
+    
+    def facet_index(self):
+        """Фасетный индекс студентов: пол, группа, корпус, этаж, проживание, email"""
+        return facets.students(self.db)
     
     def has_checkins(self, student_id):
         conn = self.db.get_connection()
@@ -122,8 +192,13 @@ class StudentModel:
 
 
 class CommandantModel:
-    def __init__(self):
-        self.db = Database()
+    PAGE_ORDERS = {
+        'name': Ordering(NAME_ORDER),
+        'id': Ordering(('id',)),
+    }
+    
+    def __init__(self, db=None):
+        self.db = db or Database()
     
     def create(self, surname, name, patronymic, phone):
         # Валидация
@@ -133,31 +208,57 @@ class CommandantModel:
             validate_name(patronymic, "Отчество")
         validate_phone(phone)
         
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('''
-                INSERT INTO commandants (surname, name, patronymic, phone)
-                VALUES (?, ?, ?, ?)
-            ''', (surname.strip(), name.strip(), patronymic.strip() if patronymic else None, phone.strip()))
-            conn.commit()
-            commandant_id = cursor.lastrowid
-            return commandant_id
-        except Exception as e:
-            conn.rollback()
-            raise
-        finally:
-            conn.close()
+        commandant_id = self.db.execute_write('''
+            INSERT INTO commandants (surname, name, patronymic, phone)
+            VALUES (?, ?, ?, ?)
+        ''', (surname.strip(), name.strip(), patronymic.strip() if patronymic else None, phone.strip()))
+        return commandant_id
     
     def get_all(self):
+        return cached(self.db, 'commandants.get_all', ('commandants',), self._load_all, persist=True)
+    
+    def _load_all(self):
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM commandants ORDER BY surname, name')
+        cursor.execute(f'SELECT * FROM commandants ORDER BY {NAME_SQL}')
         commandants = cursor.fetchall()
         conn.close()
         return commandants
     
+    def iter_all(self, batch_size=BATCH_SIZE):
+        """Все коменданты в порядке get_all, пачками из открытого курсора"""
+        return iter_query(self.db, f'SELECT * FROM commandants ORDER BY {NAME_SQL}', batch_size=batch_size)
+    
+    def page(self, after_key=None, limit=PAGE_SIZE, order='name'):
+        """Страница комендантов после токена after_key"""
+        conn = self.db.get_connection()
+        try:
+            return fetch_page(conn, '*', 'commandants', self.PAGE_ORDERS, order, after_key, limit)
+        finally:
+            conn.close()
+    
+    def search(self, text, limit=SEARCH_LIMIT):
+        """Поиск комендантов по началу слов ФИО, по релевантности (limit=None - все совпадения)"""
+        conn = self.db.get_connection()
+        try:
+            return search_rows(conn, 'commandants', text, limit)
+        finally:
+            conn.close()
+    
+    def find_by_phone(self, phone):
+        """Коменданты с этим номером телефона в любой записи (+7 (900) 123-45-67, 89001234567)"""
+        conn = self.db.get_connection()
+        try:
+            return conn.execute(
+                'SELECT * FROM commandants WHERE normalize_phone(phone) = normalize_phone(?) ORDER BY id', (phone,)
+            ).fetchall()
+        finally:
+            conn.close()
+    
     def get_by_id(self, commandant_id):
+        return identity_map.get_one('commandants', commandant_id, self._load_by_id)
+    
+    def _load_by_id(self, commandant_id):
         conn = self.db.get_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM commandants WHERE id = ?', (commandant_id,))
@@ -165,6 +266,12 @@ class CommandantModel:
         conn.close()
         return commandant
     
+    def get_many(self, ids):
+        """Записи по списку id: {id: запись} (один запрос на пачку id)"""
+        return identity_map.get_many('commandants', ids, lambda missing: identity_map.fetch_many(
+            self.db, 'SELECT * FROM commandants WHERE id IN ({ids})', missing
+        ))
+    
     def update(self, commandant_id, surname, name, patronymic, phone):
         # Валидация
         validate_name(surname, "Фамилия")
@@ -173,50 +280,34 @@ class CommandantModel:
             validate_name(patronymic, "Отчество")
         validate_phone(phone)
         
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('''
-                UPDATE commandants 
-                SET surname=?, name=?, patronymic=?, phone=?
-                WHERE id=?
-            ''', (surname.strip(), name.strip(), patronymic.strip() if patronymic else None, 
-                  phone.strip(), commandant_id))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise
-        finally:
-            conn.close()
+        self.db.execute_write('''
+            UPDATE commandants 
+            SET surname=?, name=?, patronymic=?, phone=?
+            WHERE id=?
+        ''', (surname.strip(), name.strip(), patronymic.strip() if patronymic else None, 
+              phone.strip(), commandant_id))
     
     def delete(self, commandant_id):
-        # Проверка, участвовал ли комендант в заселении/выселении
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM checkins WHERE commandant_id = ?', (commandant_id,))
-        checkins_count = cursor.fetchone()[0]
-        cursor.execute('SELECT COUNT(*) FROM checkouts WHERE commandant_id = ?', (commandant_id,))
-        checkouts_count = cursor.fetchone()[0]
-        conn.close()
-        
-        if checkins_count > 0 or checkouts_count > 0:
-            raise ValueError("Нельзя удалить коменданта, который участвовал в оформлении заселения или выселения")
-        
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        # Заселения и выселения ссылаются на коменданта (ON DELETE RESTRICT)
         try:
-            cursor.execute('DELETE FROM commandants WHERE id = ?', (commandant_id,))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
+            self.db.execute_write('DELETE FROM commandants WHERE id = ?', (commandant_id,))
+        except sqlite3.IntegrityError as e:
+            if is_foreign_key_error(e):
+                raise BusinessRuleException(
+                    "Нельзя удалить коменданта, который участвовал в оформлении заселения или выселения",
+                    'commandant_has_records'
+                )
             raise
-        finally:
-            conn.close()
 
 
 class BuildingModel:
-    def __init__(self):
-        self.db = Database()
+    PAGE_ORDERS = {
+        'number': Ordering(('number_key', 'id')),
+        'id': Ordering(('id',)),
+    }
+    
+    def __init__(self, db=None):
+        self.db = db or Database()
     
     def create(self, building_number, address, floors_count):
         # Валидация
@@ -224,41 +315,59 @@ class BuildingModel:
         validate_address(address)
         validate_floors_count(floors_count)
         
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute('''
+            building_id = self.db.execute_write('''
                 INSERT INTO buildings (building_number, address, floors_count)
                 VALUES (?, ?, ?)
             ''', (building_number.strip(), address.strip(), floors_count))
-            conn.commit()
-            building_id = cursor.lastrowid
             return building_id
         except sqlite3.IntegrityError:
-            conn.rollback()
             raise ValueError("Корпус с таким номером уже существует")
-        except Exception as e:
-            conn.rollback()
-            raise
-        finally:
-            conn.close()
     
     def get_all(self, address_filter=None):
+        return cached(self.db, 'buildings.get_all', ('buildings',),
+                      lambda: self._load_all(address_filter), address_filter,
+                      persist=address_filter is None)
+    
+    def _load_all(self, address_filter):
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        if address_filter:
-            cursor.execute('''
-                SELECT * FROM buildings 
-                WHERE address LIKE ?
-                ORDER BY building_number
-            ''', (f'%{address_filter}%',))
+        query = match_query(address_filter)
+        if query is not None:
+            # Слова адреса ищутся по началу через полнотекстовый индекс
+            cursor.execute(f'''
+                SELECT * FROM buildings
+                WHERE id IN ({search_ids('buildings')})
+                ORDER BY number_key, id
+            ''', (query,))
         else:
-            cursor.execute('SELECT * FROM buildings ORDER BY building_number')
+            cursor.execute('SELECT * FROM buildings ORDER BY number_key, id')
         buildings = cursor.fetchall()
         conn.close()
         return buildings
     
+    def iter_all(self, batch_size=BATCH_SIZE):
+        """Все корпуса в порядке get_all, пачками из открытого курсора"""
+        return iter_query(self.db, 'SELECT * FROM buildings ORDER BY number_key, id', batch_size=batch_size)
+    
+    def page(self, after_key=None, limit=PAGE_SIZE, order='number', address_filter=None):
+        """Страница корпусов после токена after_key"""
+        where, params = None, ()
+        query = match_query(address_filter)
+        if query is not None:
+            where, params = f"id IN ({search_ids('buildings')})", (query,)
+        conn = self.db.get_connection()
+        try:
+            return fetch_page(
+                conn, '*', 'buildings', self.PAGE_ORDERS, order, after_key, limit, where, params
+            )
+        finally:
+            conn.close()
+    
     def get_by_id(self, building_id):
+        return identity_map.get_one('buildings', building_id, self._load_by_id)
+    
+    def _load_by_id(self, building_id):
         conn = self.db.get_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM buildings WHERE id = ?', (building_id,))
@@ -266,48 +375,87 @@ class BuildingModel:
         conn.close()
         return building
     
+    def get_many(self, ids):
+        """Записи по списку id: {id: запись} (один запрос на пачку id)"""
+        return identity_map.get_many('buildings', ids, lambda missing: identity_map.fetch_many(
+            self.db, 'SELECT * FROM buildings WHERE id IN ({ids})', missing
+        ))
+    
     def update(self, building_id, building_number, address, floors_count):
         # Валидация
         validate_building_number(building_number)
         validate_address(address)
         validate_floors_count(floors_count)
         
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute('''
+            self.db.execute_write('''
                 UPDATE buildings 
                 SET building_number=?, address=?, floors_count=?
                 WHERE id=?
             ''', (building_number.strip(), address.strip(), floors_count, building_id))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise
-        finally:
-            conn.close()
+        except sqlite3.IntegrityError:
+            raise ValueError("Корпус с таким номером уже существует")
     
     def delete(self, building_id):
-        # Проверка, есть ли связанные комнаты
+        # Комнаты ссылаются на корпус (ON DELETE RESTRICT)
+        try:
+            self.db.execute_write('DELETE FROM buildings WHERE id = ?', (building_id,))
+        except sqlite3.IntegrityError as e:
+            if is_foreign_key_error(e):
+                raise BusinessRuleException(
+                    "Нельзя удалить корпус, с которым связаны комнаты", 'building_has_rooms'
+                )
+            raise
+    
+    def get_occupancy(self, building_id=None):
+        """Места по корпусам: (id, номер, вместимость, занято, свободно)"""
+        return cached(self.db, 'buildings.get_occupancy', ('buildings',) + OCCUPANCY_TABLES,
+                      lambda: self._load_occupancy(building_id), building_id)
+    
+    def _load_occupancy(self, building_id):
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM rooms WHERE building_id = ?', (building_id,))
-        count = cursor.fetchone()[0]
+        query = '''
+            SELECT b.id, b.building_number, o.capacity, o.occupied, o.capacity - o.occupied AS free
+            FROM building_occupancy o
+            JOIN buildings b ON b.id = o.building_id
+        '''
+        if building_id is not None:
+            cursor.execute(query + ' WHERE o.building_id = ?', (building_id,))
+        else:
+            cursor.execute(query + ' ORDER BY b.number_key, b.id')
+        rows = cursor.fetchall()
         conn.close()
-        
-        if count > 0:
-            raise ValueError("Нельзя удалить корпус, с которым связаны комнаты")
-        
+        return rows
+    
+    def get_floor_occupancy(self, building_id):
+        """Места по этажам корпуса: (этаж, вместимость, занято, свободно)"""
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        try:
-            cursor.execute('DELETE FROM buildings WHERE id = ?', (building_id,))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise
-        finally:
-            conn.close()
+        cursor.execute('''
+            SELECT floor, capacity, occupied, capacity - occupied AS free
+            FROM floor_occupancy
+            WHERE building_id = ?
+            ORDER BY floor
+        ''', (building_id,))
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+    
+    def get_occupancy_totals(self):
+        """Всего мест и занятых мест по всем корпусам"""
+        return cached(self.db, 'buildings.get_occupancy_totals', OCCUPANCY_TABLES, self._load_occupancy_totals)
+    
+    def _load_occupancy_totals(self):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT COALESCE(SUM(capacity), 0), COALESCE(SUM(occupied), 0)
+            FROM building_occupancy
+        ''')
+        totals = tuple(cursor.fetchone())
+        conn.close()
+        return totals
     
     def has_rooms(self, building_id):
         conn = self.db.get_connection()
@@ -319,8 +467,13 @@ class BuildingModel:
 
 
 class RoomModel:
-    def __init__(self):
-        self.db = Database()
+    PAGE_ORDERS = {
+        'number': Ordering(('b.number_key', 'b.id', 'r.floor', 'r.number_key', 'r.id')),
+        'id': Ordering(('r.id',)),
+    }
+    
+    def __init__(self, db=None):
+        self.db = db or Database()
     
     def create(self, building_id, floor, room_number, capacity, area=None):
         # Валидация
@@ -329,39 +482,67 @@ class RoomModel:
         if area is not None:
             validate_area(area)
         
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute('''
+            room_id = self.db.execute_write('''
                 INSERT INTO rooms (building_id, floor, room_number, capacity, area)
                 VALUES (?, ?, ?, ?, ?)
             ''', (building_id, floor, room_number.strip(), capacity, area))
-            conn.commit()
-            room_id = cursor.lastrowid
             return room_id
-        except sqlite3.IntegrityError:
-            conn.rollback()
+        except sqlite3.IntegrityError as e:
+            if is_foreign_key_error(e):
+                raise ValueError("Корпус не найден")
             raise ValueError("Комната с таким номером уже существует в этом корпусе на этом этаже")
-        except Exception as e:
-            conn.rollback()
-            raise
-        finally:
-            conn.close()
     
     def get_all(self):
+        return cached(self.db, 'rooms.get_all', ROOM_TABLES, self._load_all, persist=True)
+    
+    def _load_all(self):
         conn = self.db.get_connection()
         cursor = conn.cursor()
         cursor.execute('''
             SELECT r.*, b.building_number, b.address 
             FROM rooms r
             JOIN buildings b ON r.building_id = b.id
-            ORDER BY b.building_number, r.floor, r.room_number
+            ORDER BY b.number_key, b.id, r.floor, r.number_key, r.id
         ''')
         rooms = cursor.fetchall()
         conn.close()
         return rooms
     
+    def iter_all(self, batch_size=BATCH_SIZE):
+        """Все комнаты в порядке get_all, пачками из открытого курсора"""
+        return iter_query(self.db, '''
+            SELECT r.*, b.building_number, b.address 
+            FROM rooms r
+            JOIN buildings b ON r.building_id = b.id
+            ORDER BY b.number_key, b.id, r.floor, r.number_key, r.id
+        ''', batch_size=batch_size)
+    
+    def page(self, after_key=None, limit=PAGE_SIZE, order='number'):
+        """Страница комнат после токена after_key"""
+        conn = self.db.get_connection()
+        try:
+            return fetch_page(
+                conn, 'r.*, b.building_number, b.address',
+                'rooms r JOIN buildings b ON r.building_id = b.id',
+                self.PAGE_ORDERS, order, after_key, limit
+            )
+        finally:
+            conn.close()
+    
     def get_by_id(self, room_id):
+        return identity_map.get_one('rooms', room_id, self._load_by_id)
+    
+    def get_many(self, ids):
+        """Комнаты по списку id: {id: запись} (один запрос на пачку id)"""
+        return identity_map.get_many('rooms', ids, lambda missing: identity_map.fetch_many(self.db, '''
+            SELECT r.*, b.building_number, b.address 
+            FROM rooms r
+            JOIN buildings b ON r.building_id = b.id
+            WHERE r.id IN ({ids})
+        ''', missing))
+    
+    def _load_by_id(self, room_id):
         conn = self.db.get_connection()
         cursor = conn.cursor()
         cursor.execute('''
@@ -381,206 +562,384 @@ class RoomModel:
         if area is not None:
             validate_area(area)
         
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute('''
+            self.db.execute_write('''
                 UPDATE rooms 
                 SET building_id=?, floor=?, room_number=?, capacity=?, area=?
                 WHERE id=?
             ''', (building_id, floor, room_number.strip(), capacity, area, room_id))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise
-        finally:
-            conn.close()
+        except sqlite3.IntegrityError as e:
+            if is_foreign_key_error(e):
+                raise ValueError("Корпус не найден")
+            raise ValueError("Комната с таким номером уже существует в этом корпусе на этом этаже")
     
     def delete(self, room_id):
-        # Проверка, проживали ли студенты в комнате
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM checkins WHERE room_id = ?', (room_id,))
-        count = cursor.fetchone()[0]
-        conn.close()
-        
-        if count > 0:
-            raise ValueError("Нельзя удалить комнату, в которой проживали студенты")
-        
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
+        # Заселения ссылаются на комнату (ON DELETE RESTRICT)
         try:
-            cursor.execute('DELETE FROM rooms WHERE id = ?', (room_id,))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
+            self.db.execute_write('DELETE FROM rooms WHERE id = ?', (room_id,))
+        except sqlite3.IntegrityError as e:
+            if is_foreign_key_error(e):
+                raise BusinessRuleException(
+                    "Нельзя удалить комнату, в которой проживали студенты", 'room_has_checkins'
+                )
             raise
-        finally:
-            conn.close()
     
     def get_current_occupancy(self, room_id):
         """Получить текущее количество заселенных студентов в комнате"""
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT COUNT(*) FROM checkins c
-            LEFT JOIN checkouts co ON c.id = co.checkin_id
-            WHERE c.room_id = ? AND co.id IS NULL
-        ''', (room_id,))
-        count = cursor.fetchone()[0]
+        cursor.execute('SELECT occupancy FROM room_occupancy WHERE room_id = ?', (room_id,))
+        row = cursor.fetchone()
         conn.close()
-        return count
+        return row[0] if row else 0
     
     def get_room_gender(self, room_id):
         """Получить пол студентов в комнате (если все одного пола)"""
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT DISTINCT s.gender FROM checkins c
-            JOIN students s ON c.student_id = s.id
-            LEFT JOIN checkouts co ON c.id = co.checkin_id
-            WHERE c.room_id = ? AND co.id IS NULL
-        ''', (room_id,))
-        genders = [row[0] for row in cursor.fetchall()]
+        cursor.execute('SELECT male, female FROM room_occupancy WHERE room_id = ?', (room_id,))
+        row = cursor.fetchone()
         conn.close()
-        if len(genders) == 1:
-            return genders[0]
-        elif len(genders) == 0:
-            return None
-        else:
-            return 'MIXED'  # Разные полы (не должно быть, но на всякий случай)
+        return room_gender(*row) if row else None
+    
+    def facet_index(self):
+        """Фасетный индекс комнат: корпус, этаж, пол проживающих, свободные места, вместимость"""
+        return facets.rooms(self.db)
+    
+    def suggest(self, gender, building_id=None, floor=None, limit=None):
+        """Комнаты со свободными местами для студента пола gender, лучшие первыми (индекс в памяти)"""
+        return availability.get(self.db).suggest(gender, building_id, floor, limit)
+    
+    def get_occupied_count(self):
+        """Количество комнат, в которых кто-то проживает"""
+        return cached(self.db, 'rooms.get_occupied_count', OCCUPANCY_TABLES, self._load_occupied_count)
+    
+    def _load_occupied_count(self):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM room_occupancy WHERE occupancy > 0')
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
 
 
 class CheckinModel:
-    def __init__(self):
-        self.db = Database()
+    # Колонки и источник списка заселений (get_all и page)
+    LIST_COLUMNS = '''
+        c.*, 
+        s.surname || ' ' || s.name || ' ' || COALESCE(s.patronymic, '') as student_name,
+        cmd.surname || ' ' || cmd.name || ' ' || COALESCE(cmd.patronymic, '') as commandant_name,
+        r.room_number, r.floor, b.building_number, b.address
+    '''
+    LIST_SOURCE = '''
+        checkins c
+        JOIN students s ON c.student_id = s.id
+        JOIN commandants cmd ON c.commandant_id = cmd.id
+        JOIN rooms r ON c.room_id = r.id
+        JOIN buildings b ON r.building_id = b.id
+    '''
+    PAGE_ORDERS = {
+        'date': Ordering((day_key('c.checkin_day'), 'c.id'), descending=True),
+        'id': Ordering(('c.id',)),
+    }
+    
+    def __init__(self, db=None):
+        self.db = db or Database()
     
     def create(self, student_id, commandant_id, room_id, checkin_date):
-        # Проверка вместимости
-        room_model = RoomModel()
-        occupancy = room_model.get_current_occupancy(room_id)
-        room = room_model.get_by_id(room_id)
-        if not room:
-            raise ValueError("Комната не найдена")
-        capacity = room[4]  # capacity находится в индексе 4
-        
-        if occupancy >= capacity:
-            raise ValueError(f"Комната заполнена. Текущее количество: {occupancy}/{capacity}")
+        """Заселить студента: проверки и вставка в одной транзакции потока записи"""
+        checkin_date = to_text(checkin_date)
         
-        # Проверка пола
-        student_model = StudentModel()
-        student = student_model.get_by_id(student_id)
-        if not student:
-            raise ValueError("Студент не найден")
-        student_gender = student[4]  # gender находится в индексе 4
-        
-        room_gender = room_model.get_room_gender(room_id)
-        if room_gender and room_gender != 'MIXED' and room_gender != student_gender:
-            raise ValueError(f"Пол заселяемого студента ({student_gender}) не соответствует полу уже заселенных студентов ({room_gender})")
+        def checkin(conn):
+            # Вместимость, счетчики комнаты и пол студента - одним чтением по ключам
+            row = conn.execute('''
+                SELECT r.capacity, COALESCE(o.occupancy, 0), s.gender, o.male, o.female
+                FROM rooms r
+                LEFT JOIN room_occupancy o ON o.room_id = r.id
+                LEFT JOIN students s ON s.id = ?
+                WHERE r.id = ?
+            ''', (student_id, room_id)).fetchone()
+            if not row:
+                raise ValueError("Комната не найдена")
+            capacity, occupancy, student_gender, male, female = row
+            
+            if occupancy >= capacity:
+                raise ValueError(f"Комната заполнена. Текущее количество: {occupancy}/{capacity}")
+            
+            if student_gender is None:
+                raise ValueError("Студент не найден")
+            
+            # При разных полах в комнате (не должно быть) проверка пола не выполняется
+            current_gender = room_gender(male, female)
+            if current_gender in ('М', 'Ж') and current_gender != student_gender:
+                raise ValueError(f"Пол заселяемого студента ({student_gender}) не соответствует полу уже заселенных студентов ({current_gender})")
+            
+            try:
+                cursor = conn.execute('''
+                    INSERT INTO checkins (student_id, commandant_id, room_id, checkin_date)
+                    VALUES (?, ?, ?, ?)
+                ''', (student_id, commandant_id, room_id, checkin_date))
+            except sqlite3.IntegrityError as e:
+                if is_foreign_key_error(e):
+                    raise ValueError("Комендант не найден")
+                raise
+            return cursor.lastrowid
         
+        checkin_id, change = self.db.write_counted(checkin, ('checkins',))
+        availability.room_changed(self.db, room_id, change)
+        facets.student_changed(self.db, student_id, change)
+        logger.info(f"Заселение ID: {checkin_id}, студент {student_id}, комната {room_id}")
+        return checkin_id
+    
+    def get_all(self):
         conn = self.db.get_connection()
         cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {self.LIST_COLUMNS}
+            FROM {self.LIST_SOURCE}
+            ORDER BY c.checkin_day DESC, c.id DESC
+        ''')
+        checkins = cursor.fetchall()
+        conn.close()
+        return checkins
+    
+    def get_many(self, ids):
+        """Строки списка по id: {id: запись} (один запрос на пачку id)"""
+        return identity_map.get_many('checkins', ids, lambda missing: identity_map.fetch_many(
+            self.db, f'SELECT {self.LIST_COLUMNS} FROM {self.LIST_SOURCE} WHERE c.id IN ({{ids}})', missing
+        ))
+    
+    def iter_all(self, batch_size=BATCH_SIZE):
+        """Вся история заселений (новые первыми), пачками из открытого курсора"""
+        return iter_query(self.db, f'''
+            SELECT {self.LIST_COLUMNS}
+            FROM {self.LIST_SOURCE}
+            ORDER BY c.checkin_day DESC, c.id DESC
+        ''', batch_size=batch_size)
+    
+    def page(self, after_key=None, limit=PAGE_SIZE, order='date'):
+        """Страница заселений (по умолчанию новые первыми) после токена after_key"""
+        return cached(self.db, 'checkins.page', CHECKIN_TABLES,
+                      lambda: self._load_page(after_key, limit, order), after_key, limit, order)
+    
+    def _load_page(self, after_key, limit, order):
+        conn = self.db.get_connection()
         try:
-            cursor.execute('''
-                INSERT INTO checkins (student_id, commandant_id, room_id, checkin_date)
-                VALUES (?, ?, ?, ?)
-            ''', (student_id, commandant_id, room_id, checkin_date))
-            conn.commit()
-            checkin_id = cursor.lastrowid
-            return checkin_id
-        except Exception as e:
-            conn.rollback()
-            raise
+            return fetch_page(
+                conn, self.LIST_COLUMNS, self.LIST_SOURCE, self.PAGE_ORDERS, order, after_key, limit
+            )
         finally:
             conn.close()
     
-    def get_all(self):
+    def between(self, start, end):
+        """Заселения с start по end включительно (новые первыми)"""
+        conn = self.db.get_connection()
+        try:
+            return conn.execute(f'''
+                SELECT {self.LIST_COLUMNS}
+                FROM {self.LIST_SOURCE}
+                WHERE c.checkin_day BETWEEN ? AND ?
+                ORDER BY c.checkin_day DESC, c.id DESC
+            ''', day_range(start, end)).fetchall()
+        finally:
+            conn.close()
+    
+    def as_of(self, day, room_id=None, building_id=None, floor=None):
+        """Проживавшие на дату day (дни заселения и выселения включительно)
+
+        Без фильтров - все проживавшие; room_id - в комнате, building_id - в корпусе,
+        building_id и floor - на этаже корпуса
+        """
+        if floor is not None and building_id is None:
+            raise ValueError("Этаж задается вместе с корпусом")
+        day = to_day(day)
+        conditions, params = ['i.first_day <= ?', 'i.last_day >= ?'], [day, day]
+        for column, value in (('res.room_id', room_id), ('r.building_id', building_id), ('r.floor', floor)):
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                params.append(value)
+        conn = self.db.get_connection()
+        try:
+            # Индекс интервалов отдает только проживания, пересекающие дату
+            return conn.execute(f'''
+                SELECT res.checkin_id AS id, res.student_id, res.room_id,
+                       res.checkin_date, res.checkout_date,
+                       s.surname || ' ' || s.name || ' ' || COALESCE(s.patronymic, '') as student_name,
+                       r.room_number, r.floor, b.building_number, b.address
+                FROM residency_intervals i
+                JOIN residencies res ON res.checkin_id = i.checkin_id
+                JOIN students s ON res.student_id = s.id
+                JOIN rooms r ON res.room_id = r.id
+                JOIN buildings b ON r.building_id = b.id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY b.number_key, b.id, r.floor, r.number_key, r.id,
+                         ufold(s.surname), ufold(s.name), res.checkin_id
+            ''', params).fetchall()
+        finally:
+            conn.close()
+    
+    def get_active_checkins(self):
+        """Получить активные заселения (без выселения)"""
+        return cached(self.db, 'checkins.get_active_checkins', ACTIVE_TABLES, self._load_active_checkins,
+                      persist=True)
+    
+    def _load_active_checkins(self):
+        # Частичный индекс idx_residencies_active содержит только текущих жильцов
         conn = self.db.get_connection()
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT c.*, 
+            SELECT res.checkin_id AS id, res.student_id, res.checkin_commandant_id AS commandant_id,
+                   res.room_id, res.checkin_date, res.checkin_day,
                    s.surname || ' ' || s.name || ' ' || COALESCE(s.patronymic, '') as student_name,
-                   cmd.surname || ' ' || cmd.name || ' ' || COALESCE(cmd.patronymic, '') as commandant_name,
                    r.room_number, r.floor, b.building_number, b.address
-            FROM checkins c
-            JOIN students s ON c.student_id = s.id
-            JOIN commandants cmd ON c.commandant_id = cmd.id
-            JOIN rooms r ON c.room_id = r.id
+            FROM residencies res
+            JOIN students s ON res.student_id = s.id
+            JOIN rooms r ON res.room_id = r.id
             JOIN buildings b ON r.building_id = b.id
-            ORDER BY c.checkin_date DESC
+            WHERE res.checkout_date IS NULL
+            ORDER BY res.checkin_day DESC
         ''')
         checkins = cursor.fetchall()
         conn.close()
         return checkins
     
-    def get_active_checkins(self):
-        """Получить активные заселения (без выселения)"""
+    def count_all(self):
+        """Количество заселений за всю историю"""
+        return cached(self.db, 'checkins.count_all', ('checkins',), self._load_count_all)
+    
+    def _load_count_all(self):
+        conn = self.db.get_connection()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM checkins').fetchone()[0]
+        finally:
+            conn.close()
+    
+    def count_active(self):
+        """Количество активных заселений"""
+        return cached(self.db, 'checkins.count_active', ('checkins', 'checkouts'), self._load_count_active)
+    
+    def _load_count_active(self):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM residencies WHERE checkout_date IS NULL')
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+    
+    def get_active_by_room(self, room_id):
+        """Активные заселения комнаты: (id заселения, id студента, дата заселения)"""
         conn = self.db.get_connection()
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT c.*, 
-                   s.surname || ' ' || s.name || ' ' || COALESCE(s.patronymic, '') as student_name,
-                   r.room_number, r.floor, b.building_number, b.address
-            FROM checkins c
-            JOIN students s ON c.student_id = s.id
-            JOIN rooms r ON c.room_id = r.id
-            JOIN buildings b ON r.building_id = b.id
-            LEFT JOIN checkouts co ON c.id = co.checkin_id
-            WHERE co.id IS NULL
-            ORDER BY c.checkin_date DESC
-        ''')
+            SELECT checkin_id, student_id, checkin_date
+            FROM residencies
+            WHERE room_id = ? AND checkout_date IS NULL
+            ORDER BY checkin_date
+        ''', (room_id,))
         checkins = cursor.fetchall()
         conn.close()
         return checkins
 
 
 class CheckoutModel:
-    def __init__(self):
-        self.db = Database()
+    # Колонки и источник списка выселений (get_all и page)
+    LIST_COLUMNS = '''
+        co.*, 
+        s.surname || ' ' || s.name || ' ' || COALESCE(s.patronymic, '') as student_name,
+        cmd.surname || ' ' || cmd.name || ' ' || COALESCE(cmd.patronymic, '') as commandant_name,
+        r.room_number, r.floor, b.building_number, b.address
+    '''
+    LIST_SOURCE = '''
+        checkouts co
+        JOIN checkins c ON co.checkin_id = c.id
+        JOIN students s ON c.student_id = s.id
+        JOIN commandants cmd ON co.commandant_id = cmd.id
+        JOIN rooms r ON c.room_id = r.id
+        JOIN buildings b ON r.building_id = b.id
+    '''
+    PAGE_ORDERS = {
+        'date': Ordering((day_key('co.checkout_day'), 'co.id'), descending=True),
+        'id': Ordering(('co.id',)),
+    }
+    
+    def __init__(self, db=None):
+        self.db = db or Database()
     
     def create(self, checkin_id, commandant_id, checkout_date):
-        # Проверка, что заселение существует и еще не выселено
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM checkouts WHERE checkin_id = ?', (checkin_id,))
-        if cursor.fetchone()[0] > 0:
-            conn.close()
-            raise ValueError("Это заселение уже было выселено")
-        conn.close()
+        checkout_date = to_text(checkout_date)
         
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('''
+        def checkout(conn):
+            cursor = conn.execute('''
                 INSERT INTO checkouts (checkin_id, commandant_id, checkout_date)
                 VALUES (?, ?, ?)
             ''', (checkin_id, commandant_id, checkout_date))
-            conn.commit()
-            checkout_id = cursor.lastrowid
-            return checkout_id
-        except Exception as e:
-            conn.rollback()
+            room_id, student_id = conn.execute(
+                'SELECT room_id, student_id FROM checkins WHERE id = ?', (checkin_id,)
+            ).fetchone()
+            return cursor.lastrowid, room_id, student_id
+        
+        # Повторное выселение отклоняет UNIQUE(checkin_id), несуществующее заселение - внешний ключ
+        try:
+            (checkout_id, room_id, student_id), change = self.db.write_counted(checkout, ('checkouts',))
+        except sqlite3.IntegrityError as e:
+            if is_unique_error(e):
+                raise BusinessRuleException("Это заселение уже было выселено", 'already_checked_out')
+            if is_foreign_key_error(e):
+                raise ValueError("Заселение или комендант не найдены")
             raise
-        finally:
-            conn.close()
+        availability.room_changed(self.db, room_id, change)
+        facets.student_changed(self.db, student_id, change)
+        return checkout_id
     
     def get_all(self):
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT co.*, 
-                   s.surname || ' ' || s.name || ' ' || COALESCE(s.patronymic, '') as student_name,
-                   cmd.surname || ' ' || cmd.name || ' ' || COALESCE(cmd.patronymic, '') as commandant_name,
-                   r.room_number, r.floor, b.building_number, b.address
-            FROM checkouts co
-            JOIN checkins c ON co.checkin_id = c.id
-            JOIN students s ON c.student_id = s.id
-            JOIN commandants cmd ON co.commandant_id = cmd.id
-            JOIN rooms r ON c.room_id = r.id
-            JOIN buildings b ON r.building_id = b.id
-            ORDER BY co.checkout_date DESC
+        cursor.execute(f'''
+            SELECT {self.LIST_COLUMNS}
+            FROM {self.LIST_SOURCE}
+            ORDER BY co.checkout_day DESC, co.id DESC
         ''')
         checkouts = cursor.fetchall()
         conn.close()
         return checkouts
-
+    
+    def get_many(self, ids):
+        """Строки списка по id: {id: запись} (один запрос на пачку id)"""
+        return identity_map.get_many('checkouts', ids, lambda missing: identity_map.fetch_many(
+            self.db, f'SELECT {self.LIST_COLUMNS} FROM {self.LIST_SOURCE} WHERE co.id IN ({{ids}})', missing
+        ))
+    
+    def iter_all(self, batch_size=BATCH_SIZE):
+        """Вся история выселений (новые первыми), пачками из открытого курсора"""
+        return iter_query(self.db, f'''
+            SELECT {self.LIST_COLUMNS}
+            FROM {self.LIST_SOURCE}
+            ORDER BY co.checkout_day DESC, co.id DESC
+        ''', batch_size=batch_size)
+    
+    def page(self, after_key=None, limit=PAGE_SIZE, order='date'):
+        """Страница выселений (по умолчанию новые первыми) после токена after_key"""
+        return cached(self.db, 'checkouts.page', CHECKOUT_TABLES,
+                      lambda: self._load_page(after_key, limit, order), after_key, limit, order)
+    
+    def _load_page(self, after_key, limit, order):
+        conn = self.db.get_connection()
+        try:
+            return fetch_page(
+                conn, self.LIST_COLUMNS, self.LIST_SOURCE, self.PAGE_ORDERS, order, after_key, limit
+            )
+        finally:
+            conn.close()
+    
+    def between(self, start, end):
+        """Выселения с start по end включительно (новые первыми)"""
+        conn = self.db.get_connection()
+        try:
+            return conn.execute(f'''
+                SELECT {self.LIST_COLUMNS}
+                FROM {self.LIST_SOURCE}
+                WHERE co.checkout_day BETWEEN ? AND ?
+                ORDER BY co.checkout_day DESC, co.id DESC
+            ''', day_range(start, end)).fetchall()
+        finally:
+            conn.close()
@@ -2,14 +2,16 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget,
                              QTableWidgetItem, QPushButton, QDialog, QFormLayout, 
                              QLineEdit, QSpinBox, QMessageBox, QLabel)
 from PyQt6.QtCore import Qt
-from app.models import BuildingModel
+from app.core.session import AppSession
+from app.utils.exceptions import error_message
 
 
 class BuildingDialog(QDialog):
-    def __init__(self, parent=None, building_id=None):
+    def __init__(self, parent=None, building_id=None, session=None):
         super().__init__(parent)
         self.building_id = building_id
-        self.model = BuildingModel()
+        self.session = session or AppSession.current()
+        self.model = self.session.buildings
         self.init_ui()
         
         if building_id:
@@ -47,9 +49,9 @@ class BuildingDialog(QDialog):
     def load_building(self):
         building = self.model.get_by_id(self.building_id)
         if building:
-            self.building_number_edit.setText(building[1])
-            self.address_edit.setText(building[2])
-            self.floors_spin.setValue(building[3])
+            self.building_number_edit.setText(building.building_number)
+            self.address_edit.setText(building.address)
+            self.floors_spin.setValue(building.floors_count)
     
     def save(self):
         building_number = self.building_number_edit.text().strip()
@@ -71,9 +73,10 @@ class BuildingDialog(QDialog):
 
 
 class BuildingsWindow(QWidget):
-    def __init__(self):
+    def __init__(self, session=None):
         super().__init__()
-        self.model = BuildingModel()
+        self.session = session or AppSession.current()
+        self.model = self.session.buildings
         self.init_ui()
         self.load_data()
     
@@ -137,7 +140,8 @@ class BuildingsWindow(QWidget):
         self.table.setRowCount(len(buildings))
         
         for row, building in enumerate(buildings):
-            for col, value in enumerate(building):
+            values = (building.id, building.building_number, building.address, building.floors_count)
+            for col, value in enumerate(values):
                 item = QTableWidgetItem(str(value) if value is not None else '')
                 item.setFlags(item.flags() & ~Qt.ItemFlag.ItemIsEditable)
                 self.table.setItem(row, col, item)
@@ -153,7 +157,7 @@ class BuildingsWindow(QWidget):
         self.load_data()
     
     def add_building(self):
-        dialog = BuildingDialog(self)
+        dialog = BuildingDialog(self, session=self.session)
         if dialog.exec():
             self.load_data()
     
@@ -164,7 +168,7 @@ class BuildingsWindow(QWidget):
             return
         
         building_id = int(self.table.item(selected[0].row(), 0).text())
-        dialog = BuildingDialog(self, building_id)
+        dialog = BuildingDialog(self, building_id, session=self.session)
         if dialog.exec():
             self.load_data()
     
@@ -188,5 +192,5 @@ class BuildingsWindow(QWidget):
                 self.load_data()
                 QMessageBox.information(self, 'Успех', 'Корпус удален')
             except ValueError as e:
-                QMessageBox.warning(self, 'Ошибка', str(e))
+                QMessageBox.warning(self, 'Ошибка', error_message(e))
 
@@ -1,18 +1,22 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, 
                              QTableWidgetItem, QPushButton, QDialog, QFormLayout, 
-                             QLineEdit, QComboBox, QDateEdit, QMessageBox, QLabel)
+                             QLineEdit, QComboBox, QDateEdit, QMessageBox, QLabel,
+                             QFileDialog)
 from PyQt6.QtCore import Qt, QDate
 from PyQt6.QtGui import QFont
-from app.models import CheckinModel, StudentModel, CommandantModel, RoomModel
+from app.core.session import AppSession
+from app.utils.export import export_checkins_to_csv
+from app.utils.exceptions import error_message
 
 
 class CheckinDialog(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, session=None):
         super().__init__(parent)
-        self.checkin_model = CheckinModel()
-        self.student_model = StudentModel()
-        self.commandant_model = CommandantModel()
-        self.room_model = RoomModel()
+        self.session = session or AppSession.current()
+        self.checkin_model = self.session.checkins
+        self.student_model = self.session.students
+        self.commandant_model = self.session.commandants
+        self.room_model = self.session.rooms
         self.init_ui()
     
     def init_ui(self):
@@ -47,6 +51,8 @@ class CheckinDialog(QDialog):
         self.room_combo = QComboBox()
         self.load_rooms()
         layout.addRow('Комната*:', self.room_combo)
+        # Список комнат зависит от пола выбранного студента
+        self.student_combo.currentIndexChanged.connect(self.load_rooms)
         
         # Дата
         self.date_edit = QDateEdit()
@@ -70,24 +76,28 @@ class CheckinDialog(QDialog):
     def load_students(self):
         students = self.student_model.get_all()
         self.student_combo.clear()
+        self.genders = {}
         for student in students:
-            name = f"{student[1]} {student[2]} {student[3] or ''}".strip()
-            self.student_combo.addItem(name, student[0])
+            name = f"{student.surname} {student.name} {student.patronymic or ''}".strip()
+            self.student_combo.addItem(name, student.id)
+            self.genders[student.id] = student.gender
     
     def load_commandants(self):
         commandants = self.commandant_model.get_all()
         self.commandant_combo.clear()
         for commandant in commandants:
-            name = f"{commandant[1]} {commandant[2]} {commandant[3] or ''}".strip()
-            self.commandant_combo.addItem(name, commandant[0])
+            name = f"{commandant.surname} {commandant.name} {commandant.patronymic or ''}".strip()
+            self.commandant_combo.addItem(name, commandant.id)
     
     def load_rooms(self):
-        rooms = self.room_model.get_all()
+        """Только комнаты, куда можно заселить выбранного студента, лучшие первыми"""
+        gender = self.genders.get(self.student_combo.currentData())
+        rooms = self.room_model.suggest(gender) if gender else []
         self.room_combo.clear()
         for room in rooms:
-            # room format: (id, building_id, floor, room_number, capacity, area, building_number, address)
-            room_text = f"Корпус {room[6]}, {room[7]}, этаж {room[2]}, комната {room[3]}"
-            self.room_combo.addItem(room_text, room[0])
+            room_text = (f"Корпус {room.building_number}, {room.address}, этаж {room.floor}, "
+                         f"комната {room.room_number} (свободно {room.capacity - room.occupancy} из {room.capacity})")
+            self.room_combo.addItem(room_text, room.id)
     
     def save(self):
         student_id = self.student_combo.currentData()
@@ -109,10 +119,118 @@ class CheckinDialog(QDialog):
             QMessageBox.critical(self, 'Ошибка', str(e))
 
 
+class AsOfDialog(QDialog):
+    """Проживавшие на дату: во всех корпусах, в корпусе, на этаже или в комнате"""
+    
+    def __init__(self, parent=None, session=None):
+        super().__init__(parent)
+        self.session = session or AppSession.current()
+        self.checkin_model = self.session.checkins
+        self.building_model = self.session.buildings
+        self.room_model = self.session.rooms
+        self.rooms = self.room_model.get_all()
+        self.init_ui()
+    
+    def init_ui(self):
+        self.setWindowTitle('Проживавшие на дату')
+        self.setMinimumSize(900, 500)
+        
+        layout = QFormLayout()
+        
+        self.date_edit = QDateEdit()
+        self.date_edit.setDate(QDate.currentDate())
+        self.date_edit.setCalendarPopup(True)
+        layout.addRow('Дата*:', self.date_edit)
+        
+        self.building_combo = QComboBox()
+        self.building_combo.addItem('Все корпуса', None)
+        for building in self.building_model.get_all():
+            self.building_combo.addItem(f"Корпус {building.building_number}, {building.address}", building.id)
+        self.building_combo.currentIndexChanged.connect(self.load_floors)
+        layout.addRow('Корпус:', self.building_combo)
+        
+        self.floor_combo = QComboBox()
+        self.floor_combo.currentIndexChanged.connect(self.load_rooms)
+        layout.addRow('Этаж:', self.floor_combo)
+        
+        self.room_combo = QComboBox()
+        layout.addRow('Комната:', self.room_combo)
+        self.load_floors()
+        
+        buttons = QHBoxLayout()
+        show_btn = QPushButton('Показать')
+        close_btn = QPushButton('Закрыть')
+        show_btn.clicked.connect(self.load_data)
+        close_btn.clicked.connect(self.reject)
+        buttons.addWidget(show_btn)
+        buttons.addStretch()
+        buttons.addWidget(close_btn)
+        
+        self.table = QTableWidget()
+        self.table.setColumnCount(7)
+        self.table.setHorizontalHeaderLabels([
+            'Студент', 'Корпус', 'Этаж', 'Комната', 'Дата заселения', 'Дата выселения', 'ID заселения'
+        ])
+        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        
+        main_layout = QVBoxLayout()
+        main_layout.addLayout(layout)
+        main_layout.addLayout(buttons)
+        main_layout.addWidget(self.table)
+        self.setLayout(main_layout)
+    
+    def load_floors(self):
+        """Этажи, на которых есть комнаты выбранного корпуса"""
+        building_id = self.building_combo.currentData()
+        self.floor_combo.blockSignals(True)
+        self.floor_combo.clear()
+        self.floor_combo.addItem('Все этажи', None)
+        if building_id is not None:
+            for floor in sorted({room.floor for room in self.rooms if room.building_id == building_id}):
+                self.floor_combo.addItem(str(floor), floor)
+        self.floor_combo.blockSignals(False)
+        self.load_rooms()
+    
+    def load_rooms(self):
+        """Комнаты выбранного корпуса и этажа"""
+        building_id = self.building_combo.currentData()
+        floor = self.floor_combo.currentData()
+        self.room_combo.clear()
+        self.room_combo.addItem('Все комнаты', None)
+        if building_id is None:
+            return
+        for room in self.rooms:
+            if room.building_id == building_id and floor in (None, room.floor):
+                self.room_combo.addItem(f"Этаж {room.floor}, комната {room.room_number}", room.id)
+    
+    def load_data(self):
+        day = self.date_edit.date().toString('yyyy-MM-dd')
+        try:
+            residents = self.checkin_model.as_of(
+                day,
+                room_id=self.room_combo.currentData(),
+                building_id=self.building_combo.currentData(),
+                floor=self.floor_combo.currentData(),
+            )
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', error_message(e))
+            return
+        
+        self.table.setRowCount(len(residents))
+        for row, resident in enumerate(residents):
+            values = (resident.student_name, resident.building_number, resident.floor,
+                      resident.room_number, resident.checkin_date, resident.checkout_date or '', resident.id)
+            for col, value in enumerate(values):
+                self.table.setItem(row, col, QTableWidgetItem(str(value)))
+        self.table.resizeColumnsToContents()
+
+
 class CheckinWindow(QWidget):
-    def __init__(self):
+    def __init__(self, session=None):
         super().__init__()
-        self.model = CheckinModel()
+        self.session = session or AppSession.current()
+        self.model = self.session.checkins
         self.init_ui()
         self.load_data()
     
@@ -125,13 +243,19 @@ class CheckinWindow(QWidget):
         # Кнопки управления
         buttons_layout = QHBoxLayout()
         self.add_btn = QPushButton('Новое заселение')
+        self.as_of_btn = QPushButton('Проживавшие на дату')
+        self.export_btn = QPushButton('Экспорт в CSV')
         self.refresh_btn = QPushButton('Обновить')
         
         self.add_btn.clicked.connect(self.add_checkin)
+        self.as_of_btn.clicked.connect(self.show_as_of)
+        self.export_btn.clicked.connect(self.export_data)
         self.refresh_btn.clicked.connect(self.load_data)
         
         buttons_layout.addWidget(self.add_btn)
+        buttons_layout.addWidget(self.as_of_btn)
         buttons_layout.addStretch()
+        buttons_layout.addWidget(self.export_btn)
         buttons_layout.addWidget(self.refresh_btn)
         
         # Таблица
@@ -142,35 +266,66 @@ class CheckinWindow(QWidget):
         ])
         self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
         self.table.setSelectionMode(QTableWidget.SelectionMode.SingleSelection)
+        self.table.verticalScrollBar().valueChanged.connect(self.on_scroll)
+        self.next_token = None
         
         layout.addLayout(buttons_layout)
         layout.addWidget(self.table)
         self.setLayout(layout)
     
     def load_data(self):
-        checkins = self.model.get_all()
-        self.table.setRowCount(len(checkins))
-        
-        for row, checkin in enumerate(checkins):
-            # checkin format: (id, student_id, commandant_id, room_id, checkin_date, 
-            #                  student_name, commandant_name, room_number, floor, building_number, address)
-            self.table.setItem(row, 0, QTableWidgetItem(str(checkin[0])))
-            self.table.setItem(row, 1, QTableWidgetItem(str(checkin[5])))
-            self.table.setItem(row, 2, QTableWidgetItem(str(checkin[6])))
-            self.table.setItem(row, 3, QTableWidgetItem(str(checkin[9])))
-            self.table.setItem(row, 4, QTableWidgetItem(str(checkin[10])))
-            self.table.setItem(row, 5, QTableWidgetItem(str(checkin[8])))
-            self.table.setItem(row, 6, QTableWidgetItem(str(checkin[7])))
-            self.table.setItem(row, 7, QTableWidgetItem(str(checkin[4])))
+        """Загрузить первую страницу (новые первыми)"""
+        self.table.setRowCount(0)
+        self.next_token = None
+        self.load_page()
+        self.table.resizeColumnsToContents()
+    
+    def load_page(self, after_key=None):
+        """Добавить в таблицу страницу после токена after_key"""
+        page = self.model.page(after_key)
+        start = self.table.rowCount()
+        self.table.setRowCount(start + len(page))
+        
+        for row, checkin in enumerate(page, start):
+            self.table.setItem(row, 0, QTableWidgetItem(str(checkin.id)))
+            self.table.setItem(row, 1, QTableWidgetItem(str(checkin.student_name)))
+            self.table.setItem(row, 2, QTableWidgetItem(str(checkin.commandant_name)))
+            self.table.setItem(row, 3, QTableWidgetItem(str(checkin.building_number)))
+            self.table.setItem(row, 4, QTableWidgetItem(str(checkin.address)))
+            self.table.setItem(row, 5, QTableWidgetItem(str(checkin.floor)))
+            self.table.setItem(row, 6, QTableWidgetItem(str(checkin.room_number)))
+            self.table.setItem(row, 7, QTableWidgetItem(str(checkin.checkin_date)))
             
             for col in range(8):
                 item = self.table.item(row, col)
                 item.setFlags(item.flags() & ~Qt.ItemFlag.ItemIsEditable)
         
-        self.table.resizeColumnsToContents()
+        self.next_token = page.next_token
+    
+    def on_scroll(self, value):
+        """Подгрузить следующую страницу при прокрутке к концу таблицы"""
+        if self.next_token and value >= self.table.verticalScrollBar().maximum() - 5:
+            token, self.next_token = self.next_token, None
+            self.load_page(token)
 
+    def export_data(self):
+        """Экспорт всей истории заселений в CSV без загрузки ее в память"""
+        filename, _ = QFileDialog.getSaveFileName(
+            self, 'Сохранить как CSV', 'checkins_export.csv', 'CSV Files (*.csv)'
+        )
+        if not filename:
+            return
+        
+        try:
+            export_checkins_to_csv(self.model.iter_all(), filename)
+            QMessageBox.information(self, 'Успех', f'Данные экспортированы в {filename}')
+        except Exception as e:
+            QMessageBox.critical(self, 'Ошибка', f'Ошибка экспорта: {str(e)}')
+    
     def add_checkin(self):
-        dialog = CheckinDialog(self)
+        dialog = CheckinDialog(self, session=self.session)
         if dialog.exec():
             self.load_data()
-
+    
+    def show_as_of(self):
+        AsOfDialog(self, session=self.session).exec()
@@ -3,15 +3,17 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget,
                              QComboBox, QDateEdit, QMessageBox, QLabel)
 from PyQt6.QtCore import Qt, QDate
 from PyQt6.QtGui import QFont
-from app.models import CheckoutModel, CheckinModel, CommandantModel
+from app.core.session import AppSession
+from app.utils.exceptions import error_message
 
 
 class CheckoutDialog(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, session=None):
         super().__init__(parent)
-        self.checkout_model = CheckoutModel()
-        self.checkin_model = CheckinModel()
-        self.commandant_model = CommandantModel()
+        self.session = session or AppSession.current()
+        self.checkout_model = self.session.checkouts
+        self.checkin_model = self.session.checkins
+        self.commandant_model = self.session.commandants
         self.init_ui()
     
     def init_ui(self):
@@ -61,17 +63,16 @@ class CheckoutDialog(QDialog):
         checkins = self.checkin_model.get_active_checkins()
         self.checkin_combo.clear()
         for checkin in checkins:
-            # checkin format: (id, student_id, commandant_id, room_id, checkin_date,
-            #                  student_name, room_number, floor, building_number, address)
-            checkin_text = f"{checkin[5]} - Корпус {checkin[8]}, этаж {checkin[7]}, комната {checkin[6]}"
-            self.checkin_combo.addItem(checkin_text, checkin[0])
+            checkin_text = (f"{checkin.student_name} - Корпус {checkin.building_number}, "
+                            f"этаж {checkin.floor}, комната {checkin.room_number}")
+            self.checkin_combo.addItem(checkin_text, checkin.id)
     
     def load_commandants(self):
         commandants = self.commandant_model.get_all()
         self.commandant_combo.clear()
         for commandant in commandants:
-            name = f"{commandant[1]} {commandant[2]} {commandant[3] or ''}".strip()
-            self.commandant_combo.addItem(name, commandant[0])
+            name = f"{commandant.surname} {commandant.name} {commandant.patronymic or ''}".strip()
+            self.commandant_combo.addItem(name, commandant.id)
     
     def save(self):
         checkin_id = self.checkin_combo.currentData()
@@ -87,13 +88,14 @@ class CheckoutDialog(QDialog):
             QMessageBox.information(self, 'Успех', 'Студент успешно выселен')
             self.accept()
         except Exception as e:
-            QMessageBox.critical(self, 'Ошибка', str(e))
+            QMessageBox.critical(self, 'Ошибка', error_message(e))
 
 
 class CheckoutWindow(QWidget):
-    def __init__(self):
+    def __init__(self, session=None):
         super().__init__()
-        self.model = CheckoutModel()
+        self.session = session or AppSession.current()
+        self.model = self.session.checkouts
         self.init_ui()
         self.load_data()
     
@@ -123,35 +125,50 @@ class CheckoutWindow(QWidget):
         ])
         self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
         self.table.setSelectionMode(QTableWidget.SelectionMode.SingleSelection)
+        self.table.verticalScrollBar().valueChanged.connect(self.on_scroll)
+        self.next_token = None
         
         layout.addLayout(buttons_layout)
         layout.addWidget(self.table)
         self.setLayout(layout)
     
     def load_data(self):
-        checkouts = self.model.get_all()
-        self.table.setRowCount(len(checkouts))
-        
-        for row, checkout in enumerate(checkouts):
-            # checkout format: (id, checkin_id, commandant_id, checkout_date,
-            #                   student_name, commandant_name, room_number, floor, building_number, address)
-            self.table.setItem(row, 0, QTableWidgetItem(str(checkout[0])))
-            self.table.setItem(row, 1, QTableWidgetItem(str(checkout[4])))
-            self.table.setItem(row, 2, QTableWidgetItem(str(checkout[5])))
-            self.table.setItem(row, 3, QTableWidgetItem(str(checkout[8])))
-            self.table.setItem(row, 4, QTableWidgetItem(str(checkout[9])))
-            self.table.setItem(row, 5, QTableWidgetItem(str(checkout[7])))
-            self.table.setItem(row, 6, QTableWidgetItem(str(checkout[6])))
-            self.table.setItem(row, 7, QTableWidgetItem(str(checkout[3])))
+        """Загрузить первую страницу (новые первыми)"""
+        self.table.setRowCount(0)
+        self.next_token = None
+        self.load_page()
+        self.table.resizeColumnsToContents()
+    
+    def load_page(self, after_key=None):
+        """Добавить в таблицу страницу после токена after_key"""
+        page = self.model.page(after_key)
+        start = self.table.rowCount()
+        self.table.setRowCount(start + len(page))
+        
+        for row, checkout in enumerate(page, start):
+            self.table.setItem(row, 0, QTableWidgetItem(str(checkout.id)))
+            self.table.setItem(row, 1, QTableWidgetItem(str(checkout.student_name)))
+            self.table.setItem(row, 2, QTableWidgetItem(str(checkout.commandant_name)))
+            self.table.setItem(row, 3, QTableWidgetItem(str(checkout.building_number)))
+            self.table.setItem(row, 4, QTableWidgetItem(str(checkout.address)))
+            self.table.setItem(row, 5, QTableWidgetItem(str(checkout.floor)))
+            self.table.setItem(row, 6, QTableWidgetItem(str(checkout.room_number)))
+            self.table.setItem(row, 7, QTableWidgetItem(str(checkout.checkout_date)))
             
             for col in range(8):
                 item = self.table.item(row, col)
                 item.setFlags(item.flags() & ~Qt.ItemFlag.ItemIsEditable)
         
-        self.table.resizeColumnsToContents()
+        self.next_token = page.next_token
+    
+    def on_scroll(self, value):
+        """Подгрузить следующую страницу при прокрутке к концу таблицы"""
+        if self.next_token and value >= self.table.verticalScrollBar().maximum() - 5:
+            token, self.next_token = self.next_token, None
+            self.load_page(token)
 
     def add_checkout(self):
-        dialog = CheckoutDialog(self)
+        dialog = CheckoutDialog(self, session=self.session)
         if dialog.exec():
             self.load_data()
 
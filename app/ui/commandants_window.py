@@ -2,7 +2,8 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget,
                              QTableWidgetItem, QPushButton, QDialog, QFormLayout, 
                              QLineEdit, QMessageBox, QLabel, QFileDialog)
 from PyQt6.QtCore import Qt
-from app.models import CommandantModel
+from app.core.session import AppSession
+from app.utils.exceptions import error_message
 from app.utils.logger import setup_logger
 from app.utils.export import export_students_to_csv
 
@@ -10,10 +11,11 @@ logger = setup_logger('commandants_window')
 
 
 class CommandantDialog(QDialog):
-    def __init__(self, parent=None, commandant_id=None):
+    def __init__(self, parent=None, commandant_id=None, session=None):
         super().__init__(parent)
         self.commandant_id = commandant_id
-        self.model = CommandantModel()
+        self.session = session or AppSession.current()
+        self.model = self.session.commandants
         self.init_ui()
         
         if commandant_id:
@@ -105,10 +107,10 @@ class CommandantDialog(QDialog):
     def load_commandant(self):
         commandant = self.model.get_by_id(self.commandant_id)
         if commandant:
-            self.surname_edit.setText(commandant[1])
-            self.name_edit.setText(commandant[2])
-            self.patronymic_edit.setText(commandant[3] or '')
-            self.phone_edit.setText(commandant[4])
+            self.surname_edit.setText(commandant.surname)
+            self.name_edit.setText(commandant.name)
+            self.patronymic_edit.setText(commandant.patronymic or '')
+            self.phone_edit.setText(commandant.phone)
     
     def save(self):
         surname = self.surname_edit.text().strip()
@@ -137,9 +139,10 @@ class CommandantDialog(QDialog):
 
 
 class CommandantsWindow(QWidget):
-    def __init__(self):
+    def __init__(self, session=None):
         super().__init__()
-        self.model = CommandantModel()
+        self.session = session or AppSession.current()
+        self.model = self.session.commandants
         self.init_ui()
         self.load_data()
     
@@ -256,16 +259,11 @@ class CommandantsWindow(QWidget):
         if not hasattr(self, 'all_commandants'):
             return
         
-        search_text = self.search_edit.text().lower().strip()
+        search_text = self.search_edit.text().strip()
         
-        if search_text:
-            filtered = [
-                c for c in self.all_commandants
-                if (search_text in str(c[1]).lower() or  # фамилия
-                    search_text in str(c[2]).lower())    # имя
-            ]
-        else:
-            filtered = self.all_commandants
+        # Поиск по полнотекстовому индексу вместо перебора всех строк; фильтр таблицы
+        # показывает все совпадения, без ограничения SEARCH_LIMIT
+        filtered = self.model.search(search_text, limit=None) if search_text else self.all_commandants
         
         self.table.setRowCount(len(filtered))
         
@@ -279,7 +277,7 @@ class CommandantsWindow(QWidget):
         self.status_label.setText(f'Всего комендантов: {len(filtered)} / {len(self.all_commandants)}')
     
     def add_commandant(self):
-        dialog = CommandantDialog(self)
+        dialog = CommandantDialog(self, session=self.session)
         if dialog.exec():
             self.load_data()
     
@@ -290,7 +288,7 @@ class CommandantsWindow(QWidget):
             return
         
         commandant_id = int(self.table.item(selected[0].row(), 0).text())
-        dialog = CommandantDialog(self, commandant_id)
+        dialog = CommandantDialog(self, commandant_id, session=self.session)
         if dialog.exec():
             self.load_data()
     
@@ -316,7 +314,7 @@ class CommandantsWindow(QWidget):
                 QMessageBox.information(self, 'Успех', 'Комендант удален')
             except ValueError as e:
                 logger.warning(f"Нельзя удалить коменданта ID {commandant_id}: {e}")
-                QMessageBox.warning(self, 'Ошибка', str(e))
+                QMessageBox.warning(self, 'Ошибка', error_message(e))
             except Exception as e:
                 logger.error(f"Ошибка удаления коменданта: {e}")
                 QMessageBox.critical(self, 'Ошибка', f'Ошибка удаления: {str(e)}')
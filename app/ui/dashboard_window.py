@@ -4,16 +4,17 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
                              QPushButton, QGridLayout, QFrame)
 from PyQt6.QtCore import Qt
-from app.utils.statistics import Statistics
+from app.core.session import AppSession
 from app.utils.logger import setup_logger
 
 logger = setup_logger('dashboard')
 
 
 class DashboardWindow(QWidget):
-    def __init__(self):
+    def __init__(self, session=None):
         super().__init__()
-        self.statistics = Statistics()
+        self.session = session or AppSession.current()
+        self.statistics = self.session.statistics
         self.init_ui()
         self.load_statistics()
     
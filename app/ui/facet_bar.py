@@ -0,0 +1,61 @@
+from PyQt6.QtWidgets import QWidget, QHBoxLayout, QLabel, QComboBox
+from PyQt6.QtCore import pyqtSignal
+from app.core.sql_functions import natural_key
+
+
+class FacetBar(QWidget):
+    """Выпадающие списки признаков фасетного индекса со счетчиками записей"""
+    
+    # Изменен выбор в одном из списков
+    changed = pyqtSignal()
+    
+    def __init__(self, facets, parent=None):
+        """facets - пары (признак, подпись)"""
+        super().__init__(parent)
+        self.index = None
+        self.labels = {}
+        self.combos = {}
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        for facet, caption in facets:
+            combo = QComboBox()
+            combo.currentIndexChanged.connect(self.changed)
+            layout.addWidget(QLabel(f'{caption}:'))
+            layout.addWidget(combo)
+            self.combos[facet] = combo
+        layout.addStretch()
+        self.setLayout(layout)
+    
+    def set_index(self, index, labels=None):
+        """Индекс и подписи значений: признак -> {значение: подпись}"""
+        self.index = index
+        self.labels = labels or {}
+        self.refresh()
+    
+    def selection(self):
+        """Выбранные значения: признак -> [значение] (признаки без выбора не входят)"""
+        return {
+            facet: [combo.currentData()]
+            for facet, combo in self.combos.items() if combo.currentIndex() > 0
+        }
+    
+    def label(self, facet, value):
+        return str(self.labels.get(facet, {}).get(value, value))
+    
+    def refresh(self):
+        """Пересчитать счетчики значений с учетом выбора в остальных списках"""
+        if self.index is None:
+            return
+        counts = self.index.counts(self.selection())
+        for facet, combo in self.combos.items():
+            current = combo.currentData() if combo.currentIndex() > 0 else None
+            combo.blockSignals(True)
+            combo.clear()
+            combo.addItem('Все', None)
+            values = sorted((value for value in counts[facet] if value is not None),
+                            key=lambda value: natural_key(self.label(facet, value)))
+            for value in values:
+                combo.addItem(f'{self.label(facet, value)} ({counts[facet][value]})', value)
+            position = combo.findData(current) if current is not None else -1
+            combo.setCurrentIndex(max(position, 0))
+            combo.blockSignals(False)
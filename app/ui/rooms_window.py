@@ -2,15 +2,21 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget,
                              QTableWidgetItem, QPushButton, QDialog, QFormLayout, 
                              QLineEdit, QSpinBox, QDoubleSpinBox, QComboBox, QMessageBox)
 from PyQt6.QtCore import Qt
-from app.models import RoomModel, BuildingModel
+from app.core.session import AppSession
+from app.core.identity_map import IdentityMap
+from app.utils.exceptions import error_message
+from app.ui.facet_bar import FacetBar
 
 
 class RoomDialog(QDialog):
-    def __init__(self, parent=None, room_id=None):
+    def __init__(self, parent=None, room_id=None, session=None):
         super().__init__(parent)
         self.room_id = room_id
-        self.room_model = RoomModel()
-        self.building_model = BuildingModel()
+        self.session = session or AppSession.current()
+        self.room_model = self.session.rooms
+        self.building_model = self.session.buildings
+        # Корпуса, прочитанные диалогом, повторно из БД не читаются
+        self.identity_map = IdentityMap()
         self.init_ui()
         
         if room_id:
@@ -61,31 +67,32 @@ class RoomDialog(QDialog):
     
     def load_buildings(self):
         buildings = self.building_model.get_all()
+        self.identity_map.store('buildings', [b.id for b in buildings], {b.id: b for b in buildings})
         self.building_combo.clear()
         for building in buildings:
-            self.building_combo.addItem(f"{building[1]} - {building[2]}", building[0])
+            self.building_combo.addItem(f"{building.building_number} - {building.address}", building.id)
     
     def update_floors(self):
         building_id = self.building_combo.currentData()
         if building_id:
-            building = self.building_model.get_by_id(building_id)
+            with self.identity_map:
+                building = self.building_model.get_by_id(building_id)
             if building:
-                self.floor_spin.setMaximum(building[3])
+                self.floor_spin.setMaximum(building.floors_count)
     
     def load_room(self):
         room = self.room_model.get_by_id(self.room_id)
         if room:
-            # room format: (id, building_id, floor, room_number, capacity, area, building_number, address)
-            building_id = room[1]
+            building_id = room.building_id
             for i in range(self.building_combo.count()):
                 if self.building_combo.itemData(i) == building_id:
                     self.building_combo.setCurrentIndex(i)
                     break
-            self.floor_spin.setValue(room[2])
-            self.room_number_edit.setText(room[3])
-            self.capacity_spin.setValue(room[4])
-            if room[5]:
-                self.area_spin.setValue(room[5])
+            self.floor_spin.setValue(room.floor)
+            self.room_number_edit.setText(room.room_number)
+            self.capacity_spin.setValue(room.capacity)
+            if room.area:
+                self.area_spin.setValue(room.area)
     
     def save(self):
         building_id = self.building_combo.currentData()
@@ -109,9 +116,16 @@ class RoomDialog(QDialog):
 
 
 class RoomsWindow(QWidget):
-    def __init__(self):
+    # Признаки фильтра (фасетный индекс комнат)
+    FACETS = (
+        ('building', 'Корпус'), ('floor', 'Этаж'), ('gender', 'Проживают'),
+        ('has_free', 'Свободные места'), ('capacity', 'Мест'),
+    )
+    
+    def __init__(self, session=None):
         super().__init__()
-        self.model = RoomModel()
+        self.session = session or AppSession.current()
+        self.model = self.session.rooms
         self.init_ui()
         self.load_data()
     
@@ -139,6 +153,10 @@ class RoomsWindow(QWidget):
         buttons_layout.addStretch()
         buttons_layout.addWidget(self.refresh_btn)
         
+        # Фильтры по признакам со счетчиками
+        self.facet_bar = FacetBar(self.FACETS)
+        self.facet_bar.changed.connect(self.filter_data)
+        
         # Таблица
         self.table = QTableWidget()
         self.table.setColumnCount(7)
@@ -149,22 +167,39 @@ class RoomsWindow(QWidget):
         self.table.setSelectionMode(QTableWidget.SelectionMode.SingleSelection)
         
         layout.addLayout(buttons_layout)
+        layout.addWidget(self.facet_bar)
         layout.addWidget(self.table)
         self.setLayout(layout)
     
     def load_data(self):
-        rooms = self.model.get_all()
+        self.all_rooms = self.model.get_all()
+        buildings = {b.id: b.building_number for b in self.session.buildings.get_all()}
+        self.facet_bar.set_index(self.model.facet_index(), {
+            'building': buildings,
+            'gender': {'MIXED': 'М и Ж'},
+            'has_free': {1: 'Есть', 0: 'Нет'},
+        })
+        self.filter_data()
+    
+    def filter_data(self):
+        """Комнаты, подходящие под выбранные признаки"""
+        rooms = self.all_rooms
+        selection = self.facet_bar.selection()
+        self.facet_bar.refresh()
+        if selection:
+            index = self.facet_bar.index
+            ids = set(index.keys(index.select(selection)))
+            rooms = [room for room in rooms if room.id in ids]
         self.table.setRowCount(len(rooms))
         
         for row, room in enumerate(rooms):
-            # room format: (id, building_id, floor, room_number, capacity, area, building_number, address)
-            self.table.setItem(row, 0, QTableWidgetItem(str(room[0])))
-            self.table.setItem(row, 1, QTableWidgetItem(str(room[6])))
-            self.table.setItem(row, 2, QTableWidgetItem(str(room[7])))
-            self.table.setItem(row, 3, QTableWidgetItem(str(room[2])))
-            self.table.setItem(row, 4, QTableWidgetItem(str(room[3])))
-            self.table.setItem(row, 5, QTableWidgetItem(str(room[4])))
-            area_text = f"{room[5]:.2f}" if room[5] else ""
+            self.table.setItem(row, 0, QTableWidgetItem(str(room.id)))
+            self.table.setItem(row, 1, QTableWidgetItem(str(room.building_number)))
+            self.table.setItem(row, 2, QTableWidgetItem(str(room.address)))
+            self.table.setItem(row, 3, QTableWidgetItem(str(room.floor)))
+            self.table.setItem(row, 4, QTableWidgetItem(str(room.room_number)))
+            self.table.setItem(row, 5, QTableWidgetItem(str(room.capacity)))
+            area_text = f"{room.area:.2f}" if room.area else ""
             self.table.setItem(row, 6, QTableWidgetItem(area_text))
             
             for col in range(7):
@@ -174,7 +209,7 @@ class RoomsWindow(QWidget):
         self.table.resizeColumnsToContents()
     
     def add_room(self):
-        dialog = RoomDialog(self)
+        dialog = RoomDialog(self, session=self.session)
         if dialog.exec():
             self.load_data()
     
@@ -185,7 +220,7 @@ class RoomsWindow(QWidget):
             return
         
         room_id = int(self.table.item(selected[0].row(), 0).text())
-        dialog = RoomDialog(self, room_id)
+        dialog = RoomDialog(self, room_id, session=self.session)
         if dialog.exec():
             self.load_data()
     
@@ -209,5 +244,5 @@ class RoomsWindow(QWidget):
                 self.load_data()
                 QMessageBox.information(self, 'Успех', 'Комната удалена')
             except ValueError as e:
-                QMessageBox.warning(self, 'Ошибка', str(e))
+                QMessageBox.warning(self, 'Ошибка', error_message(e))
 
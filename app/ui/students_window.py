@@ -2,19 +2,22 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget,
                              QTableWidgetItem, QPushButton, QDialog, QFormLayout, 
                              QLineEdit, QComboBox, QMessageBox, QLabel)
 from PyQt6.QtCore import Qt
-from app.models import StudentModel
+from app.core.session import AppSession
+from app.utils.exceptions import error_message
 from app.utils.logger import setup_logger
 from app.utils.export import export_students_to_csv
+from app.ui.facet_bar import FacetBar
 from PyQt6.QtWidgets import QFileDialog
 
 logger = setup_logger('students_window')
 
 
 class StudentDialog(QDialog):
-    def __init__(self, parent=None, student_id=None):
+    def __init__(self, parent=None, student_id=None, session=None):
         super().__init__(parent)
         self.student_id = student_id
-        self.model = StudentModel()
+        self.session = session or AppSession.current()
+        self.model = self.session.students
         self.init_ui()
         
         if student_id:
@@ -59,13 +62,13 @@ class StudentDialog(QDialog):
     def load_student(self):
         student = self.model.get_by_id(self.student_id)
         if student:
-            self.surname_edit.setText(student[1])
-            self.name_edit.setText(student[2])
-            self.patronymic_edit.setText(student[3] or '')
-            self.gender_combo.setCurrentText(student[4])
-            self.phone_edit.setText(student[5])
-            self.email_edit.setText(student[6] or '')
-            self.group_edit.setText(student[7])
+            self.surname_edit.setText(student.surname)
+            self.name_edit.setText(student.name)
+            self.patronymic_edit.setText(student.patronymic or '')
+            self.gender_combo.setCurrentText(student.gender)
+            self.phone_edit.setText(student.phone)
+            self.email_edit.setText(student.email or '')
+            self.group_edit.setText(student.group_number)
     
     def save(self):
         surname = self.surname_edit.text().strip()
@@ -97,9 +100,16 @@ class StudentDialog(QDialog):
 
 
 class StudentsWindow(QWidget):
-    def __init__(self):
+    # Признаки фильтра (фасетный индекс студентов)
+    FACETS = (
+        ('gender', 'Пол'), ('group', 'Группа'), ('building', 'Корпус'),
+        ('floor', 'Этаж'), ('resident', 'Проживает'), ('has_email', 'Email'),
+    )
+    
+    def __init__(self, session=None):
         super().__init__()
-        self.model = StudentModel()
+        self.session = session or AppSession.current()
+        self.model = self.session.students
         self.init_ui()
         self.load_data()
     
@@ -140,6 +150,10 @@ class StudentsWindow(QWidget):
         search_layout.addWidget(search_label)
         search_layout.addWidget(self.search_edit)
         
+        # Фильтры по признакам со счетчиками
+        self.facet_bar = FacetBar(self.FACETS)
+        self.facet_bar.changed.connect(self.filter_data)
+        
         # Кнопки управления
         buttons_layout = QHBoxLayout()
         buttons_layout.setSpacing(10)
@@ -197,6 +211,7 @@ class StudentsWindow(QWidget):
         """)
         
         layout.addLayout(search_layout)
+        layout.addWidget(self.facet_bar)
         layout.addLayout(buttons_layout)
         layout.addWidget(self.table)
         layout.addWidget(self.status_label)
@@ -206,6 +221,12 @@ class StudentsWindow(QWidget):
         try:
             students = self.model.get_all()
             self.all_students = students
+            buildings = {b.id: b.building_number for b in self.session.buildings.get_all()}
+            self.facet_bar.set_index(self.model.facet_index(), {
+                'building': buildings,
+                'resident': {1: 'Да', 0: 'Нет'},
+                'has_email': {1: 'Есть', 0: 'Нет'},
+            })
             self.filter_data()
             logger.info(f"Загружено {len(students)} студентов")
         except Exception as e:
@@ -217,17 +238,19 @@ class StudentsWindow(QWidget):
         if not hasattr(self, 'all_students'):
             return
         
-        search_text = self.search_edit.text().lower().strip()
+        search_text = self.search_edit.text().strip()
+        
+        # Поиск по полнотекстовому индексу вместо перебора всех строк; фильтр таблицы
+        # показывает все совпадения, без ограничения SEARCH_LIMIT
+        filtered = self.model.search(search_text, limit=None) if search_text else self.all_students
         
-        if search_text:
-            filtered = [
-                s for s in self.all_students
-                if (search_text in str(s[1]).lower() or  # фамилия
-                    search_text in str(s[2]).lower() or  # имя
-                    search_text in str(s[7]).lower())    # группа
-            ]
-        else:
-            filtered = self.all_students
+        # Условия по признакам - битовые операции фасетного индекса
+        selection = self.facet_bar.selection()
+        self.facet_bar.refresh()
+        if selection:
+            index = self.facet_bar.index
+            ids = set(index.keys(index.select(selection)))
+            filtered = [student for student in filtered if student.id in ids]
         
         self.table.setRowCount(len(filtered))
         
@@ -241,7 +264,7 @@ class StudentsWindow(QWidget):
         self.status_label.setText(f'Всего студентов: {len(filtered)} / {len(self.all_students)}')
     
     def add_student(self):
-        dialog = StudentDialog(self)
+        dialog = StudentDialog(self, session=self.session)
         if dialog.exec():
             self.load_data()
     
@@ -252,7 +275,7 @@ class StudentsWindow(QWidget):
             return
         
         student_id = int(self.table.item(selected[0].row(), 0).text())
-        dialog = StudentDialog(self, student_id)
+        dialog = StudentDialog(self, student_id, session=self.session)
         if dialog.exec():
             self.load_data()
     
@@ -278,7 +301,7 @@ class StudentsWindow(QWidget):
                 QMessageBox.information(self, 'Успех', 'Студент удален')
             except ValueError as e:
                 logger.warning(f"Нельзя удалить студента ID {student_id}: {e}")
-                QMessageBox.warning(self, 'Ошибка', str(e))
+                QMessageBox.warning(self, 'Ошибка', error_message(e))
             except Exception as e:
                 logger.error(f"Ошибка удаления студента: {e}")
                 QMessageBox.critical(self, 'Ошибка', f'Ошибка удаления: {str(e)}')
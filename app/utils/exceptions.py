@@ -34,8 +34,8 @@ class DatabaseException(DormitoryException):
         self.sql_error = sql_error
 
 
-class BusinessRuleException(DormitoryException):
-    """Нарушение бизнес-правил"""
+class BusinessRuleException(DormitoryException, ValueError):
+    """Нарушение бизнес-правил (совместимо с ValueError, который ожидают окна)"""
     
     def __init__(self, message: str, rule_name: Optional[str] = None):
         super().__init__(message, "BUSINESS_RULE_VIOLATION")
@@ -49,3 +49,7 @@ class NotFoundException(DormitoryException):
         super().__init__(message, "NOT_FOUND")
         self.entity_type = entity_type
 
+
+def error_message(error: Exception) -> str:
+    """Текст ошибки для показа пользователю (без кода ошибки)"""
+    return getattr(error, 'message', None) or str(error)
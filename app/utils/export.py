@@ -10,7 +10,7 @@ logger = setup_logger('export')
 
 
 def export_students_to_csv(students, filename=None):
-    """Экспорт студентов в CSV"""
+    """Экспорт студентов в CSV (students - список или итератор строк)"""
     if filename is None:
         filename = f"students_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
     
@@ -18,9 +18,11 @@ def export_students_to_csv(students, filename=None):
         with open(filename, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             writer.writerow(['ID', 'Фамилия', 'Имя', 'Отчество', 'Пол', 'Телефон', 'Email', 'Группа'])
+            count = 0
             for student in students:
                 writer.writerow(student)
-        logger.info(f"Экспортировано {len(students)} студентов в {filename}")
+                count += 1
+        logger.info(f"Экспортировано {count} студентов в {filename}")
         return filename
     except Exception as e:
         logger.error(f"Ошибка экспорта: {e}")
@@ -28,7 +30,7 @@ def export_students_to_csv(students, filename=None):
 
 
 def export_checkins_to_csv(checkins, filename=None):
-    """Экспорт заселений в CSV"""
+    """Экспорт заселений в CSV (checkins - список или итератор, например CheckinModel.iter_all())"""
     if filename is None:
         filename = f"checkins_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
     
@@ -36,12 +38,14 @@ def export_checkins_to_csv(checkins, filename=None):
         with open(filename, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             writer.writerow(['ID', 'Студент', 'Комендант', 'Корпус', 'Адрес', 'Этаж', 'Комната', 'Дата заселения'])
+            count = 0
             for checkin in checkins:
                 writer.writerow([
-                    checkin[0], checkin[5], checkin[6], checkin[9], 
-                    checkin[10], checkin[8], checkin[7], checkin[4]
+                    checkin.id, checkin.student_name, checkin.commandant_name, checkin.building_number,
+                    checkin.address, checkin.floor, checkin.room_number, checkin.checkin_date
                 ])
-        logger.info(f"Экспортировано {len(checkins)} заселений в {filename}")
+                count += 1
+        logger.info(f"Экспортировано {count} заселений в {filename}")
         return filename
     except Exception as e:
         logger.error(f"Ошибка экспорта: {e}")
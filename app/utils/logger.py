@@ -8,7 +8,11 @@ from datetime import datetime
 
 
 def setup_logger(name='dormitory', log_file='dormitory.log'):
-    """Настройка логгера"""
+    """Настройка логгера (повторный вызов возвращает уже настроенный логгер)"""
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+    
     # Создаем директорию для логов
     project_root = Path(__file__).parent.parent.parent
     log_dir = project_root / 'logs'
@@ -33,7 +37,6 @@ def setup_logger(name='dormitory', log_file='dormitory.log'):
     console_handler.setFormatter(formatter)
     
     # Логгер
-    logger = logging.getLogger(name)
     logger.setLevel(logging.DEBUG)
     logger.addHandler(file_handler)
     logger.addHandler(console_handler)
@@ -2,6 +2,8 @@
 Модуль статистики
 """
 from app.models import StudentModel, RoomModel, CheckinModel, BuildingModel
+from app.core.query_cache import cached
+from app.core.snapshot import COUNTED_TABLES
 from app.utils.logger import setup_logger
 
 logger = setup_logger('statistics')
@@ -10,11 +12,18 @@ logger = setup_logger('statistics')
 class Statistics:
     """Класс для получения статистики"""
     
-    def __init__(self):
-        self.student_model = StudentModel()
-        self.room_model = RoomModel()
-        self.checkin_model = CheckinModel()
-        self.building_model = BuildingModel()
+    def __init__(self, session=None):
+        if session is not None:
+            # Модели общей сессии приложения
+            self.student_model = session.students
+            self.room_model = session.rooms
+            self.checkin_model = session.checkins
+            self.building_model = session.buildings
+        else:
+            self.student_model = StudentModel()
+            self.room_model = RoomModel()
+            self.checkin_model = CheckinModel()
+            self.building_model = BuildingModel()
     
     def get_total_students(self):
         """Общее количество студентов"""
@@ -30,33 +39,19 @@ class Statistics:
     
     def get_occupied_rooms(self):
         """Количество занятых комнат"""
-        rooms = self.room_model.get_all()
-        occupied = 0
-        for room in rooms:
-            occupancy = self.room_model.get_current_occupancy(room[0])
-            if occupancy > 0:
-                occupied += 1
-        return occupied
+        return self.room_model.get_occupied_count()
     
     def get_total_checkins(self):
         """Общее количество заселений"""
-        return len(self.checkin_model.get_all())
+        return self.checkin_model.count_all()
     
     def get_active_checkins(self):
         """Количество активных заселений"""
-        return len(self.checkin_model.get_active_checkins())
+        return self.checkin_model.count_active()
     
     def get_occupancy_rate(self):
         """Процент заселенности"""
-        rooms = self.room_model.get_all()
-        if not rooms:
-            return 0.0
-        
-        total_capacity = sum(room[4] for room in rooms)  # capacity
-        total_occupied = 0
-        
-        for room in rooms:
-            total_occupied += self.room_model.get_current_occupancy(room[0])
+        total_capacity, total_occupied = self.building_model.get_occupancy_totals()
         
         if total_capacity == 0:
             return 0.0
@@ -66,24 +61,27 @@ class Statistics:
     def get_gender_distribution(self):
         """Распределение по полу"""
         students = self.student_model.get_all()
-        male = sum(1 for s in students if s[4] == 'М')
-        female = sum(1 for s in students if s[4] == 'Ж')
+        male = sum(1 for s in students if s.gender == 'М')
+        female = sum(1 for s in students if s.gender == 'Ж')
         return {'М': male, 'Ж': female, 'Всего': len(students)}
     
     def get_all_statistics(self):
-        """Получить всю статистику"""
+        """Получить всю статистику (сохраняется в снимок для быстрого запуска)"""
         try:
-            return {
-                'total_students': self.get_total_students(),
-                'total_rooms': self.get_total_rooms(),
-                'total_buildings': self.get_total_buildings(),
-                'occupied_rooms': self.get_occupied_rooms(),
-                'total_checkins': self.get_total_checkins(),
-                'active_checkins': self.get_active_checkins(),
-                'occupancy_rate': self.get_occupancy_rate(),
-                'gender_distribution': self.get_gender_distribution()
-            }
+            return cached(self.student_model.db, 'statistics', COUNTED_TABLES, self._collect, persist=True)
         except Exception as e:
             logger.error(f"Ошибка получения статистики: {e}")
             return {}
+    
+    def _collect(self):
+        return {
+            'total_students': self.get_total_students(),
+            'total_rooms': self.get_total_rooms(),
+            'total_buildings': self.get_total_buildings(),
+            'occupied_rooms': self.get_occupied_rooms(),
+            'total_checkins': self.get_total_checkins(),
+            'active_checkins': self.get_active_checkins(),
+            'occupancy_rate': self.get_occupancy_rate(),
+            'gender_distribution': self.get_gender_distribution()
+        }
 
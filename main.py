@@ -3,8 +3,9 @@
 Информационная система управления студенческим общежитием
 """
 import sys
+import threading
 from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QStackedWidget, QLabel, QMessageBox
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, pyqtSignal
 from app.ui.students_window import StudentsWindow
 from app.ui.commandants_window import CommandantsWindow
 from app.ui.buildings_window import BuildingsWindow
@@ -12,6 +13,8 @@ from app.ui.rooms_window import RoomsWindow
 from app.ui.checkin_window import CheckinWindow
 from app.ui.checkout_window import CheckoutWindow
 from app.ui.dashboard_window import DashboardWindow
+from app.core import snapshot
+from app.core.session import AppSession
 from app.utils.styles import APP_STYLE
 from app.utils.logger import setup_logger
 
@@ -19,9 +22,16 @@ logger = setup_logger('main')
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    # Фоновая сверка снимка нашла изменения - текущее окно перечитывается
+    snapshot_reconciled = pyqtSignal()
+    
+    def __init__(self, session=None):
         super().__init__()
+        self.session = session or AppSession.current()
+        # Окна получают справочники и статистику из снимка прошлого запуска
+        self.snapshot = snapshot.warm_start(self.session.db)
         self.init_ui()
+        self.start_reconcile()
     
     def init_ui(self):
         self.setWindowTitle('🏠 Информационная система управления студенческим общежитием')
@@ -101,13 +111,13 @@ class MainWindow(QMainWindow):
         self.stacked_widget = QStackedWidget()
         
         # Создание окон
-        self.dashboard_window = DashboardWindow()
-        self.students_window = StudentsWindow()
-        self.commandants_window = CommandantsWindow()
-        self.buildings_window = BuildingsWindow()
-        self.rooms_window = RoomsWindow()
-        self.checkin_window = CheckinWindow()
-        self.checkout_window = CheckoutWindow()
+        self.dashboard_window = DashboardWindow(self.session)
+        self.students_window = StudentsWindow(self.session)
+        self.commandants_window = CommandantsWindow(self.session)
+        self.buildings_window = BuildingsWindow(self.session)
+        self.rooms_window = RoomsWindow(self.session)
+        self.checkin_window = CheckinWindow(self.session)
+        self.checkout_window = CheckoutWindow(self.session)
         
         self.stacked_widget.addWidget(self.dashboard_window)
         self.stacked_widget.addWidget(self.students_window)
@@ -123,6 +133,21 @@ class MainWindow(QMainWindow):
         # Показать первое окно
         self.show_window(0)
     
+    def start_reconcile(self):
+        """Перечитать в фоне устаревшие записи снимка"""
+        if self.snapshot is None:
+            return
+        self.snapshot_reconciled.connect(lambda: self.show_window(self.stacked_widget.currentIndex()))
+        
+        def reconcile():
+            try:
+                if self.snapshot.reconcile():
+                    self.snapshot_reconciled.emit()
+            except Exception as e:
+                logger.warning(f"Сверка снимка не выполнена: {e}")
+        
+        threading.Thread(target=reconcile, name='snapshot-reconcile', daemon=True).start()
+    
     def show_window(self, index):
         self.stacked_widget.setCurrentIndex(index)
         
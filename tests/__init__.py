@@ -1,2 +1,12 @@
 # Tests package
+from pathlib import Path
+from app.database import Database
 
+
+def make_test_database(db_name):
+    """Создать Database для отдельного тестового файла БД"""
+    db = Database.__new__(Database)
+    db.db_path = Path(db_name)
+    db.db_name = str(db_name)
+    db.init_database()
+    return db
@@ -11,7 +11,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from app.models import StudentModel, CommandantModel, BuildingModel, RoomModel, CheckinModel, CheckoutModel
-from app.database import Database
+from tests import make_test_database
 
 
 class BlackBoxTestStudent(unittest.TestCase):
@@ -19,21 +19,10 @@ class BlackBoxTestStudent(unittest.TestCase):
     
     def setUp(self):
         """Создание тестовой БД"""
-        self.test_db = 'test_dormitory.db'
+        self.test_db = str(Path(__file__).parent.parent / 'test_dormitory.db')
         if os.path.exists(self.test_db):
             os.remove(self.test_db)
-        # Монkey-patch для использования тестовой БД
-        import app.database
-        original_init = Database.__init__
-        def test_init(self, db_name='test_dormitory.db'):
-            from pathlib import Path
-            project_root = Path(__file__).parent.parent
-            self.db_path = project_root / db_name
-            self.db_name = str(self.db_path)
-            self.init_database()
-        Database.__init__ = test_init
-        
-        self.model = StudentModel()
+        self.model = StudentModel(make_test_database(self.test_db))
     
     def tearDown(self):
         """Очистка после тестов"""
@@ -104,15 +93,16 @@ class BlackBoxTestCheckin(unittest.TestCase):
     
     def setUp(self):
         """Создание тестовых данных"""
-        self.test_db = 'test_dormitory.db'
+        self.test_db = str(Path(__file__).parent.parent / 'test_dormitory.db')
         if os.path.exists(self.test_db):
             os.remove(self.test_db)
+        self.db = make_test_database(self.test_db)
         
-        self.student_model = StudentModel()
-        self.commandant_model = CommandantModel()
-        self.building_model = BuildingModel()
-        self.room_model = RoomModel()
-        self.checkin_model = CheckinModel()
+        self.student_model = StudentModel(self.db)
+        self.commandant_model = CommandantModel(self.db)
+        self.building_model = BuildingModel(self.db)
+        self.room_model = RoomModel(self.db)
+        self.checkin_model = CheckinModel(self.db)
         
         # Создаем тестовые данные
         self.student_id = self.student_model.create(
@@ -187,6 +177,48 @@ class BlackBoxTestCheckin(unittest.TestCase):
             self.checkin_model.create(
                 student_female_id, self.commandant_id, self.room_id, '2024-01-02'
             )
+    
+    def test_delete_student_with_checkin(self):
+        """Тест удаления студента, который проживал в общежитии"""
+        self.checkin_model.create(
+            self.student_id, self.commandant_id, self.room_id, '2024-01-01'
+        )
+        
+        with self.assertRaises(ValueError):
+            self.student_model.delete(self.student_id)
+        self.assertIsNotNone(self.student_model.get_by_id(self.student_id))
+    
+    def test_delete_commandant_with_checkin(self):
+        """Тест удаления коменданта, оформлявшего заселение"""
+        self.checkin_model.create(
+            self.student_id, self.commandant_id, self.room_id, '2024-01-01'
+        )
+        
+        with self.assertRaises(ValueError):
+            self.commandant_model.delete(self.commandant_id)
+    
+    def test_delete_building_with_rooms(self):
+        """Тест удаления корпуса, в котором есть комнаты"""
+        with self.assertRaises(ValueError):
+            self.building_model.delete(self.building_id)
+    
+    def test_checkout_twice(self):
+        """Тест повторного выселения"""
+        checkin_id = self.checkin_model.create(
+            self.student_id, self.commandant_id, self.room_id, '2024-01-01'
+        )
+        checkout_model = CheckoutModel(self.db)
+        checkout_model.create(checkin_id, self.commandant_id, '2024-02-01')
+        
+        with self.assertRaises(ValueError):
+            checkout_model.create(checkin_id, self.commandant_id, '2024-02-02')
+    
+    def test_checkin_unknown_commandant(self):
+        """Тест заселения с несуществующим комендантом"""
+        with self.assertRaises(ValueError):
+            self.checkin_model.create(
+                self.student_id, 9999, self.room_id, '2024-01-01'
+            )
 
 
 if __name__ == '__main__':
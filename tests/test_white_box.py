@@ -5,17 +5,32 @@
 import unittest
 import os
 import sys
+import sqlite3
+import threading
+import time
 from pathlib import Path
 
 # Добавляем корневую директорию в путь
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from app.models import StudentModel, RoomModel, CheckinModel
+from app.models import StudentModel, CommandantModel, BuildingModel, RoomModel, CheckinModel, CheckoutModel
 from app.database import Database
+from app.core.base_model import BaseModel
+from app.core.db_manager import ConnectionPool, DatabaseManager, STATEMENT_CACHE_SIZE, is_read_only
+from app.core.query_log import QueryLog
+from app.core.residencies import rebuild_intervals
+from app.core import migrations
+from app.core.db_config import PROFILES, PROFILE_ENV, resolve_profile
+from app.core.search import SEARCH_LIMIT
+from app.core.session import AppSession
+from app.core.writer import DatabaseWriter
+from app.utils.logger import setup_logger
+from app.utils.exceptions import DatabaseException
 from app.utils.validators import (
     validate_name, validate_phone, validate_email, validate_gender,
     ValidationError
 )
+from tests import make_test_database
 
 
 class WhiteBoxTestValidators(unittest.TestCase):
@@ -176,6 +191,1610 @@ class WhiteBoxTestRoomOccupancy(unittest.TestCase):
         
         gender = self.room_model.get_room_gender(self.room_id)
         self.assertIsNone(gender)  # Комната пуста после выселения
+    
+    def test_floor_and_building_occupancy(self):
+        """Счетчики этажа и корпуса следуют за заселением и выселением"""
+        self.room_model.create(self.building_id, 2, '201', 3)
+        checkin_id = self.checkin_model.create(
+            self.student_id, self.commandant_id, self.room_id, '2024-01-01'
+        )
+        self.assertEqual(
+            [tuple(row) for row in self.building_model.get_floor_occupancy(self.building_id)],
+            [(1, 2, 1, 1), (2, 3, 0, 3)]
+        )
+        self.assertEqual(self.building_model.get_occupancy_totals(), (5, 1))
+        
+        from app.models import CheckoutModel
+        CheckoutModel().create(checkin_id, self.commandant_id, '2024-01-02')
+        building = self.building_model.get_occupancy(self.building_id)[0]
+        self.assertEqual(tuple(building[2:]), (5, 0, 5))
+    
+    def test_ledger_matches_rebuild(self):
+        """Счетчики триггеров совпадают с полным пересчетом"""
+        from app.core.ledger import LEDGER_TABLES, rebuild_ledger
+        from app.models import CheckoutModel
+        
+        student2_id = self.student_model.create(
+            'Сидоров', 'Сидор', None, 'М', '+79001234570', None, 'ИВТ-21'
+        )
+        self.checkin_model.create(self.student_id, self.commandant_id, self.room_id, '2024-01-01')
+        checkin_id = self.checkin_model.create(student2_id, self.commandant_id, self.room_id, '2024-01-02')
+        CheckoutModel().create(checkin_id, self.commandant_id, '2024-02-01')
+        building2_id = self.building_model.create('2', 'ул. Ленина, 2', 3)
+        self.room_model.update(self.room_id, building2_id, 3, '301', 4, 20.5)
+        self.student_model.update(
+            self.student_id, 'Иванова', 'Анна', None, 'Ж', '+79001234567', None, 'ИВТ-21'
+        )
+        
+        def snapshot():
+            conn = self.room_model.db.get_connection()
+            try:
+                return {
+                    table: sorted(tuple(row) for row in conn.execute(f'SELECT * FROM {table}'))
+                    for table in LEDGER_TABLES
+                }
+            finally:
+                conn.close()
+        
+        maintained = snapshot()
+        self.room_model.db.write(rebuild_ledger)
+        self.assertEqual(maintained, snapshot())
+        self.assertEqual(self.room_model.get_room_gender(self.room_id), 'Ж')
+    
+    def test_residencies_follow_checkins(self):
+        """Проживания синхронизируются триггерами, активные читаются по частичному индексу"""
+        from app.models import CheckoutModel
+        
+        checkin_id = self.checkin_model.create(
+            self.student_id, self.commandant_id, self.room_id, '2024-01-01'
+        )
+        active = self.checkin_model.get_active_checkins()
+        self.assertEqual([row[0] for row in active], [checkin_id])
+        self.assertEqual(self.checkin_model.count_active(), 1)
+        self.assertEqual([row[0] for row in self.checkin_model.get_active_by_room(self.room_id)], [checkin_id])
+        
+        CheckoutModel().create(checkin_id, self.commandant_id, '2024-02-01')
+        self.assertEqual(self.checkin_model.get_active_checkins(), [])
+        self.assertEqual(self.checkin_model.count_active(), 0)
+        
+        conn = self.room_model.db.get_connection()
+        try:
+            row = conn.execute(
+                'SELECT checkout_date FROM residencies WHERE checkin_id = ?', (checkin_id,)
+            ).fetchone()
+            self.assertEqual(row[0], '2024-02-01')
+            plan = ' '.join(row[3] for row in conn.execute(
+                'EXPLAIN QUERY PLAN SELECT checkin_id FROM residencies '
+                'WHERE checkout_date IS NULL ORDER BY checkin_date DESC'
+            ))
+            self.assertIn('idx_residencies_active', plan)
+        finally:
+            conn.close()
+
+
+class WhiteBoxTestConnectionPool(unittest.TestCase):
+    """Тесты пула соединений (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_pool.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.pool = ConnectionPool(self.test_db, max_size=2, timeout=0.1)
+    
+    def tearDown(self):
+        self.pool.close_all()
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_reuse_in_same_thread(self):
+        """Соединение, возвращенное в пул, повторно выдается тому же потоку"""
+        conn = self.pool.acquire()
+        conn.close()
+        again = self.pool.acquire()
+        self.assertIs(conn, again)
+        again.close()
+        stats = self.pool.stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['thread_hits'], 1)
+        self.assertEqual(stats['in_use'], 0)
+    
+    def test_size_limit(self):
+        """При исчерпании пула выдача завершается ошибкой по таймауту"""
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        with self.assertRaises(DatabaseException):
+            self.pool.acquire()
+        first.close()
+        third = self.pool.acquire()
+        self.assertIs(third, first)
+        second.close()
+        third.close()
+    
+    def test_uncommitted_transaction_rolled_back(self):
+        """Незавершенная транзакция откатывается при возврате в пул"""
+        conn = self.pool.acquire()
+        conn.execute('CREATE TABLE t (x INTEGER)')
+        conn.commit()
+        conn.execute('INSERT INTO t VALUES (1)')
+        conn.close()
+        conn = self.pool.acquire()
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM t').fetchone()[0], 0)
+        conn.close()
+    
+    def test_replaced_file_not_reused(self):
+        """После удаления файла БД старые соединения не используются"""
+        conn = self.pool.acquire()
+        conn.execute('CREATE TABLE t (x INTEGER)')
+        conn.commit()
+        conn.close()
+        os.remove(self.test_db)
+        conn = self.pool.acquire()
+        tables = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        self.assertEqual(tables, [])
+        conn.close()
+
+
+class WhiteBoxTestMigrations(unittest.TestCase):
+    """Тесты миграций схемы (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_migrations.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.pool = ConnectionPool(self.test_db)
+    
+    def tearDown(self):
+        self.pool.close_all()
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_migrate_sets_user_version(self):
+        """Миграции применяются по порядку и записывают версию схемы"""
+        conn = self.pool.acquire()
+        version = migrations.migrate(conn)
+        self.assertEqual(version, migrations.LATEST_VERSION)
+        self.assertEqual(migrations.get_version(conn), migrations.LATEST_VERSION)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertTrue({'students', 'rooms', 'checkins', 'checkouts'} <= tables)
+        conn.close()
+    
+    def test_migrate_only_pending(self):
+        """Уже примененные миграции не выполняются повторно"""
+        applied = []
+        steps = [
+            migrations.Migration(1, 'первая', [lambda conn: applied.append(1)]),
+            migrations.Migration(2, 'вторая', [lambda conn: applied.append(2)]),
+        ]
+        conn = self.pool.acquire()
+        migrations.migrate(conn, steps[:1])
+        migrations.migrate(conn, steps)
+        self.assertEqual(applied, [1, 2])
+        self.assertEqual(migrations.get_version(conn), 2)
+        conn.close()
+    
+    def test_schema_checked_once(self):
+        """Повторное создание Database не обращается к БД"""
+        db = Database.__new__(Database)
+        db.db_path = Path(self.test_db)
+        db.db_name = self.test_db
+        db.init_database()
+        checkouts = db.pool.stats()['checkouts']
+        for _ in range(10):
+            db.init_database()
+        self.assertEqual(db.pool.stats()['checkouts'], checkouts)
+        conn = db.get_connection()
+        self.assertEqual(migrations.get_version(conn), migrations.LATEST_VERSION)
+        conn.close()
+
+
+class WhiteBoxTestDatabaseProfiles(unittest.TestCase):
+    """Тесты профилей производительности SQLite (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_profiles.db')
+        self._cleanup()
+    
+    def tearDown(self):
+        os.environ.pop(PROFILE_ENV, None)
+        self._cleanup()
+    
+    def _cleanup(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.test_db + suffix):
+                os.remove(self.test_db + suffix)
+    
+    def test_profile_applied_on_connect(self):
+        """Настройки профиля применяются к каждому новому соединению"""
+        pool = ConnectionPool(self.test_db, profile=resolve_profile({'profile': 'multi-desk-wal'}))
+        conn = pool.acquire()
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(conn.execute('PRAGMA synchronous').fetchone()[0], 1)
+        self.assertEqual(conn.execute('PRAGMA cache_size').fetchone()[0], -32000)
+        self.assertEqual(conn.execute('PRAGMA temp_store').fetchone()[0], 2)
+        conn.close()
+        pool.close_all()
+    
+    def test_env_overrides_config(self):
+        """Переменная окружения имеет приоритет над файлом конфигурации"""
+        os.environ[PROFILE_ENV] = 'bulk-import'
+        profile = resolve_profile({'profile': 'desktop-safe'})
+        self.assertEqual(profile['name'], 'bulk-import')
+        self.assertEqual(profile['synchronous'], PROFILES['bulk-import']['synchronous'])
+    
+    def test_unknown_profile_and_overrides(self):
+        """Неизвестный профиль заменяется профилем по умолчанию, переопределения проверяются"""
+        profile = resolve_profile({'profile': 'turbo', 'pragmas': {'cache_size': -64000}})
+        self.assertEqual(profile['name'], 'desktop-safe')
+        self.assertEqual(profile['cache_size'], -64000)
+        profile = resolve_profile({'pragmas': {'journal_mode': 'WAL; DROP TABLE students'}})
+        self.assertEqual(profile['journal_mode'], 'DELETE')
+
+
+class WhiteBoxTestAppSession(unittest.TestCase):
+    """Тесты сессии приложения (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_session.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.session = AppSession(make_test_database(self.test_db))
+    
+    def tearDown(self):
+        AppSession.set_current(None)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_models_share_database(self):
+        """Все модели и статистика сессии работают через один объект Database"""
+        models = [self.session.students, self.session.commandants, self.session.buildings,
+                  self.session.rooms, self.session.checkins, self.session.checkouts]
+        for model in models:
+            self.assertIs(model.db, self.session.db)
+        self.assertIs(self.session.statistics.room_model, self.session.rooms)
+        self.assertIs(self.session.pool, self.session.db.pool)
+    
+    def test_current_session(self):
+        """Текущая сессия одна на приложение"""
+        AppSession.set_current(self.session)
+        self.assertIs(AppSession.current(), self.session)
+    
+    def test_setup_logger_idempotent(self):
+        """Повторная настройка логгера не добавляет обработчики"""
+        logger = setup_logger('test_session_logger')
+        handlers = len(logger.handlers)
+        setup_logger('test_session_logger')
+        self.assertEqual(len(logger.handlers), handlers)
+
+
+class WhiteBoxTestDatabaseWriter(unittest.TestCase):
+    """Тесты потока записи (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_writer.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.pool = ConnectionPool(self.test_db, profile=resolve_profile({'pragmas': {'busy_timeout': 20}}))
+        conn = self.pool.acquire()
+        conn.execute('CREATE TABLE t (x INTEGER UNIQUE)')
+        conn.commit()
+        conn.close()
+        self.writer = DatabaseWriter(self.pool, group_window=0.05, retry_delay=0.02)
+    
+    def tearDown(self):
+        self.writer.stop()
+        self.pool.close_all()
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def _count(self):
+        conn = self.pool.acquire()
+        count = conn.execute('SELECT COUNT(*) FROM t').fetchone()[0]
+        conn.close()
+        return count
+    
+    def test_group_commit(self):
+        """Близкие по времени операции фиксируются одной транзакцией"""
+        futures = [self.writer.execute('INSERT INTO t VALUES (?)', (i,)) for i in range(50)]
+        ids = [future.result(timeout=5) for future in futures]
+        self.assertEqual(len(set(ids)), 50)
+        self.assertEqual(self._count(), 50)
+        stats = self.writer.stats()
+        self.assertEqual(stats['operations'], 50)
+        self.assertLess(stats['batches'], 50)
+    
+    def test_failed_operation_isolated(self):
+        """Ошибка одной операции не отменяет остальные операции группы"""
+        first = self.writer.execute('INSERT INTO t VALUES (1)')
+        duplicate = self.writer.execute('INSERT INTO t VALUES (1)')
+        last = self.writer.execute('INSERT INTO t VALUES (2)')
+        first.result(timeout=5)
+        last.result(timeout=5)
+        with self.assertRaises(sqlite3.IntegrityError):
+            duplicate.result(timeout=5)
+        self.assertEqual(self._count(), 2)
+    
+    def test_busy_retry(self):
+        """Запись повторяется, пока другое соединение держит блокировку"""
+        other = sqlite3.connect(self.test_db, isolation_level=None, check_same_thread=False)
+        other.execute('BEGIN IMMEDIATE')
+        releaser = threading.Timer(0.2, lambda: other.execute('COMMIT'))
+        releaser.start()
+        future = self.writer.execute('INSERT INTO t VALUES (7)')
+        future.result(timeout=10)
+        releaser.join()
+        other.close()
+        self.assertEqual(self._count(), 1)
+        self.assertGreaterEqual(self.writer.stats()['retries'], 1)
+
+
+class WhiteBoxTestManagerWrites(unittest.TestCase):
+    """Записи через DatabaseManager идут через поток записи (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_manager_writes.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.db = make_test_database(self.test_db)
+        self.manager = DatabaseManager()
+        # Менеджер - одиночка с основной БД; на время теста он работает с тестовым файлом
+        self.saved_name = self.manager.db_name
+        self.manager.db_name = self.test_db
+    
+    def tearDown(self):
+        self.manager.db_name = self.saved_name
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_read_only_detection(self):
+        """Чтения выполняются на соединении пула, остальные команды - потоком записи"""
+        self.assertTrue(is_read_only('  select 1'))
+        self.assertTrue(is_read_only('PRAGMA user_version'))
+        self.assertTrue(is_read_only('WITH x AS (SELECT 1) SELECT * FROM x'))
+        self.assertFalse(is_read_only('PRAGMA user_version = 3'))
+        self.assertFalse(is_read_only('WITH x AS (SELECT 1) DELETE FROM buildings'))
+        self.assertFalse(is_read_only('INSERT INTO buildings VALUES (1)'))
+    
+    def test_execute_writes_through_writer(self):
+        """execute и execute_many с командами записи выполняет поток записи"""
+        writer = self.manager.get_writer(self.test_db)
+        before = writer.stats()['operations']
+        building_id = self.manager.execute(
+            'INSERT INTO buildings (building_number, address, floors_count) VALUES (?, ?, ?)',
+            ('1', 'ул. Тестовая, 1', 5)
+        )
+        rows = self.manager.execute_many(
+            'INSERT INTO rooms (building_id, floor, room_number, capacity) VALUES (?, ?, ?, ?)',
+            [(building_id, 1, str(number), 2) for number in range(1, 4)]
+        )
+        self.assertEqual(rows, 3)
+        self.assertEqual(writer.stats()['operations'], before + 2)
+        count = self.manager.execute('SELECT COUNT(*) FROM rooms', fetch_one=True)[0]
+        self.assertEqual(count, 3)
+        with self.assertRaises(DatabaseException):
+            self.manager.execute('INSERT INTO rooms (building_id, floor, room_number, capacity) '
+                                 'VALUES (?, 1, ?, 2)', (building_id, '1'))
+    
+    def test_write_timeout(self):
+        """Если поток записи не ответил вовремя - DatabaseException, ожидающая операция отменяется"""
+        started = threading.Event()
+        release = threading.Event()
+        
+        def block(conn):
+            started.set()
+            release.wait(5)
+        
+        blocker = self.db.submit_write(block, ())
+        started.wait(5)
+        try:
+            ran = []
+            with self.assertRaises(DatabaseException):
+                self.db.write(lambda conn: ran.append(True), (), timeout=0.1)
+        finally:
+            release.set()
+        blocker.result(timeout=5)
+        self.db.write(lambda conn: None, ())
+        self.assertEqual(ran, [])
+
+
+class _DeskDatabase(Database):
+    """Отдельный пост: собственные пул и поток записи на общем файле БД"""
+    
+    def __init__(self, db_name):
+        self.db_path = Path(db_name)
+        self.db_name = str(db_name)
+        self._pool = ConnectionPool(self.db_name)
+        self._writer = DatabaseWriter(self._pool)
+    
+    @property
+    def pool(self):
+        return self._pool
+    
+    @property
+    def writer(self):
+        return self._writer
+
+
+class WhiteBoxTestCheckinConcurrency(unittest.TestCase):
+    """Параллельные заселения не переполняют комнату (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_concurrency.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        db = make_test_database(self.test_db)
+        students = StudentModel(db)
+        self.student_ids = [
+            students.create('Иванов', 'Иван', None, 'М', f'+7900123{i:04d}', None, 'ИВТ-21')
+            for i in range(24)
+        ]
+        self.commandant_id = CommandantModel(db).create('Петров', 'Петр', None, '+79001234568')
+        building_id = BuildingModel(db).create('1', 'ул. Ленина, 1', 5)
+        self.room_id = RoomModel(db).create(building_id, 1, '101', 3)
+        self.desks = []
+    
+    def tearDown(self):
+        for desk in self.desks:
+            desk.writer.stop()
+            desk.pool.close_all()
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def _run_parallel(self, models):
+        """Заселить всех студентов в одну комнату из нескольких потоков"""
+        results = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(self.student_ids))
+        
+        def worker(model, student_id):
+            barrier.wait()
+            try:
+                model.create(student_id, self.commandant_id, self.room_id, '2024-09-01')
+                outcome = 'ok'
+            except ValueError:
+                outcome = 'full'
+            with lock:
+                results.append(outcome)
+        
+        threads = [
+            threading.Thread(target=worker, args=(models[i % len(models)], student_id))
+            for i, student_id in enumerate(self.student_ids)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        return results
+    
+    def _occupancy(self):
+        conn = sqlite3.connect(self.test_db)
+        count = conn.execute('SELECT COUNT(*) FROM checkins WHERE room_id = ?', (self.room_id,)).fetchone()[0]
+        conn.close()
+        return count
+    
+    def test_parallel_checkins_single_desk(self):
+        """Потоки одного поста: заселено ровно столько, сколько мест"""
+        results = self._run_parallel([CheckinModel(make_test_database(self.test_db))])
+        self.assertEqual(results.count('ok'), 3)
+        self.assertEqual(results.count('full'), len(self.student_ids) - 3)
+        self.assertEqual(self._occupancy(), 3)
+    
+    def test_parallel_checkins_many_desks(self):
+        """Несколько постов со своими соединениями: комната не переполняется"""
+        self.desks = [_DeskDatabase(self.test_db) for _ in range(4)]
+        shared = DatabaseManager().get_writer(self.test_db)
+        shared_operations = shared.stats()['operations']
+        results = self._run_parallel([CheckinModel(desk) for desk in self.desks])
+        self.assertEqual(results.count('ok'), 3)
+        self.assertEqual(len(results), len(self.student_ids))
+        self.assertEqual(self._occupancy(), 3)
+        # Заселения выполнили потоки записи постов, соревнуясь за BEGIN IMMEDIATE,
+        # а не общий поток записи файла
+        for desk in self.desks:
+            self.assertGreaterEqual(desk.writer.stats()['operations'], 1)
+        self.assertEqual(shared.stats()['operations'], shared_operations)
+
+
+class WhiteBoxTestPagination(unittest.TestCase):
+    """Постраничная и потоковая выборка (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_pagination.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.db = make_test_database(self.test_db)
+        self.students = StudentModel(self.db)
+        self.checkins = CheckinModel(self.db)
+        commandant_id = CommandantModel(self.db).create('Петров', 'Петр', None, '+79001234568')
+        building_id = BuildingModel(self.db).create('1', 'ул. Ленина, 1', 5)
+        room_id = RoomModel(self.db).create(building_id, 1, '101', 10)
+        surnames = ['Сидоров', 'Иванов', 'Петров', 'Иванов', 'Алексеев', 'Иванов', 'Борисов']
+        for i, surname in enumerate(surnames):
+            student_id = self.students.create(surname, 'Иван', None, 'М', f'+7900123{i:04d}', None, 'ИВТ-21')
+            # Несколько заселений с одной датой: порядок внутри даты задает id
+            self.checkins.create(student_id, commandant_id, room_id, f'2024-01-0{i % 3 + 1}')
+    
+    def tearDown(self):
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def _all_pages(self, model, limit):
+        rows, token, pages = [], None, 0
+        while True:
+            page = model.page(token, limit)
+            rows.extend(page.rows)
+            pages += 1
+            if not page.has_more:
+                return rows, pages
+            token = page.next_token
+    
+    def test_pages_follow_ordering(self):
+        """Страницы без пропусков и повторов повторяют порядок get_all"""
+        rows, pages = self._all_pages(self.checkins, 3)
+        self.assertEqual(pages, 3)
+        expected = sorted(self.checkins.get_all(), key=lambda c: (c[4], c[0]), reverse=True)
+        self.assertEqual([tuple(row) for row in rows], [tuple(row) for row in expected])
+        
+        rows, _ = self._all_pages(self.students, 2)
+        self.assertEqual([row[1] for row in rows], [row[1] for row in self.students.get_all()])
+        self.assertEqual(len({row[0] for row in rows}), 7)
+    
+    def test_rows_without_day_not_lost(self):
+        """Строки с непонятной датой (checkin_day IS NULL) идут последними и не выпадают из страниц"""
+        room_id = self.checkins.get_all()[0].room_id
+        ids = []
+        for i in range(3):
+            student_id = self.students.create('Старов', 'Иван', None, 'М', f'+7900999{i:04d}', None, 'ИВТ-21')
+            ids.append(self.db.execute_write(
+                'INSERT INTO checkins (student_id, commandant_id, room_id, checkin_date) '
+                'SELECT ?, commandant_id, ?, ? FROM checkins LIMIT 1',
+                (student_id, room_id, f'0{i + 1}.02.2020')
+            ))
+        rows, _ = self._all_pages(self.checkins, 2)
+        self.assertEqual(len(rows), 10)
+        self.assertEqual([row.id for row in rows[-3:]], sorted(ids, reverse=True))
+        self.assertEqual([row.id for row in rows], [row.id for row in self.checkins.get_all()])
+        conn = self.db.get_connection()
+        try:
+            ordering = CheckinModel.PAGE_ORDERS['date']
+            plan = ' | '.join(row[-1] for row in conn.execute(
+                f'EXPLAIN QUERY PLAN SELECT c.id FROM checkins c WHERE {ordering.seek()} '
+                f'ORDER BY {ordering.order_by()} LIMIT 10', (0, 0, 0)
+            ))
+        finally:
+            conn.close()
+        self.assertIn('idx_checkins_day_key', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+    
+    def test_invalid_token(self):
+        """Чужой или поврежденный токен отклоняется"""
+        token = self.students.page(limit=2).next_token
+        with self.assertRaises(ValueError):
+            self.checkins.page(token)
+        with self.assertRaises(ValueError):
+            self.students.page('не токен')
+        with self.assertRaises(ValueError):
+            self.students.page(order='group')
+    
+    def test_iter_all_matches_get_all(self):
+        """Потоковое чтение возвращает те же строки, что get_all"""
+        self.assertEqual(list(self.checkins.iter_all(batch_size=2)), self.checkins.get_all())
+        self.assertEqual(list(self.students.iter_all(batch_size=3)), self.students.get_all())
+    
+    def test_iter_stopped_early_releases_connection(self):
+        """Досрочно закрытый генератор возвращает соединение в пул"""
+        in_use = self.db.pool.stats()['in_use']
+        rows = self.checkins.iter_all(batch_size=2)
+        next(rows)
+        self.assertEqual(self.db.pool.stats()['in_use'], in_use + 1)
+        rows.close()
+        self.assertEqual(self.db.pool.stats()['in_use'], in_use)
+    
+    def test_rows_are_records(self):
+        """Строки - записи с доступом по имени и размером кортежа"""
+        from app.core.records import StudentRecord, CheckinListRecord
+        
+        student = self.students.get_all()[0]
+        self.assertIsInstance(student, StudentRecord)
+        self.assertEqual(student.surname, student[1])
+        self.assertEqual(sys.getsizeof(student), sys.getsizeof(tuple(student)))
+        _, surname, *_ = student
+        self.assertEqual(surname, student.surname)
+        
+        checkin = self.checkins.page(limit=1).rows[0]
+        self.assertIsInstance(checkin, CheckinListRecord)
+        self.assertEqual(checkin.student_name.split()[1], 'Иван')
+
+
+class WhiteBoxTestIdentityMap(unittest.TestCase):
+    """Карта идентичности и get_many (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_identity.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.db = make_test_database(self.test_db)
+        self.students = StudentModel(self.db)
+        self.student_ids = [
+            self.students.create('Иванов', 'Иван', None, 'М', f'+7900123{i:04d}', None, 'ИВТ-21')
+            for i in range(5)
+        ]
+    
+    def tearDown(self):
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_get_many_chunked(self):
+        """get_many читает записи пачками и пропускает отсутствующие id"""
+        from app.core import identity_map
+        
+        records = identity_map.fetch_many(
+            self.db, 'SELECT * FROM students WHERE id IN ({ids})', self.student_ids + [999], chunk_size=2
+        )
+        self.assertEqual(sorted(records), self.student_ids)
+        many = self.students.get_many(reversed(self.student_ids + [999]))
+        self.assertEqual(list(many), list(reversed(self.student_ids)))
+        self.assertEqual(many[self.student_ids[0]].surname, 'Иванов')
+    
+    def test_repeated_lookups_hit_memory(self):
+        """Повторные чтения в одной операции не обращаются к БД, запись сбрасывает карту"""
+        from app.core.identity_map import unit_of_work
+        
+        with unit_of_work() as unit:
+            self.students.get_many(self.student_ids[:3])
+            checkouts = self.db.pool.stats()['checkouts']
+            for student_id in self.student_ids[:3]:
+                self.assertIsNotNone(self.students.get_by_id(student_id))
+            self.assertIsNone(self.students.get_by_id(999))
+            self.students.get_by_id(999)
+            self.assertEqual(self.db.pool.stats()['checkouts'], checkouts + 1)
+            self.assertEqual(unit.hits, 4)
+            
+            self.students.update(
+                self.student_ids[0], 'Петров', 'Иван', None, 'М', '+79001230000', None, 'ИВТ-21'
+            )
+            self.assertEqual(self.students.get_by_id(self.student_ids[0]).surname, 'Петров')
+
+
+class WhiteBoxTestQueryBuilder(unittest.TestCase):
+    """Построитель запросов BaseModel (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_query_builder.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.db = make_test_database(self.test_db)
+        self.students = StudentModel(self.db)
+        for surname, name in [('Петров', 'Иван'), ('Иванов', 'Петр'), ('Иванов', 'Алексей')]:
+            self.students.create(surname, name, None, 'М', '+79001234567', None, 'ИВТ-21')
+        self.model = BaseModel('students', self.db)
+    
+    def tearDown(self):
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_order_and_filters_whitelisted(self):
+        """Порядок и условия принимают только колонки таблицы"""
+        rows = self.model.get_all('surname, -name')
+        self.assertEqual([(row.surname, row.name) for row in rows],
+                         [('Иванов', 'Петр'), ('Иванов', 'Алексей'), ('Петров', 'Иван')])
+        self.assertEqual(self.model.count({'surname': 'Иванов'}), 2)
+        self.assertEqual(self.model.count({'patronymic': None}), 3)
+        self.assertTrue(self.model.exists({'name': 'Иван'}))
+        self.assertFalse(self.model.exists({'name': 'Сергей'}))
+        with self.assertRaises(ValueError):
+            self.model.get_all('surname; DROP TABLE students')
+        with self.assertRaises(ValueError):
+            self.model.count({'1=1 OR id': 1})
+    
+    def test_legacy_where_clause(self):
+        """count()/exists() по-прежнему принимают текст условия WHERE и параметры"""
+        self.assertEqual(self.model.count('surname = ?', ('Иванов',)), 2)
+        self.assertEqual(self.model.count(), 3)
+        self.assertTrue(self.model.exists('name = ? AND surname = ?', ('Петр', 'Иванов')))
+        self.assertFalse(self.model.exists('name = ?', ('Сергей',)))
+        with self.assertRaises(ValueError):
+            self.model.count({'surname': 'Иванов'}, ('Иванов',))
+    
+    def test_query_text_built_once(self):
+        """Одинаковая форма запроса дает тот же текст SQL из кэша построителя"""
+        builder = self.model.query
+        first = builder.select(builder.where_shape({'surname': 'А'})[0], builder.order_terms('name'))
+        shapes = builder.cached_queries()
+        second = builder.select(builder.where_shape({'surname': 'Б'})[0], builder.order_terms(['name ASC']))
+        self.assertIs(first, second)
+        self.assertEqual(builder.cached_queries(), shapes)
+        self.assertEqual(self.db.pool.statement_cache_size, STATEMENT_CACHE_SIZE)
+
+
+class WhiteBoxTestSearch(unittest.TestCase):
+    """Полнотекстовый поиск (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_search.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.db = make_test_database(self.test_db)
+        self.students = StudentModel(self.db)
+        self.ivanov = self.students.create('Иванов', 'Иван', None, 'М', '+79001234567', None, 'ИВТ-21')
+        self.petrova = self.students.create('Петрова', 'Анна', 'Ивановна', 'Ж', '+79001234568', None, 'ПМ-22')
+        self.buildings = BuildingModel(self.db)
+        self.buildings.create('1', 'ул. Ленина, 1', 5)
+        self.buildings.create('2', 'пр. Мира, 10', 9)
+    
+    def tearDown(self):
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_prefix_search_ranked(self):
+        """Поиск по началу слов без учета регистра, операторы FTS5 во вводе не работают"""
+        self.assertEqual([s.id for s in self.students.search('иван')], [self.ivanov, self.petrova])
+        self.assertEqual([s.id for s in self.students.search('пет ПМ')], [self.petrova])
+        self.assertEqual(self.students.search('ванов'), [])
+        self.assertEqual(self.students.search('" OR *'), [])
+        self.assertEqual(self.students.search('Иван NOT Анна'), [])
+    
+    def test_index_follows_changes(self):
+        """Триггеры обновляют индекс при изменении и удалении строк"""
+        self.students.update(self.ivanov, 'Сидоров', 'Иван', None, 'М', '+79001234567', None, 'ИВТ-21')
+        self.assertEqual([s.id for s in self.students.search('сидор')], [self.ivanov])
+        self.assertEqual([s.id for s in self.students.search('иванов')], [self.petrova])
+        self.students.delete(self.petrova)
+        self.assertEqual(self.students.search('петрова'), [])
+    
+    def test_search_limit(self):
+        """Поиск ограничен SEARCH_LIMIT; limit=None (фильтр таблицы в окне) возвращает все совпадения"""
+        total = SEARCH_LIMIT + 50
+        self.db.write(lambda conn: conn.executemany(
+            'INSERT INTO students (surname, name, gender, phone, group_number) VALUES (?, ?, ?, ?, ?)',
+            [('Смирнов', 'Иван', 'М', f'+7901{i:07d}', 'ИВТ-21') for i in range(total)]
+        ), ('students',))
+        self.assertEqual(len(self.students.search('смирнов')), SEARCH_LIMIT)
+        found = self.students.search('смирнов', limit=None)
+        self.assertEqual(len(found), total)
+        self.assertEqual(len({s.id for s in found}), total)
+    
+    def test_building_address_filter(self):
+        """Фильтр адреса корпусов использует полнотекстовый индекс"""
+        self.assertEqual([b.building_number for b in self.buildings.get_all('мир')], ['2'])
+        self.assertEqual([b.building_number for b in self.buildings.page(address_filter='ленина')], ['1'])
+        self.assertEqual(len(self.buildings.get_all()), 2)
+
+
+class WhiteBoxTestUnicodeFolding(unittest.TestCase):
+    """Функции ufold() и normalize_phone() (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_unicode.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.db = make_test_database(self.test_db)
+        self.students = StudentModel(self.db)
+    
+    def tearDown(self):
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_sql_functions(self):
+        """Функции доступны в SQL на соединениях пула"""
+        conn = self.db.get_connection()
+        try:
+            self.assertEqual(conn.execute("SELECT ufold('ЁЛКИН')").fetchone()[0], 'елкин')
+            self.assertEqual(conn.execute("SELECT normalize_phone('8 (900) 123-45-67')").fetchone()[0],
+                             '79001234567')
+            self.assertEqual(conn.execute("SELECT ufold('Иванов') = ufold('иванов')").fetchone()[0], 1)
+        finally:
+            conn.close()
+    
+    def test_order_and_phone_lookup_use_indexes(self):
+        """Порядок ФИО без учета регистра и поиск по телефону в любом формате"""
+        ids = [
+            self.students.create(surname, 'Иван', None, 'М', phone, None, 'ИВТ-21')
+            for surname, phone in [('борисов', '+7 900 000-00-01'), ('Алексеев', '89000000002'),
+                                   ('Ёлкин', '+79000000003')]
+        ]
+        self.assertEqual([s.surname for s in self.students.get_all()], ['Алексеев', 'борисов', 'Ёлкин'])
+        second = self.students.page(limit=1, after_key=self.students.page(limit=1).next_token)
+        self.assertEqual([s.surname for s in second], ['борисов'])
+        self.assertEqual([s.id for s in self.students.find_by_phone('8-900-000-00-01')], [ids[0]])
+        conn = self.db.get_connection()
+        try:
+            plan = conn.execute(
+                'EXPLAIN QUERY PLAN SELECT * FROM students WHERE normalize_phone(phone) = ?', ('7',)
+            ).fetchall()
+        finally:
+            conn.close()
+        self.assertIn('idx_students_phone', plan[0][-1])
+    
+    def test_building_number_unique_ignoring_case(self):
+        """Номер корпуса уникален без учета регистра"""
+        buildings = BuildingModel(self.db)
+        buildings.create('1А', 'ул. Ленина, 1', 5)
+        with self.assertRaises(ValueError):
+            buildings.create('1а', 'ул. Ленина, 3', 5)
+        renamed = buildings.create('2', 'ул. Ленина, 5', 5)
+        for number in ('1А', '1а'):
+            with self.assertRaises(ValueError):
+                buildings.update(renamed, number, 'ул. Ленина, 5', 5)
+        self.assertEqual(buildings.get_by_id(renamed).building_number, '2')
+    
+    def test_building_rename_to_existing_number_ignoring_yo(self):
+        """Переименование корпуса в номер, отличающийся только буквой «ё», отклоняется"""
+        buildings = BuildingModel(self.db)
+        buildings.create('Ёлочный', 'ул. Ленина, 1', 5)
+        other = buildings.create('Сосновый', 'ул. Ленина, 3', 5)
+        with self.assertRaises(ValueError):
+            buildings.update(other, 'елочный', 'ул. Ленина, 3', 5)
+
+
+class WhiteBoxTestDateRanges(unittest.TestCase):
+    """Номера дней и выборки за период (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_dates.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.db = make_test_database(self.test_db)
+        self.checkins = CheckinModel(self.db)
+        self.checkouts = CheckoutModel(self.db)
+        self.commandant_id = CommandantModel(self.db).create('Петров', 'Петр', None, '+79001234568')
+        building_id = BuildingModel(self.db).create('1', 'ул. Ленина, 1', 5)
+        self.room_id = RoomModel(self.db).create(building_id, 1, '101', 10)
+        students = StudentModel(self.db)
+        self.checkin_ids = []
+        for i, day in enumerate(['2024-01-30', '2024-02-01', '2024-02-05', '2024-03-01']):
+            student_id = students.create('Иванов', 'Иван', None, 'М', f'+7900123{i:04d}', None, 'ИВТ-21')
+            self.checkin_ids.append(self.checkins.create(student_id, self.commandant_id, self.room_id, day))
+    
+    def tearDown(self):
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_day_numbers(self):
+        """Номер дня в БД совпадает с вычисленным в Python"""
+        from datetime import date
+        from app.core.dates import from_day, to_day
+        
+        checkin = self.checkins.get_many([self.checkin_ids[0]])[self.checkin_ids[0]]
+        self.assertEqual(checkin.checkin_day, to_day('2024-01-30'))
+        self.assertEqual(from_day(checkin.checkin_day), date(2024, 1, 30))
+        self.assertEqual(to_day(date(1970, 1, 2)), 1)
+        with self.assertRaises(ValueError):
+            self.checkins.create(1, self.commandant_id, self.room_id, '30.01.2024')
+    
+    def test_between_uses_index(self):
+        """Выборка за период включает границы и ищет по индексу номеров дней"""
+        from datetime import date
+        
+        february = self.checkins.between('2024-02-01', date(2024, 2, 29))
+        self.assertEqual([c.id for c in february], [self.checkin_ids[2], self.checkin_ids[1]])
+        self.checkouts.create(self.checkin_ids[0], self.commandant_id, date(2024, 2, 10))
+        self.assertEqual([c.checkin_id for c in self.checkouts.between('2024-02-10', '2024-02-10')],
+                         [self.checkin_ids[0]])
+        with self.assertRaises(ValueError):
+            self.checkins.between('2024-03-01', '2024-02-01')
+        
+        conn = self.db.get_connection()
+        try:
+            plan = conn.execute(
+                'EXPLAIN QUERY PLAN SELECT id FROM checkins WHERE checkin_day BETWEEN ? AND ?', (0, 1)
+            ).fetchall()
+        finally:
+            conn.close()
+        self.assertIn('idx_checkins_day', plan[0][-1])
+
+
+class WhiteBoxTestIndexAdvisor(unittest.TestCase):
+    """Журнал запросов и советник по индексам (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_advisor.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        make_test_database(self.test_db)
+        self.log = QueryLog()
+        self.pool = ConnectionPool(self.test_db, query_log=self.log)
+    
+    def tearDown(self):
+        self.pool.close_all()
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_log_groups_query_shapes(self):
+        """Запросы с разными значениями попадают в журнал одной формой"""
+        with self.pool.connection() as conn:
+            for student_id in (1, 2):
+                conn.execute('SELECT * FROM students WHERE id = ?', (student_id,)).fetchall()
+            conn.execute("SELECT * FROM students WHERE id IN (1, 2, 3) AND email = 'a@b.ru'").fetchall()
+        self.assertEqual(dict(self.log.statements()), {
+            'SELECT * FROM students WHERE id = ?': 2,
+            'SELECT * FROM students WHERE id IN (?) AND email = ?': 1,
+        })
+    
+    def test_advisor_reports_scans_and_sorts(self):
+        """Советник находит полный просмотр и сортировку и проверяет предложенный индекс"""
+        from app.core.index_advisor import analyze
+        
+        statements = [
+            ('SELECT * FROM students WHERE email = ?', 5),
+            ('SELECT * FROM checkins c WHERE c.student_id = ? ORDER BY c.room_id', 3),
+            ('SELECT * FROM students WHERE id = ?', 10),
+            ('SELECT COUNT(*) FROM room_occupancy WHERE occupancy > 0', 1),
+        ]
+        with self.pool.connection() as conn:
+            findings = analyze(conn, statements)
+        self.assertEqual([(f.problem, f.table, f.index) for f in findings], [
+            ('scan', 'students', 'CREATE INDEX idx_students_email ON students(email)'),
+            ('sort', 'checkins', 'CREATE INDEX idx_checkins_student_id_room_id ON checkins(student_id, room_id)'),
+        ])
+
+
+class WhiteBoxTestNaturalSort(unittest.TestCase):
+    """Естественный порядок номеров корпусов и комнат (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_natural.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.db = make_test_database(self.test_db)
+        self.buildings = BuildingModel(self.db)
+        self.rooms = RoomModel(self.db)
+    
+    def tearDown(self):
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_natural_key(self):
+        """Числа сравниваются по значению, буквы после числа - без учета регистра"""
+        from app.core.sql_functions import natural_key
+        
+        numbers = ['10', '2б', '9', '2', '2А', '101', '007']
+        self.assertEqual(sorted(numbers, key=natural_key), ['2', '2А', '2б', '007', '9', '10', '101'])
+        self.assertIsNone(natural_key(None))
+    
+    def test_models_order_by_key(self):
+        """Ключ заполняется триггерами при вставке и изменении номера"""
+        ids = {number: self.buildings.create(number, 'ул. Ленина, 1', 5) for number in ('10', '9', '2а', '2')}
+        self.assertEqual([b.building_number for b in self.buildings.get_all()], ['2', '2а', '9', '10'])
+        
+        building_id = ids['2']
+        for number in ('110', '12', '9', '100'):
+            self.rooms.create(building_id, 1, number, 2)
+        self.assertEqual([r.room_number for r in self.rooms.get_all()], ['9', '12', '100', '110'])
+        
+        self.buildings.update(ids['10'], '1', 'ул. Ленина, 1', 5)
+        self.assertEqual([b.building_number for b in self.buildings.page().rows], ['1', '2', '2а', '9'])
+    
+    def test_order_uses_index(self):
+        """Сортировка по ключам идет по индексам, без временного B-дерева"""
+        conn = self.db.get_connection()
+        try:
+            for query in ('SELECT * FROM buildings ORDER BY number_key, id',
+                          'SELECT r.* FROM rooms r JOIN buildings b ON r.building_id = b.id '
+                          'ORDER BY b.number_key, b.id, r.floor, r.number_key, r.id'):
+                plan = ' | '.join(row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}'))
+                self.assertNotIn('TEMP B-TREE', plan)
+        finally:
+            conn.close()
+
+
+class WhiteBoxTestAsOf(unittest.TestCase):
+    """Проживавшие на дату по индексу интервалов (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_as_of.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.db = make_test_database(self.test_db)
+        self.checkins = CheckinModel(self.db)
+        self.checkouts = CheckoutModel(self.db)
+        self.commandant_id = CommandantModel(self.db).create('Петров', 'Петр', None, '+79001234568')
+        self.building_id = BuildingModel(self.db).create('1', 'ул. Ленина, 1', 5)
+        rooms = RoomModel(self.db)
+        self.room_ids = [rooms.create(self.building_id, floor, number, 2)
+                         for floor, number in ((1, '101'), (2, '201'))]
+        students = StudentModel(self.db)
+        self.student_ids = [
+            students.create(surname, 'Иван', None, 'М', f'+7900123{i:04d}', None, 'ИВТ-21')
+            for i, surname in enumerate(['Борисов', 'Андреев', 'Васильев'])
+        ]
+    
+    def tearDown(self):
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def test_as_of_intervals(self):
+        """Дни заселения и выселения входят в проживание, открытое проживание длится до сих пор"""
+        first = self.checkins.create(self.student_ids[0], self.commandant_id, self.room_ids[0], '2024-01-10')
+        self.checkouts.create(first, self.commandant_id, '2024-02-10')
+        self.checkins.create(self.student_ids[1], self.commandant_id, self.room_ids[0], '2024-02-10')
+        self.checkins.create(self.student_ids[2], self.commandant_id, self.room_ids[1], '2024-03-01')
+        
+        def names(day, **filters):
+            return [row.student_name.split()[0] for row in self.checkins.as_of(day, **filters)]
+        
+        self.assertEqual(names('2024-01-09'), [])
+        self.assertEqual(names('2024-01-10'), ['Борисов'])
+        self.assertEqual(names('2024-02-10'), ['Андреев', 'Борисов'])
+        self.assertEqual(names('2024-02-11'), ['Андреев'])
+        self.assertEqual(names('2030-01-01'), ['Андреев', 'Васильев'])
+        self.assertEqual(names('2024-03-01', room_id=self.room_ids[1]), ['Васильев'])
+        self.assertEqual(names('2024-03-01', building_id=self.building_id, floor=1), ['Андреев'])
+        with self.assertRaises(ValueError):
+            self.checkins.as_of('2024-03-01', floor=1)
+    
+    def test_interval_index_follows_writes(self):
+        """Индекс интервалов поддерживается триггерами при выселении и его отмене"""
+        checkin_id = self.checkins.create(self.student_ids[0], self.commandant_id, self.room_ids[0], '2024-01-10')
+        self.checkouts.create(checkin_id, self.commandant_id, '2024-01-20')
+        self.assertEqual(self.checkins.as_of('2024-01-21'), [])
+        self.db.execute_write('DELETE FROM checkouts WHERE checkin_id = ?', (checkin_id,))
+        self.assertEqual([row.id for row in self.checkins.as_of('2024-01-21')], [checkin_id])
+        
+        conn = self.db.get_connection()
+        try:
+            plan = ' | '.join(row[-1] for row in conn.execute(
+                'EXPLAIN QUERY PLAN SELECT checkin_id FROM residency_intervals WHERE first_day <= ? AND last_day >= ?',
+                (0, 0)
+            ))
+        finally:
+            conn.close()
+        self.assertIn('VIRTUAL TABLE INDEX 2', plan)
+    
+    def test_unparsable_checkin_date_not_indexed(self):
+        """Проживание с непонятной датой заселения не попадает в выборку ни на одну дату"""
+        legacy = self.db.execute_write(
+            'INSERT INTO checkins (student_id, commandant_id, room_id, checkin_date) VALUES (?, ?, ?, ?)',
+            (self.student_ids[0], self.commandant_id, self.room_ids[0], '10.01.2024')
+        )
+        dated = self.checkins.create(self.student_ids[1], self.commandant_id, self.room_ids[0], '2024-01-10')
+        for day in ('1970-01-01', '2024-01-10', '2030-01-01'):
+            self.assertNotIn(legacy, [row.id for row in self.checkins.as_of(day)])
+        self.assertEqual([row.id for row in self.checkins.as_of('2024-01-10')], [dated])
+        
+        self.db.write(rebuild_intervals, ('residencies',))
+        self.assertEqual([row.id for row in self.checkins.as_of('2030-01-01')], [dated])
+
+
+class WhiteBoxTestCache(unittest.TestCase):
+    """Ограниченный кэш LRU с временем жизни и однократной загрузкой (белый ящик)"""
+    
+    def setUp(self):
+        from app.core.cache import LRUCache
+        
+        self.now = 0.0
+        self.cache = LRUCache(max_entries=3, max_bytes=10_000, default_ttl=60, clock=lambda: self.now)
+    
+    def test_lru_eviction_and_ttl(self):
+        """Вытесняется давно не читанная запись; истекшая запись - промах"""
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, key.upper())
+        self.assertEqual(self.cache.get('a'), 'A')
+        self.cache.set('d', 'D')
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 'A')
+        
+        self.cache.set('short', 1, ttl=5)
+        self.now = 10
+        self.assertIsNone(self.cache.get('short'))
+        self.assertEqual(self.cache.get('a'), 'A')
+        self.now = 100
+        self.assertEqual(self.cache.cleanup_expired(), 2)
+        
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['expirations']),
+                         (3, 2, 2, 3))
+        self.assertEqual((stats['entries'], stats['bytes']), (0, 0))
+    
+    def test_byte_limit(self):
+        """Записи вытесняются по оценке размера; слишком большое значение не кэшируется"""
+        self.cache.set('big', 'x' * 20_000)
+        self.assertNotIn('big', self.cache)
+        self.cache.set('a', 'x' * 4_000)
+        self.cache.set('b', 'y' * 4_000)
+        self.cache.set('c', 'z' * 4_000)
+        self.assertEqual(len(self.cache), 2)
+        self.assertNotIn('a', self.cache)
+        self.assertLessEqual(self.cache.stats()['bytes'], 10_000)
+    
+    def test_size_estimated_outside_lock(self):
+        """Размер значения оценивается до блокировки кэша и по выборке строк большого списка"""
+        from app.core.cache import estimate_size
+        
+        cache = self.cache
+        locked = []
+        
+        class Probe:
+            def __sizeof__(self):
+                locked.append(cache._lock.locked())
+                return 100
+        
+        self.cache.set('set', Probe())
+        self.cache.get_or_load('load', Probe)
+        self.assertEqual(locked, [False, False])
+        
+        rows = [(i, 'Иванов', 'Иван', None, 'М', '+79001234567', None, 'ИВТ-21') for i in range(10_000)]
+        exact = sys.getsizeof(rows) + sum(
+            sys.getsizeof(row) + sum(sys.getsizeof(field) for field in row) for row in rows
+        )
+        self.assertAlmostEqual(estimate_size(rows) / exact, 1, delta=0.05)
+    
+    def test_single_flight(self):
+        """Одновременные промахи по ключу вызывают загрузку один раз"""
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+        
+        def loader():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'value'
+        
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get_or_load('k', loader)))
+                   for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while self.cache.stats()['coalesced'] < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(self.cache.get('k'), 'value')
+    
+    def test_failed_or_invalidated_load_not_cached(self):
+        """Ошибка загрузки не кэшируется; значение, удаленное во время загрузки, не сохраняется"""
+        def failing():
+            raise ValueError('нет данных')
+        
+        with self.assertRaises(ValueError):
+            self.cache.get_or_load('k', failing)
+        self.assertNotIn('k', self.cache)
+        
+        def invalidated():
+            self.cache.delete('k')
+            return 'old'
+        
+        self.assertEqual(self.cache.get_or_load('k', invalidated), 'old')
+        self.assertNotIn('k', self.cache)
+        self.assertEqual(self.cache.get_or_load('k', lambda: 'new'), 'new')
+        self.assertEqual(self.cache.get('k'), 'new')
+
+
+class WhiteBoxTestQueryCache(unittest.TestCase):
+    """Кэш результатов запросов моделей с пометками таблиц (белый ящик)"""
+    
+    def setUp(self):
+        self.test_db = str(Path(__file__).parent.parent / 'test_query_cache.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.db = make_test_database(self.test_db)
+        self.students = StudentModel(self.db)
+        self.rooms = RoomModel(self.db)
+        self.checkins = CheckinModel(self.db)
+        self.commandant_id = CommandantModel(self.db).create('Петров', 'Петр', None, '+79001234568')
+        building_id = BuildingModel(self.db).create('1', 'ул. Ленина, 1', 5)
+        self.room_id = self.rooms.create(building_id, 1, '101', 2)
+        self.student_id = self.students.create('Иванов', 'Иван', None, 'М', '+79001234567', None, 'ИВТ-21')
+        self.loads = []
+        for model, name in ((self.students, '_load_all'), (self.rooms, '_load_all'),
+                            (self.checkins, '_load_active_checkins')):
+            self._count_loads(model, name)
+    
+    def tearDown(self):
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def _count_loads(self, model, name):
+        load = getattr(model, name)
+        
+        def counted(*args):
+            self.loads.append(f'{type(model).__name__}.{name}')
+            return load(*args)
+        setattr(model, name, counted)
+    
+    def test_repeated_reads_served_from_cache(self):
+        """Повторное чтение без изменений не выполняет запрос; копия списка не портит кэш"""
+        first = self.students.get_all()
+        first.clear()
+        self.assertEqual(len(self.students.get_all()), 1)
+        self.assertEqual(self.loads, ['StudentModel._load_all'])
+    
+    def test_write_invalidates_only_its_tables(self):
+        """Запись в таблицу сбрасывает результаты, читающие ее, и не трогает остальные"""
+        self.students.get_all()
+        self.rooms.get_all()
+        self.checkins.get_active_checkins()
+        self.loads.clear()
+        
+        self.students.create('Петров', 'Петр', None, 'М', '+79001234569', None, 'ИВТ-21')
+        self.assertEqual(len(self.students.get_all()), 2)
+        self.rooms.get_all()
+        self.assertEqual(self.loads, ['StudentModel._load_all'])
+        
+        self.loads.clear()
+        self.checkins.create(self.student_id, self.commandant_id, self.room_id, '2024-01-10')
+        self.assertEqual(len(self.checkins.get_active_checkins()), 1)
+        self.assertEqual(self.rooms.get_occupied_count(), 1)
+        self.rooms.get_all()
+        self.students.get_all()
+        self.assertEqual(self.loads, ['CheckinModel._load_active_checkins'])
+    
+    def test_other_process_write_invalidates(self):
+        """Запись другого рабочего места (другое соединение с файлом) видна через COUNTER_TTL"""
+        from app.core import query_cache
+        from app.core.sql_functions import register_functions
+        
+        now = [0.0]
+        clock = query_cache._clock
+        query_cache._clock = lambda: now[0]
+        self.addCleanup(setattr, query_cache, '_clock', clock)
+        
+        self.assertEqual(len(self.students.get_all()), 1)
+        self.assertEqual(len(self.checkins.get_active_checkins()), 0)
+        # Попадание не читает счетчики из БД
+        checkouts = self.db.pool.stats()['checkouts']
+        self.assertEqual(len(self.students.get_all()), 1)
+        self.assertEqual(self.db.pool.stats()['checkouts'], checkouts)
+        other = sqlite3.connect(self.test_db)
+        try:
+            register_functions(other)
+            other.execute('''
+                INSERT INTO students (surname, name, gender, phone, group_number)
+                VALUES ('Сидоров', 'Олег', 'М', '+79001234570', 'ПМ-22')
+            ''')
+            other.execute('''
+                INSERT INTO checkins (student_id, commandant_id, room_id, checkin_date)
+                VALUES (?, ?, ?, '2024-01-01')
+            ''', (self.student_id, self.commandant_id, self.room_id))
+            other.commit()
+        finally:
+            other.close()
+        self.assertEqual(len(self.students.get_all()), 1)
+        now[0] += query_cache.COUNTER_TTL
+        self.assertEqual(len(self.students.get_all()), 2)
+        self.assertEqual(len(self.checkins.get_active_checkins()), 1)
+        self.assertEqual(self.rooms.get_occupied_count(), 1)
+    
+    def test_write_target(self):
+        """Таблица команды записи определяется по ее тексту"""
+        from app.core.query_cache import write_target
+        
+        self.assertEqual(write_target('INSERT INTO students (name) VALUES (?)'), 'students')
+        self.assertEqual(write_target('\n  UPDATE rooms SET capacity=? WHERE id=?'), 'rooms')
+        self.assertEqual(write_target('DELETE FROM checkouts WHERE id = ?'), 'checkouts')
+        self.assertEqual(write_target('INSERT OR REPLACE INTO buildings VALUES (?)'), 'buildings')
+        self.assertIsNone(write_target('PRAGMA optimize'))
+
+
+class WhiteBoxTestSnapshot(unittest.TestCase):
+    """Снимок кэша для быстрого запуска (белый ящик)"""
+    
+    def setUp(self):
+        from app.core import snapshot
+        self.snapshot = snapshot
+        self.test_db = str(Path(__file__).parent.parent / 'test_snapshot.db')
+        self.path = snapshot.snapshot_path(self.test_db)
+        self._remove_files()
+        self.db = make_test_database(self.test_db)
+        self.rooms = RoomModel(self.db)
+        self.building_id = BuildingModel(self.db).create('1', 'ул. Ленина, 1', 5)
+        self.rooms.create(self.building_id, 1, '101', 2)
+    
+    def tearDown(self):
+        import atexit
+        atexit.unregister(self.snapshot._save_at_exit)
+        self.snapshot._snapshots.pop(self.test_db, None)
+        self._remove_files()
+    
+    def _remove_files(self):
+        for path in (self.test_db, self.path):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def _restart(self):
+        """Новый запуск: кэш запросов пуст, снимок читается с диска"""
+        from app.core import query_cache
+        
+        query_cache.invalidate(self.db.db_name)
+        self.snapshot._snapshots.pop(self.test_db, None)
+        return self.snapshot.warm_start(self.db)
+    
+    def _counters(self):
+        conn = self.db.get_connection()
+        try:
+            return self.snapshot.read_state(conn)[1]
+        finally:
+            conn.close()
+    
+    def test_change_counters(self):
+        """Триггеры увеличивают счетчик изменений таблицы при вставке, изменении и удалении"""
+        counters = [self._counters()]
+        room_id = self.rooms.create(self.building_id, 1, '102', 2)
+        counters.append(self._counters())
+        self.db.execute_write('UPDATE rooms SET capacity = 3 WHERE id = ?', (room_id,))
+        counters.append(self._counters())
+        self.db.execute_write('DELETE FROM rooms WHERE id = ?', (room_id,))
+        counters.append(self._counters())
+        for previous, current in zip(counters, counters[1:]):
+            self.assertGreater(current['rooms'], previous['rooms'])
+            self.assertEqual(current['students'], previous['students'])
+    
+    def test_round_trip(self):
+        """Сохраненные записи отдаются при следующем запуске без запроса к БД"""
+        warm = self._restart()
+        rooms = self.rooms.get_all()
+        warm.save()
+        self.assertTrue(os.path.exists(self.path))
+        
+        warm = self._restart()
+        self.rooms._load_all = lambda: self.fail('запрос к БД при действительном снимке')
+        restored = self.rooms.get_all()
+        self.assertEqual(restored, rooms)
+        self.assertEqual(restored[0].room_number, '101')
+        self.assertEqual(warm.hits, 1)
+        self.assertFalse(warm.reconcile())
+    
+    def test_stale_entry_reconciled(self):
+        """Устаревшая запись отдается сразу и перечитывается при сверке"""
+        warm = self._restart()
+        self.rooms.get_all()
+        warm.save()
+        self.rooms.create(self.building_id, 1, '102', 2)
+        
+        warm = self._restart()
+        self.assertEqual(len(self.rooms.get_all()), 1)
+        self.assertTrue(warm.reconcile())
+        self.assertEqual(len(self.rooms.get_all()), 2)
+        
+        warm = self._restart()
+        self.assertEqual(len(self.rooms.get_all()), 2)
+        self.assertFalse(warm.reconcile())
+    
+    def test_mismatched_file_ignored(self):
+        """Снимок другой версии схемы или поврежденный файл не используются"""
+        conn = self.db.get_connection()
+        try:
+            version = self.snapshot.read_state(conn)[0]
+        finally:
+            conn.close()
+        entries = {('rooms.get_all', ()): (('rooms',), (0,), [])}
+        self.snapshot.write_file(self.path, version + 1, entries)
+        self.assertEqual(self.snapshot.read_file(self.path, version), {})
+        self.assertEqual(self.snapshot.read_file(self.path, version + 1), entries)
+        with open(self.path, 'r+b') as f:
+            f.seek(-4, os.SEEK_END)
+            f.write(b'\0\0\0\0')
+        self.assertEqual(self.snapshot.read_file(self.path, version + 1), {})
+
+
+class WhiteBoxTestAvailability(unittest.TestCase):
+    """Индекс свободных мест для подбора комнат (белый ящик)"""
+    
+    def setUp(self):
+        from app.core import availability
+        self.availability = availability
+        self.test_db = str(Path(__file__).parent.parent / 'test_availability.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.db = make_test_database(self.test_db)
+        self.students = StudentModel(self.db)
+        self.rooms = RoomModel(self.db)
+        self.checkins = CheckinModel(self.db)
+        self.checkouts = CheckoutModel(self.db)
+        self.commandant_id = CommandantModel(self.db).create('Петров', 'Петр', None, '+79001234568')
+        buildings = BuildingModel(self.db)
+        self.building_a = buildings.create('1', 'ул. Ленина, 1', 5)
+        self.building_b = buildings.create('2', 'ул. Ленина, 2', 5)
+        self.room_small = self.rooms.create(self.building_a, 1, '101', 2)
+        self.room_large = self.rooms.create(self.building_a, 1, '102', 3)
+        self.room_shared = self.rooms.create(self.building_a, 2, '201', 3)
+        self.room_other = self.rooms.create(self.building_b, 1, '101', 2)
+        self.male = [self.students.create('Иванов', f'Иван{c}', None, 'М', f'+7900123450{i}', None, 'ИВТ-21')
+                     for i, c in enumerate('абвг')]
+        self.female = self.students.create('Сидорова', 'Анна', None, 'Ж', '+79001234599', None, 'ИВТ-21')
+    
+    def tearDown(self):
+        self.availability._indexes.pop(self.db.db_name, None)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def _ids(self, gender, **filters):
+        return [room.id for room in self.rooms.suggest(gender, **filters)]
+    
+    def test_best_rooms_first(self):
+        """Сначала дозаполняются комнаты того же пола, затем пустые от меньших к большим"""
+        self.checkins.create(self.male[0], self.commandant_id, self.room_shared, '2024-01-01')
+        self.assertEqual(self._ids('М'), [self.room_shared, self.room_small, self.room_other, self.room_large])
+        # В комнату со студентом другого пола студентка не подбирается
+        self.assertEqual(self._ids('Ж'), [self.room_small, self.room_other, self.room_large])
+        self.assertEqual(self._ids('М', building_id=self.building_b), [self.room_other])
+        self.assertEqual(self._ids('М', building_id=self.building_a, floor=1),
+                         [self.room_small, self.room_large])
+        self.assertEqual(len(self.rooms.suggest('М', limit=2)), 2)
+        with self.assertRaises(ValueError):
+            self.rooms.suggest('М', floor=1)
+    
+    def test_checkin_and_checkout_update_one_room(self):
+        """Заселение и выселение перекладывают комнату без перестроения индекса"""
+        index = self.availability.get(self.db)
+        first = self.checkins.create(self.male[0], self.commandant_id, self.room_small, '2024-01-01')
+        self.checkins.create(self.male[1], self.commandant_id, self.room_small, '2024-01-01')
+        self.assertNotIn(self.room_small, self._ids('М'))
+        self.assertNotIn(self.room_small, self._ids('Ж'))
+        self.checkouts.create(first, self.commandant_id, '2024-02-01')
+        self.assertEqual(self._ids('М')[0], self.room_small)
+        self.assertIs(self.availability.get(self.db), index)
+        suggested = self.rooms.suggest('М')[0]
+        self.assertEqual((suggested.occupancy, suggested.capacity), (1, 2))
+    
+    def test_structure_change_rebuilds(self):
+        """Новая комната или изменение студента перестраивает индекс"""
+        index = self.availability.get(self.db)
+        room_id = self.rooms.create(self.building_b, 2, '201', 1)
+        self.assertIsNot(self.availability.get(self.db), index)
+        self.assertIn(room_id, self._ids('Ж'))
+    
+    def test_other_process_checkin_rebuilds(self):
+        """Заселение с другого рабочего места видно в подборе без перезапуска"""
+        from app.core.sql_functions import register_functions
+        
+        index = self.availability.get(self.db)
+        other = sqlite3.connect(self.test_db)
+        try:
+            register_functions(other)
+            other.execute('''
+                INSERT INTO checkins (student_id, commandant_id, room_id, checkin_date)
+                VALUES (?, ?, ?, '2024-01-01')
+            ''', (self.female, self.commandant_id, self.room_small))
+            other.commit()
+        finally:
+            other.close()
+        self.assertNotIn(self.room_small, self._ids('М'))
+        self.assertIsNot(self.availability.get(self.db), index)
+        # Своя запись после чужой не выдает устаревший индекс за актуальный
+        index = self.availability.get(self.db)
+        self.checkins.create(self.male[0], self.commandant_id, self.room_other, '2024-01-01')
+        self.assertIs(self.availability.get(self.db), index)
+        self.assertNotIn(self.room_other, self._ids('Ж'))
+    
+    def test_matches_checkin_rules(self):
+        """Каждая подобранная комната принимает студента, остальные - нет"""
+        self.checkins.create(self.male[0], self.commandant_id, self.room_small, '2024-01-01')
+        self.checkins.create(self.female, self.commandant_id, self.room_other, '2024-01-01')
+        self.checkins.create(self.male[1], self.commandant_id, self.room_small, '2024-01-01')
+        suggested = set(self._ids('М'))
+        for room in self.rooms.get_all():
+            self.assertEqual(room.id in suggested, room.id in (self.room_large, self.room_shared))
+
+
+class WhiteBoxTestFacets(unittest.TestCase):
+    """Фасетный индекс студентов и комнат (белый ящик)"""
+    
+    def setUp(self):
+        from app.core import facets
+        self.facets = facets
+        self.test_db = str(Path(__file__).parent.parent / 'test_facets.db')
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+        self.db = make_test_database(self.test_db)
+        self.students = StudentModel(self.db)
+        self.rooms = RoomModel(self.db)
+        self.checkins = CheckinModel(self.db)
+        self.checkouts = CheckoutModel(self.db)
+        self.commandant_id = CommandantModel(self.db).create('Петров', 'Петр', None, '+79001234568')
+        self.building_id = BuildingModel(self.db).create('1', 'ул. Ленина, 1', 5)
+        self.room_id = self.rooms.create(self.building_id, 2, '201', 2)
+        self.ivanov = self.students.create('Иванов', 'Иван', None, 'М', '+79001234567', 'i@mail.ru', 'ИВТ-21')
+        self.petrova = self.students.create('Петрова', 'Анна', None, 'Ж', '+79001234569', None, 'ИВТ-21')
+        self.sidorov = self.students.create('Сидоров', 'Олег', None, 'М', '+79001234570', None, 'ПМ-22')
+    
+    def tearDown(self):
+        self.facets._indexes.pop((self.db.db_name, 'students'), None)
+        self.facets._indexes.pop((self.db.db_name, 'rooms'), None)
+        if os.path.exists(self.test_db):
+            os.remove(self.test_db)
+    
+    def _students(self, expression):
+        index = self.students.facet_index()
+        return sorted(index.keys(index.evaluate(expression)))
+    
+    def test_and_or_not(self):
+        """Условия И/ИЛИ/НЕ и выбор словарем дают те же записи, что и перебор"""
+        self.assertEqual(self._students({'gender': ['М'], 'group': ['ИВТ-21']}), [self.ivanov])
+        self.assertEqual(self._students({'group': ['ИВТ-21', 'ПМ-22'], 'has_email': [0]}),
+                         [self.petrova, self.sidorov])
+        self.assertEqual(self._students(('or', ('gender', 'Ж'), ('group', 'ПМ-22'))),
+                         [self.petrova, self.sidorov])
+        self.assertEqual(self._students(('and', ('gender', 'М'), ('not', ('has_email', 1)))), [self.sidorov])
+        self.assertEqual(self._students(('group', 'нет такой')), [])
+        with self.assertRaises(ValueError):
+            self._students(('faculty', 'ИВТ'))
+    
+    def test_counts_ignore_own_facet(self):
+        """Счетчики значения учитывают выбор в остальных признаках, но не в своем"""
+        counts = self.students.facet_index().counts({'gender': ['М']})
+        self.assertEqual(counts['gender'], {'М': 2, 'Ж': 1})
+        self.assertEqual(counts['group'], {'ИВТ-21': 1, 'ПМ-22': 1})
+        self.assertEqual(counts['has_email'], {1: 1, 0: 1})
+    
+    def test_model_writes_update_index(self):
+        """Изменение студента, заселение и выселение обновляют индекс без перестроения"""
+        index = self.students.facet_index()
+        self.students.update(self.sidorov, 'Сидоров', 'Олег', None, 'М', '+79001234570', 'o@mail.ru', 'ИВТ-21')
+        self.assertEqual(self._students({'group': ['ИВТ-21'], 'has_email': [1]}), [self.ivanov, self.sidorov])
+        checkin_id = self.checkins.create(self.ivanov, self.commandant_id, self.room_id, '2024-01-01')
+        self.assertEqual(self._students({'resident': [1], 'building': [self.building_id], 'floor': [2]}),
+                         [self.ivanov])
+        self.checkouts.create(checkin_id, self.commandant_id, '2024-02-01')
+        self.assertEqual(self._students({'resident': [1]}), [])
+        student_id = self.students.create('Кузнецов', 'Петр', None, 'М', '+79001234571', None, 'ПМ-22')
+        self.assertEqual(self._students({'group': ['ПМ-22']}), [student_id])
+        self.students.delete(student_id)
+        self.assertEqual(self._students({'group': ['ПМ-22']}), [])
+        self.assertIs(self.students.facet_index(), index)
+        self.assertEqual(len(index), 3)
+        
+        self.rooms.create(self.building_id, 3, '301', 2)
+        self.assertIsNot(self.students.facet_index(), index)
+    
+    def test_other_process_writes_rebuild(self):
+        """Записи другого рабочего места видны в индексах студентов и комнат без перезапуска"""
+        from app.core.sql_functions import register_functions
+        
+        students_index = self.students.facet_index()
+        rooms_index = self.rooms.facet_index()
+        other = sqlite3.connect(self.test_db)
+        try:
+            register_functions(other)
+            other.execute('''
+                INSERT INTO checkins (student_id, commandant_id, room_id, checkin_date)
+                VALUES (?, ?, ?, '2024-01-01')
+            ''', (self.sidorov, self.commandant_id, self.room_id))
+            other.commit()
+        finally:
+            other.close()
+        self.assertIsNot(self.students.facet_index(), students_index)
+        self.assertEqual(self._students({'resident': [1]}), [self.sidorov])
+        index = self.rooms.facet_index()
+        self.assertIsNot(index, rooms_index)
+        self.assertEqual(index.keys(index.select({'gender': ['М']})), [self.room_id])
+    
+    def test_room_facets(self):
+        """Индекс комнат перестраивается после заселения"""
+        self.rooms.create(self.building_id, 3, '301', 1)
+        index = self.rooms.facet_index()
+        self.assertEqual(index.count(index.select({'has_free': [1]})), 2)
+        self.checkins.create(self.petrova, self.commandant_id, self.room_id, '2024-01-01')
+        index = self.rooms.facet_index()
+        self.assertEqual(index.keys(index.select({'gender': ['Ж'], 'has_free': [1]})), [self.room_id])
+    
+    def test_sparse_and_dense_values(self):
+        """Редкие значения (массив позиций) и частые (битовое множество) дают одинаковый результат"""
+        import random
+        from app.core.records import record_class
+        from app.core.facets import FacetIndex
+        
+        rng = random.Random(7)
+        Row = record_class(('id', 'color', 'size'))
+        rows = [Row(i, rng.choice('abc'), rng.randint(0, 99)) for i in range(2000)]
+        index = FacetIndex.build(('color', 'size'), rows)
+        index.set(5000, Row(5000, 'a', 7))
+        index.set(3, Row(3, 'b', 7))
+        index.remove(10)
+        rows = [row for row in rows if row.id not in (3, 10)] + [Row(3, 'b', 7), Row(5000, 'a', 7)]
+        for selection in ({'size': [7]}, {'color': ['a'], 'size': [7, 8]}, {'color': ['b', 'c']}):
+            expected = sorted(row.id for row in rows
+                              if all(getattr(row, facet) in values for facet, values in selection.items()))
+            self.assertEqual(sorted(index.keys(index.select(selection))), expected)
+        counts = index.counts({'color': ['a']})
+        self.assertEqual(counts['size'][7], sum(1 for row in rows if row.color == 'a' and row.size == 7))
 
 
 if __name__ == '__main__':